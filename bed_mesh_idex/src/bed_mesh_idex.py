@@ -3,13 +3,115 @@
 # Copyright (C) 2025  Your Name <your@email.com>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-
-from configfile import ConfigurationError
+import array
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+# Names of the quad_gantry_level steppers' corners, in stepper order
+GANTRY_CORNERS = ('front_left', 'rear_left', 'rear_right', 'front_right')
+
+def _dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+# Binary mesh profile: header followed by the float32 mesh matrix, row
+# major (mesh_y_count rows of mesh_x_count values), little-endian
+BINARY_MAGIC = b'UBMI'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sHHII4f')
+BINARY_SUFFIX = '.mesh'
+
+class BinaryZMesh:
+    '''
+    Interpolated mesh matrix read straight from a memory-mapped binary
+    profile. The float32 values are not copied: calc_z reads them through
+    a memoryview of the mapping, whose pages are shared with the page cache.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mmap) < BINARY_HEADER.size:
+                raise ValueError("truncated header")
+            (magic, version, _, self.mesh_x_count, self.mesh_y_count,
+             self.mesh_x_min, self.mesh_y_min, self.mesh_x_max,
+             self.mesh_y_max) = BINARY_HEADER.unpack_from(self._mmap)
+            if magic != BINARY_MAGIC or version != BINARY_VERSION:
+                raise ValueError("not a version %d mesh profile" % (BINARY_VERSION,))
+            if self.mesh_x_count < 2 or self.mesh_y_count < 2:
+                raise ValueError("mesh must be at least 2x2")
+            size = BINARY_HEADER.size + 4 * self.mesh_x_count * self.mesh_y_count
+            if len(self._mmap) != size:
+                raise ValueError("expected %d bytes, got %d" % (size, len(self._mmap)))
+            if sys.byteorder == 'little':
+                self.matrix = memoryview(self._mmap)[BINARY_HEADER.size:].cast('f')
+            else:
+                # Big-endian hosts pay for one byte-swapped copy
+                values = array.array('f', self._mmap[BINARY_HEADER.size:])
+                values.byteswap()
+                self.matrix = memoryview(values)
+        except Exception:
+            self.close()
+            raise
+        self.mesh_x_dist = (self.mesh_x_max - self.mesh_x_min) / (self.mesh_x_count - 1)
+        self.mesh_y_dist = (self.mesh_y_max - self.mesh_y_min) / (self.mesh_y_count - 1)
+        # Same truthiness as a loaded bed_mesh ZMesh for the "mesh loaded" checks
+        self.mesh = self.matrix
+
+    def close(self):
+        matrix = getattr(self, 'matrix', None)
+        if matrix is not None:
+            self.mesh = self.matrix = None
+            matrix.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _get_linear_index(self, coord, mesh_min, mesh_dist, mesh_count):
+        # Same clamping as bed_mesh's ZMesh
+        idx = int(math.floor((coord - mesh_min) / mesh_dist))
+        idx = min(max(idx, 0), mesh_count - 2)
+        t = (coord - (mesh_min + idx * mesh_dist)) / mesh_dist
+        return min(max(t, 0.), 1.), idx
+
+    def calc_z(self, x, y):
+        tx, xidx = self._get_linear_index(x, self.mesh_x_min, self.mesh_x_dist,
+                                          self.mesh_x_count)
+        ty, yidx = self._get_linear_index(y, self.mesh_y_min, self.mesh_y_dist,
+                                          self.mesh_y_count)
+        tbl = self.matrix
+        i = yidx * self.mesh_x_count + xidx
+        j = i + self.mesh_x_count
+        z0 = tbl[i] + tx * (tbl[i + 1] - tbl[i])
+        z1 = tbl[j] + tx * (tbl[j + 1] - tbl[j])
+        return z0 + ty * (z1 - z0)
+
+def write_binary_mesh(filename, z_mesh):
+    """Write the interpolated matrix of a bed_mesh ZMesh as a binary profile."""
+    matrix = z_mesh.get_mesh_matrix()
+    x_count = len(matrix[0])
+    y_count = len(matrix)
+    header = BINARY_HEADER.pack(
+        BINARY_MAGIC, BINARY_VERSION, 0, x_count, y_count,
+        z_mesh.mesh_x_min, z_mesh.mesh_y_min, z_mesh.mesh_x_max, z_mesh.mesh_y_max)
+    values = [z for row in matrix for z in row]
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(struct.pack('<%df' % (len(values),), *values))
+    # An already mapped profile keeps its pages: never rewrite in place
+    os.replace(tmp, filename)
+    return x_count, y_count
 
 class BedMeshIDEX:
     FADE_DISABLE = 0x7FFFFFFF
 
     def __init__(self, config):
+        start = time.perf_counter()
         self.printer = config.get_printer()
         self.gcode_move = self.printer.lookup_object('gcode_move')
         self.quad_gantry = self.printer.lookup_object('quad_gantry_level', None)
@@ -17,16 +119,50 @@ class BedMeshIDEX:
         self.dc_module = self.printer.lookup_object('dual_carriage', None)
         # sanity checks
         if self.bed_mesh:
-            raise ConfigurationError("bed_mesh_idex cannot be used with bed_mesh. bed_mesh_idex wraps bed_mesh functionality and will instantiate it automatically.")
+            raise config.error("bed_mesh_idex cannot be used with bed_mesh. bed_mesh_idex wraps bed_mesh functionality and will instantiate it automatically.")
         if not self.quad_gantry:
-            raise ConfigurationError("bed_mesh_idex requires quad_gantry_level to be enabled. bed_mesh_idex cannot function on non-quad gantry printers for now.")
+            raise config.error("bed_mesh_idex requires quad_gantry_level to be enabled. bed_mesh_idex cannot function on non-quad gantry printers for now.")
 
         # Initialize bed_mesh internally
         self.bed_mesh = self.printer.load_object(config, 'bed_mesh')
-        # Register as move transform
-        self.mono_toolhead_bed_mesh_transform = self.gcode_move.set_move_transform(self)
+        # Register as move transform (on top of the one bed_mesh just installed)
+        self.mono_toolhead_bed_mesh_transform = self.gcode_move.set_move_transform(self, force=True)
+        self._init_gantry_solver(config)
+        # X offset of the secondary toolhead in COPY/MIRROR mode
+        self.idex_offset_x = config.getfloat('idex_offset_x', 50.)
+        # Memo of the last COPY/MIRROR move: (x, y, mode, offset, mesh) ->
+        # secondary XY and mesh Z at both toolheads. Retracts, Z-hops and
+        # unretracts keep the same XY and skip the mesh evaluation and gantry
+        # adjustment.
+        self._last_key = None
+        self._last_result = None
+        # Fade factor of the gantry tilt applied with the last move
+        self._applied_factor = None
+        # Fade factor cache: only recomputed when the layer (Z) or the
+        # fade settings change
+        self._fade_key = None
+        self._fade_factor = 1.
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.fade_bypasses = 0
+        # Optional binary profiles, used by the dual toolhead transform
+        # instead of bed_mesh's mesh while one is loaded
+        config_dir = os.path.dirname(self.printer.get_start_args().get('config_file', ''))
+        self.binary_profile_dir = os.path.expanduser(config.get(
+            'binary_profile_dir', os.path.join(config_dir, 'bed_mesh_idex')))
+        self.binary_mesh = None
+        self.binary_profile = None
+        self.printer.register_event_handler('klippy:disconnect', self._unload_binary_mesh)
         # register gcode commands
-        self.printer.register_command('TEST_BED_MESH_IDEX', self.cmd_TEST_BED_MESH_IDEX, desc=self.cmd_TEST_BED_MESH_IDEX_help)
+        gcode = self.printer.lookup_object('gcode')
+        gcode.register_command('TEST_BED_MESH_IDEX', self.cmd_TEST_BED_MESH_IDEX, desc=self.cmd_TEST_BED_MESH_IDEX_help)
+        gcode.register_command('BED_MESH_IDEX_SAVE_BINARY', self.cmd_BED_MESH_IDEX_SAVE_BINARY, desc=self.cmd_BED_MESH_IDEX_SAVE_BINARY_help)
+        gcode.register_command('BED_MESH_IDEX_LOAD_BINARY', self.cmd_BED_MESH_IDEX_LOAD_BINARY, desc=self.cmd_BED_MESH_IDEX_LOAD_BINARY_help)
+        gcode.register_command('BED_MESH_IDEX_UNLOAD_BINARY', self.cmd_BED_MESH_IDEX_UNLOAD_BINARY, desc=self.cmd_BED_MESH_IDEX_UNLOAD_BINARY_help)
+        # Commands profiled by uboe_profiler
+        self.gcode_commands = ('TEST_BED_MESH_IDEX', 'BED_MESH_IDEX_SAVE_BINARY',
+                               'BED_MESH_IDEX_LOAD_BINARY', 'BED_MESH_IDEX_UNLOAD_BINARY')
+        self.startup_times = {'config': time.perf_counter() - start}
 
     def move(self, newpos, speed):
         # Called for every move
@@ -39,120 +175,222 @@ class BedMeshIDEX:
             self.mono_toolhead_bed_mesh_transform.move(newpos, speed)
             return newpos, speed
 
-        # 2. Get XY for both toolheads
-        t0_xy = (newpos[0], newpos[1])
-        # TODO: Compute t1_xy based on IDEX offset and mode
-        t1_xy = self._get_secondary_toolhead_xy(t0_xy, mode)
-
-        # 3. Get mesh Z at both XYs
-        z0 = self.bed_mesh.z_mesh.calc_z(*t0_xy) if self.bed_mesh else 0.0
-        z1 = self.bed_mesh.z_mesh.calc_z(*t1_xy) if self.bed_mesh else 0.0
-
-        # 4. Calculate required gantry tilt (plane through both Zs)
-        # TODO: Implement actual tilt math
-        self._adjust_gantry(z0, z1, t0_xy, t1_xy)
+        # 2. Above the fade end the mesh no longer applies: both toolheads
+        # are at fade_target, like bed_mesh does, with a level gantry
+        factor = self._get_fade_factor(newpos[2])
+        fade_target = self.bed_mesh.fade_target
+        if not factor:
+            self.fade_bypasses += 1
+            if self._applied_factor is not None:
+                # Level the gantry once on the way out of the fade
+                self._adjust_gantry([0., 0., 0., 0.])
+                self._applied_factor = None
+            if not fade_target:
+                return newpos, speed
+            newpos = (newpos[0], newpos[1], newpos[2] + fade_target) + tuple(newpos[3:])
+            return newpos, speed
 
-        # 5. Optionally, adjust the move's Z for the primary toolhead
+        # 3. Same XY, mode, offset and mesh as the last move: same mesh Z
+        z_mesh = self._get_z_mesh()
+        key = (newpos[0], newpos[1], mode, self.idex_offset_x, z_mesh)
+        t0_xy = (newpos[0], newpos[1])
+        if key == self._last_key:
+            self.memo_hits += 1
+            t1_xy, z0, z1 = self._last_result
+        else:
+            self.memo_misses += 1
+            # 4. Get XY of the secondary toolhead and mesh Z at both XYs
+            t1_xy = self._get_secondary_toolhead_xy(t0_xy, mode)
+            z0 = z_mesh.calc_z(*t0_xy) if z_mesh is not None else 0.0
+            z1 = z_mesh.calc_z(*t1_xy) if z_mesh is not None else 0.0
+            self._last_key = key
+            self._last_result = (t1_xy, z0, z1)
+            self._applied_factor = None
+        # Same fade as bed_mesh: towards fade_target rather than zero
+        z0 = factor * (z0 - fade_target) + fade_target
+        z1 = factor * (z1 - fade_target) + fade_target
+
+        # 5. Tilt the gantry plane through both Zs, unless the same tilt
+        # was applied with the previous move
+        if factor != self._applied_factor:
+            self._adjust_gantry(
+                self._calculate_gantry_correction(z0, z1, t0_xy, t1_xy))
+            self._applied_factor = factor
+
+        # 6. Optionally, adjust the move's Z for the primary toolhead
         # (Klipper expects the move to be transformed for the active toolhead)
         new_z = newpos[2] + z0
         newpos = (newpos[0], newpos[1], new_z) + tuple(newpos[3:])
 
         return newpos, speed
 
+    def _get_z_mesh(self):
+        if self.binary_mesh is not None:
+            return self.binary_mesh
+        return self.bed_mesh.z_mesh if self.bed_mesh else None
+
+    def _get_binary_filename(self, gcmd):
+        profile = gcmd.get('PROFILE', 'default')
+        if not profile or os.sep in profile or profile.startswith('.'):
+            raise gcmd.error("Invalid binary profile name '%s'" % (profile,))
+        return profile, os.path.join(self.binary_profile_dir, profile + BINARY_SUFFIX)
+
+    def _unload_binary_mesh(self):
+        binary_mesh = self.binary_mesh
+        self.binary_mesh = self.binary_profile = None
+        if binary_mesh is not None:
+            binary_mesh.close()
+        self.reset_memo()
+
+    def _get_fade_factor(self, z_pos):
+        # Same fade as bed_mesh: full compensation below fade_start, only
+        # fade_target above fade_end, linear in between
+        bed_mesh = self.bed_mesh
+        fade_key = (z_pos, bed_mesh.fade_start, bed_mesh.fade_end)
+        if fade_key == self._fade_key:
+            return self._fade_factor
+        if bed_mesh.fade_end == self.FADE_DISABLE or bed_mesh.fade_dist <= 0.:
+            factor = 1.
+        elif z_pos >= bed_mesh.fade_end:
+            factor = 0.
+        elif z_pos >= bed_mesh.fade_start:
+            factor = (bed_mesh.fade_end - z_pos) / bed_mesh.fade_dist
+        else:
+            factor = 1.
+        self._fade_key = fade_key
+        self._fade_factor = factor
+        return factor
+
     def _get_secondary_toolhead_xy(self, t0_xy, mode):
-        # TODO: Compute the secondary toolhead's XY based on IDEX config and mode
-        # For now, just return a dummy offset
-        offset_x = 50.0  # Replace with actual offset from config
+        # The secondary toolhead is taken at a fixed X offset from the primary
+        # one, at the same Y: idex_offset_x to its right in COPY mode and to
+        # its left in MIRROR mode. Other modes have a single toolhead.
+        offset_x = self.idex_offset_x
         if mode == 'COPY':
             return (t0_xy[0] + offset_x, t0_xy[1])
         elif mode == 'MIRROR':
             return (t0_xy[0] - offset_x, t0_xy[1])
         return t0_xy
 
-    def _calculate_x_axis_tilt(self, z0, z1, t0_xy, t1_xy):
+    def _init_gantry_solver(self, config):
         """
-        Calculate required X-axis tilt to make nozzle line parallel to bed mesh line.
-
-        Args:
-            z0: Bed mesh Z value at primary toolhead position
-            z1: Bed mesh Z value at secondary toolhead position
-            t0_xy: Primary toolhead XY position
-            t1_xy: Secondary toolhead XY position
-
-        Returns:
-            tilt_adjustment: Amount to adjust left/right motor groups
+        Precompute the geometry-dependent part of the gantry plane solve.
+
+        The gantry plane is z = a + b*u + c*v in coordinates u, v normalised
+        to the gantry rectangle (-1 and 1 at its sides), p = (a, b, c). The
+        height of quad_gantry_level stepper i is (G p)_i with row i of G
+        being [1, +-1, +-1]. The columns of G are orthogonal, so its
+        pseudo-inverse is G^T / 4 and the least-norm corner correction is
+        G applied to the least-norm plane in this frame.
         """
-        # Calculate the "virtual" line slope created by bed mesh values
-        # This represents the ideal nozzle height difference
-        mesh_p1 = [t0_xy[0], z0]  # [X, Z] point for primary toolhead
-        mesh_p2 = [t1_xy[0], z1]  # [X, Z] point for secondary toolhead
-
-        # Use linefit to get the slope of the bed mesh line
-        mesh_slope, mesh_intercept = self.linefit(mesh_p1, mesh_p2)
-
-        # Get current gantry position (assuming level for now)
-        # In practice, you'd get this from stepper positions
-        current_gantry_z = 0.0  # Replace with actual gantry height
-
-        # Calculate required Z adjustment at each toolhead X position
-        required_z0 = self.plot([mesh_slope, mesh_intercept], t0_xy[0])
-        required_z1 = self.plot([mesh_slope, mesh_intercept], t1_xy[0])
-
-        # Calculate the tilt adjustment needed
-        # Positive means right side needs to go up relative to left side
-        x_distance = abs(t1_xy[0] - t0_xy[0])
-        z_difference = required_z1 - required_z0
-
-        # Convert to motor adjustments (similar to quad_gantry_level logic)
-        # Assuming t0_xy[0] < t1_xy[0] (primary toolhead is on left)
-        if t0_xy[0] < t1_xy[0]:
-            # Standard case: primary on left, secondary on right
-            left_adjust = -z_difference / 2.0
-            right_adjust = z_difference / 2.0
-        else:
-            # Reversed case
-            left_adjust = z_difference / 2.0
-            right_adjust = -z_difference / 2.0
-
-        return left_adjust, right_adjust
-
-    def linefit(self, p1, p2):
-        """
-        Calculate line slope and intercept from two points.
-        Copied from quad_gantry_level.py
-        """
-        if p1[1] == p2[1]:
-            # Straight line (no slope)
-            return 0, p1[1]
-        m = (p2[1] - p1[1]) / (p2[0] - p1[0])
-        b = p1[1] - m * p1[0]
-        return m, b
-
-    def plot(self, f, x):
-        """
-        Calculate Y value from line equation at given X.
-        Copied from quad_gantry_level.py
+        (x_min, y_min), (x_max, y_max) = [
+            corner[:2] for corner in self.quad_gantry.gantry_corners]
+        if x_max <= x_min or y_max <= y_min:
+            raise config.error("bed_mesh_idex: quad_gantry_level gantry_corners"
+                               " must span a non empty rectangle")
+        # Same stepper order as quad_gantry_level:
+        # front_left, rear_left, rear_right, front_right
+        self.gantry_points = [(x_min, y_min), (x_min, y_max),
+                              (x_max, y_max), (x_max, y_min)]
+        self._gantry_center = ((x_min + x_max) / 2., (y_min + y_max) / 2.)
+        self._gantry_scale = (2. / (x_max - x_min), 2. / (y_max - y_min))
+        self._gantry_rows = [self._gantry_row(point) for point in self.gantry_points]
+        # Corner corrections currently applied to the gantry
+        self._gantry_correction = [0., 0., 0., 0.]
+
+    def _gantry_row(self, point):
+        (cx, cy), (sx, sy) = self._gantry_center, self._gantry_scale
+        return (1., (point[0] - cx) * sx, (point[1] - cy) * sy)
+
+    def _solve_gantry(self, points, heights):
         """
-        return f[0] * x + f[1]
+        Corrections of the four gantry corners such that the gantry plane
+        goes through heights[i] at points[i] (one or two XY points).
 
-    def _adjust_gantry(self, z0, z1, t0_xy, t1_xy):
+        The least-norm plane lies in the span of the point rows n0, n1:
+        p = z0 n0 / |n0|^2 + (z1 - z0 n0.n1 / |n0|^2) g / |g|^2 with g the
+        part of n1 orthogonal to n0. When the points coincide (g = 0) only
+        the first point is used.
         """
-        Adjust gantry tilt based on bed mesh differences between toolheads.
+        n0 = self._gantry_row(points[0])
+        n00 = _dot(n0, n0)
+        plane = [heights[0] * v / n00 for v in n0]
+        if len(points) == 2:
+            n1 = self._gantry_row(points[1])
+            k = _dot(n0, n1) / n00
+            g = [v1 - k * v0 for v0, v1 in zip(n0, n1)]
+            gg = _dot(g, g)
+            if gg > 1e-12 * n00:
+                w = (heights[1] - heights[0] * k) / gg
+                plane = [p + w * v for p, v in zip(plane, g)]
+        return [_dot(row, plane) for row in self._gantry_rows]
+
+    def _calculate_gantry_correction(self, z0, z1, t0_xy, t1_xy):
+        # The primary toolhead's mesh Z goes into the move itself: the gantry
+        # stays put under the primary toolhead and tilts by z1 - z0 under the
+        # secondary one
+        return self._solve_gantry((t0_xy, t1_xy), (0., z1 - z0))
+
+    def _adjust_gantry(self, correction):
         """
-        left_adjust, right_adjust = self._calculate_x_axis_tilt(z0, z1, t0_xy, t1_xy)
-
-        # Create adjustment array for quad gantry steppers
-        # Assuming stepper order: [front_left, front_right, rear_right, rear_left]
-        z_adjust = [left_adjust, right_adjust, right_adjust, left_adjust]
+        Move the gantry corners to the given correction (relative to the
+        leveled gantry), sending only the difference with the applied one.
+        """
+        delta = [new - old for new, old in zip(correction, self._gantry_correction)]
+        if not any(delta):
+            return
+        self._gantry_correction = list(correction)
 
         # Get speed from probe helper or use default
         speed = 5.0  # You might want to make this configurable
         if hasattr(self, 'probe_helper'):
             speed = self.probe_helper.get_lift_speed()
 
-        # Apply the adjustment using quad_gantry's helper
+        # Apply the adjustment using quad_gantry's helper. As for
+        # quad_gantry_level, a positive adjustment lowers the stepper.
         if self.quad_gantry and hasattr(self.quad_gantry, 'z_helper'):
-            self.quad_gantry.z_helper.adjust_steppers(z_adjust, speed)
+            self.quad_gantry.z_helper.adjust_steppers([-d for d in delta], speed)
+
+    def reset_memo(self):
+        # Forget the last move, e.g. after the gantry was moved behind our back
+        self._last_key = None
+        self._applied_factor = None
+
+    def get_status(self, eventtime=None):
+        return {'memo_hits': self.memo_hits, 'memo_misses': self.memo_misses,
+                'fade_bypasses': self.fade_bypasses,
+                'binary_profile': self.binary_profile}
+
+    cmd_BED_MESH_IDEX_SAVE_BINARY_help = "Save the current bed_mesh mesh as a binary profile. Usage: BED_MESH_IDEX_SAVE_BINARY [PROFILE=<name>]"
+    def cmd_BED_MESH_IDEX_SAVE_BINARY(self, gcmd):
+        profile, filename = self._get_binary_filename(gcmd)
+        z_mesh = self.bed_mesh.z_mesh
+        if z_mesh is None:
+            raise gcmd.error("No bed mesh loaded. Please load a bed mesh first.")
+        try:
+            os.makedirs(self.binary_profile_dir, exist_ok=True)
+            x_count, y_count = write_binary_mesh(filename, z_mesh)
+        except Exception as e:
+            raise gcmd.error("Unable to save binary profile %s: %s" % (filename, e))
+        gcmd.respond_info("Binary profile '%s' (%dx%d) saved to %s"
+                          % (profile, x_count, y_count, filename))
+
+    cmd_BED_MESH_IDEX_LOAD_BINARY_help = "Use a binary profile for the dual toolhead compensation. Usage: BED_MESH_IDEX_LOAD_BINARY [PROFILE=<name>]"
+    def cmd_BED_MESH_IDEX_LOAD_BINARY(self, gcmd):
+        profile, filename = self._get_binary_filename(gcmd)
+        try:
+            binary_mesh = BinaryZMesh(filename)
+        except Exception as e:
+            raise gcmd.error("Unable to load binary profile %s: %s" % (filename, e))
+        self._unload_binary_mesh()
+        self.binary_mesh = binary_mesh
+        self.binary_profile = profile
+        gcmd.respond_info("Binary profile '%s' (%dx%d) loaded" % (
+            profile, binary_mesh.mesh_x_count, binary_mesh.mesh_y_count))
+
+    cmd_BED_MESH_IDEX_UNLOAD_BINARY_help = "Go back to the bed_mesh mesh for the dual toolhead compensation"
+    def cmd_BED_MESH_IDEX_UNLOAD_BINARY(self, gcmd):
+        self._unload_binary_mesh()
 
     cmd_TEST_BED_MESH_IDEX_help = "Test bed mesh IDEX compensation by displaying calculated gantry adjustments for mock positions given in the command."
     def cmd_TEST_BED_MESH_IDEX(self, gcmd):
@@ -170,7 +408,8 @@ class BedMeshIDEX:
             raise gcmd.error("bed_mesh module is required for TEST_BED_MESH_IDEX")
 
         # check if a bed_mesh is loaded
-        if not self.bed_mesh.z_mesh or not self.bed_mesh.z_mesh.mesh:
+        z_mesh = self._get_z_mesh()
+        if not z_mesh or not z_mesh.mesh:
             raise gcmd.error("No bed mesh loaded. Please load a bed mesh first.")
 
         try:
@@ -185,17 +424,18 @@ class BedMeshIDEX:
         t1_xy = (x1, y1)
 
         # Get mesh Z at both XYs
-        mesh_z0 = self.bed_mesh.z_mesh.calc_z(*t0_xy) if self.bed_mesh else 0.0
-        mesh_z1 = self.bed_mesh.z_mesh.calc_z(*t1_xy) if self.bed_mesh else 0.0
+        mesh_z0 = z_mesh.calc_z(*t0_xy)
+        mesh_z1 = z_mesh.calc_z(*t1_xy)
 
-        # Calculate required gantry tilt adjustments
-        left_adjust, right_adjust = self._calculate_x_axis_tilt(mesh_z0, mesh_z1, t0_xy, t1_xy)
+        # Calculate required gantry corner corrections
+        correction = self._calculate_gantry_correction(mesh_z0, mesh_z1, t0_xy, t1_xy)
 
         # Report results
         gcmd.respond_info("TEST_BED_MESH_IDEX Results:")
         gcmd.respond_info(f"Toolhead 0 Position: X={x0}, Y={y0}, Mesh Z={mesh_z0}")
         gcmd.respond_info(f"Toolhead 1 Position: X={x1}, Y={y1}, Mesh Z={mesh_z1}")
-        gcmd.respond_info(f"Calculated Gantry Adjustments: Left Group={left_adjust:.4f}, Right Group={right_adjust:.4f}")
+        gcmd.respond_info("Calculated Gantry Corrections: " + ", ".join(
+            f"{name}={d:.4f}" for name, d in zip(GANTRY_CORNERS, correction)))
 
 def load_config(config):
     return BedMeshIDEX(config)
\ No newline at end of file
@@ -5,7 +5,14 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import configparser
 import logging
-import reactor
+import os
+import time
+
+from .uboe_status import register_status
+
+# A file modified less than this long ago may still be rewritten without
+# its stat() changing (coarse mtime): its content is not cached
+MTIME_GRANULARITY_NS = 2 * 10**9
 
 # for linting purposes
 # import heater_bed
@@ -19,8 +26,9 @@ class klipperMacros:
     than jinja constructed ones in klipper macros. (ie while looping etc...)
     '''
     def __init__(self, config):
+        start = time.perf_counter()
         self.printer = config.get_printer()
-        self.reactor = reactor.Reactor()
+        self.reactor = self.printer.get_reactor()
         self._trigger_completion = False
         self.gcode = self.printer.lookup_object('gcode')
 
@@ -30,6 +38,18 @@ class klipperMacros:
         self._iteration_value = 0
         self._autorun = False
         self._missing_temp_profile_displayed = False
+        # save_variables cache (see _get_variables)
+        self._variables = None
+        self._variables_stamp = None
+        self._active_surface = None
+        self._active_profile = None
+        # Compensation tables of the active surface, by heater name
+        self._compensations = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Status published only on change (see uboe_status)
+        self.status = register_status(self.printer, config.get_name())
+        self._update_status()
         # Register commands and event handlers
         self.printer.register_event_handler("klippy:ready", self._handle_ready)
         self.printer.register_event_handler("klipper_macros:trigger_completion", self._handle_trigger_completion)
@@ -49,14 +69,19 @@ class klipperMacros:
             "SET_HEATER_TEMPERATURE_COMPENSATE",
             self.cmd_SET_HEATER_TEMPERATURE_COMPENSATE,
             desc=self.cmd_SET_HEATER_TEMPERATURE_COMPENSATE_help)
+        # Commands profiled by uboe_profiler
+        self.gcode_commands = ("CONTINUE_SURFACE_TEMP_PROFILE", "MAKE_SURFACE_TEMP_PROFILE",
+                               "SAVE_TEMP_PROFILE", "SET_HEATER_TEMPERATURE_COMPENSATE")
 
         # self.prev_SET_PRESSURE_ADVANCE = self.gcode.register_command("SET_PRESSURE_ADVANCE", None)
         # self.gcode.register_command(
         #     "SET_PRESSURE_ADVANCE",
         #     self.cmd_SET_PRESSURE_ADVANCE,
         #     desc=self.cmd_SET_PRESSURE_ADVANCE_help)
+        self.startup_times = {'config': time.perf_counter() - start}
 
     def _handle_ready(self):
+        start = time.perf_counter()
         self.min_event_systime = self.printer.get_reactor().monotonic() + 2.
         self.bed_heater  = self.printer.lookup_object('heater_bed')
         self.bed_pheaters = self.printer.lookup_object('heaters')
@@ -67,6 +92,102 @@ class klipperMacros:
             self.th_sensor  = None
         self._autorun = self.th_sensor is not None
         self.save_variables = self.printer.lookup_object('save_variables')
+        # Bed made of several pads: compensated together
+        self.quad_pad = self.printer.lookup_object('quad_pad_bed_heater', None)
+        self._update_status()
+        self.startup_times['ready'] = time.perf_counter() - start
+
+    def _file_stamp(self):
+        '''
+        Stamp of the save_variables file (empty if there is no file), None
+        if it can't be trusted: a rewrite within the filesystem's mtime
+        granularity of the last one could keep the same stamp, so a recently
+        modified file is re-read.
+        '''
+        try:
+            st = os.stat(self.save_variables.filename)
+        except OSError:
+            return ()
+        if time.time_ns() - st.st_mtime_ns < MTIME_GRANULARITY_NS:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _get_variables(self):
+        '''
+        Returns the save_variables content. save_variables replaces
+        allVariables whenever it reloads (SAVE_VARIABLE), so a new object is
+        taken as is; the file is only stat'ed to catch external edits and
+        re-parsed when it changed on disk.
+        '''
+        allvars = self.save_variables.allVariables
+        if self._variables is not None and allvars is self._variables:
+            stamp = self._file_stamp()
+            if stamp is not None and stamp == self._variables_stamp:
+                self.cache_hits += 1
+                self._update_status()
+                return self._variables
+        self.cache_misses += 1
+        if allvars is self._variables or self._variables is None:
+            self.save_variables.loadVariables()
+        self._variables_stamp = self._file_stamp()
+        self._variables = self.save_variables.allVariables
+        # resolve active surface and its temp profile once per load
+        surfaces = self._variables.get('bed_surfaces')
+        if isinstance(surfaces, dict):
+            self._active_surface = surfaces.get('active')
+        else:
+            self._active_surface = None
+        self._active_profile = self._variables.get('temp_profile', {}).get(self._active_surface)
+        self._load_compensations()
+        self._update_status()
+        return self._variables
+
+    def _load_compensations(self):
+        '''
+        Rebuilds the compensation tables of the active surface: temp_profile
+        for the bed heater and heater_temp_profile for any other heater
+        (ie the quad_pad_bed_heater pads), as
+        {'surface_name': {'heater_name': {40 : 45.2, ..., 100 : 92.3}}}
+        '''
+        compensations = {}
+        heater_profiles = self._variables.get('heater_temp_profile', {})
+        if isinstance(heater_profiles, dict):
+            compensations.update(heater_profiles.get(self._active_surface) or {})
+        if self._active_profile:
+            compensations[self.bed_heater.heater.name] = self._active_profile
+        self._compensations = compensations
+
+    def _get_active_surface(self, gcmd):
+        '''
+        Common bed_surfaces/active validation. Returns the active surface name
+        or None after having informed the user.
+        '''
+        variables = self._get_variables()
+        if not 'bed_surfaces' in variables:
+            # run gcode command to initialize bed_surfaces
+            gcmd.respond_info("No bed surfaces found. _init_surfaces will be run now!")
+            self.gcode.run_script_from_command('_init_surfaces')
+            return None
+        if self._active_surface is None:
+            # run gcode command to initialize active surface
+            gcmd.respond_info("No active surface found. Please set one with SET_SURFACE_ACTIVE")
+            return None
+        return self._active_surface
+
+    def get_cache_stats(self):
+        return {'hits': self.cache_hits, 'misses': self.cache_misses}
+
+    def _update_status(self):
+        self.status.update({
+            'active_surface': self._active_surface,
+            'profile_temps': sorted(self._active_profile) if self._active_profile else [],
+            'compensated_heaters': sorted(self._compensations),
+            'profiling_temp': self._iteration_value,
+            'autorun': self._autorun,
+        })
+
+    def get_status(self, eventtime):
+        return self.status.get()
 
     def _handle_trigger_completion(self, gcmd):
         self.min_event_systime = self.printer.get_reactor().monotonic() + 2.
@@ -95,28 +216,18 @@ class klipperMacros:
         entry + 5.
         '''
         # get active sheet from saved variables
-        self.save_variables.loadVariables()
-        variables = self.save_variables.allVariables
-
-        if not 'bed_surfaces' in variables:
-            # run gcode command to initialize bed_surfaces
-            gcmd.respond_info("No bed surfaces found. _init_surfaces will be run now!")
-            self.gcode.run_script_from_command('_init_surfaces')
-            return
-        if not 'active' in variables['bed_surfaces']:
-            # run gcode command to initialize active surface
-            gcmd.respond_info("No active surface found. Please set one with SET_SURFACE_ACTIVE")
+        active_sheet = self._get_active_surface(gcmd)
+        if active_sheet is None:
             return
         if self._iteration_value != 0:
             # run gcode command to initialize active surface
             gcmd.respond_info("Previous MAKE_SURFACE_TEMP_PROFILE or CONTINUE_SURFACE_TEMP_PROFILE seems to be ongoing. This command should be called alone.")
             return
-        active_sheet = variables['bed_surfaces']['active']
-        if not 'temp_profile' in variables:
+        if not self._active_profile:
             # run gcode command to initialize active surface
             gcmd.respond_info("No temperature profile found for %s. Please make one with MAKE_SURFACE_TEMP_PROFILE" % active_sheet)
             return
-        self._iteration_value = max([t for t in variables['temp_profile'][active_sheet].keys()])+5
+        self._iteration_value = max([t for t in self._active_profile.keys()])+5
         msg = "Continue surface temp profile for %s with autorun = %s" % (active_sheet, self._autorun)
         gcmd.respond_info(msg)
         self._iterate_temps(self._iteration_value+5, gcmd)
@@ -129,19 +240,9 @@ class klipperMacros:
         temperature profile to the active surface.
         '''
         # get active sheet from saved variables
-        self.save_variables.loadVariables()
-        variables = self.save_variables.allVariables
-
-        if not 'bed_surfaces' in variables:
-            # run gcode command to initialize bed_surfaces
-            gcmd.respond_info("No bed surfaces found. _init_surfaces will be run now!")
-            self.gcode.run_script_from_command('_init_surfaces')
-            return
-        if not 'active' in variables['bed_surfaces']:
-            # run gcode command to initialize active surface
-            gcmd.respond_info("No active surface found. Please set one with SET_SURFACE_ACTIVE")
+        active_sheet = self._get_active_surface(gcmd)
+        if active_sheet is None:
             return
-        active_sheet = variables['bed_surfaces']['active']
         msg = "Make surface temp profile for %s with autorun = %s" % (active_sheet, self._autorun)
         gcmd.respond_info(msg)
         # home printer first
@@ -154,9 +255,11 @@ class klipperMacros:
             self._iteration_value = 30
         elif iteration_value >= max_temp:
             self._iteration_value = 0
+            self._update_status()
             return
         else :
             self._iteration_value = iteration_value
+        self._update_status()
         self.gcode.run_script_from_command("M73 P%d" % int(self._iteration_value/max_temp*100))
 
         self._go_middle(gcmd)
@@ -186,23 +289,14 @@ class klipperMacros:
 
     def _save_prfofile(self, measured, gcmd):
         # get active sheet from saved variables
-        self.save_variables
-        variables = self.save_variables.allVariables
-
-        if not 'bed_surfaces' in variables:
-            # run gcode command to initialize bed_surfaces
-            gcmd.respond_info("No bed surfaces found. _init_surfaces will be run now!")
-            self.gcode.run_script_from_command('_init_surfaces')
-            return
-        if not 'active' in variables['bed_surfaces']:
-            # run gcode command to initialize active surface
-            gcmd.respond_info("No active surface found. Please set one with SET_SURFACE_ACTIVE")
+        active_sheet = self._get_active_surface(gcmd)
+        if active_sheet is None:
             return
+        variables = self._variables
         if not self._iteration_value:
             # run gcode command to initialize active surface
             gcmd.respond_info("You need to be running MAKE_SURFACE_TEMP_PROFILE in order to start saving a temperature profile")
             return
-        active_sheet = variables['bed_surfaces']['active']
         msg = "Save surface temp profile for %s" % (active_sheet)
         gcmd.respond_info(msg)
         # get bed settings
@@ -232,6 +326,13 @@ class klipperMacros:
             msg = "Unable to save variable"
             logging.exception(msg)
             raise gcmd.error(msg)
+        # our own write: let save_variables reload it, like SAVE_VARIABLE
+        self.save_variables.loadVariables()
+        self._variables = variables = self.save_variables.allVariables
+        self._variables_stamp = self._file_stamp()
+        self._active_profile = variables['temp_profile'][active_sheet]
+        self._load_compensations()
+        self._update_status()
         self.printer.send_event("klipper_macros:trigger_completion", gcmd)
 
     cmd_SET_HEATER_TEMPERATURE_COMPENSATE_help = "Trys to apply an offest to the heater target temp if the the heater is in the list of heaters with a temp_profile. Usage: SET_HEATER_TEMPERATURE_COMPENSATE HEATER=<heater> TARGET=<target>"
@@ -240,49 +341,57 @@ class klipperMacros:
         This command will try to apply an offset to the heater target temp if the the heater is in the list of heaters with a temp_profile.
         '''
         # retrieve heater and target temp
-        heater = gcmd.get('HEATER')
+        heater_name = gcmd.get('HEATER')
         target = gcmd.get_float('TARGET')
-        # check if heater is bed_heater
-        if heater != self.bed_heater.heater.name:
-            # gcmd.respond_info("Only %s is supported for now." % self.bed_heater.heater.name)
-            self.gcode.run_script_from_command("SET_HEATER_TEMPERATURE HEATER=%s TARGET=%f" % (heater, target))
+        if heater_name != self.bed_heater.heater.name:
+            try:
+                heater = self.bed_pheaters.lookup_heater(heater_name)
+            except self.printer.config_error as e:
+                raise gcmd.error(str(e))
+            # other heaters are only compensated if they have a table
+            self._get_variables()
+            new_target = self._compensate(heater_name, target, gcmd)
+            if self.quad_pad is not None and heater in self.quad_pad.pads:
+                # a pad of the bed: keep the bed's heat-up and power budget
+                self.quad_pad.set_pad_target(heater, new_target)
+            else:
+                self.bed_pheaters.set_temperature(heater, new_target)
             return
-        else :
-            # get active sheet from saved variables
-            self.save_variables.loadVariables()
-            variables = self.save_variables.allVariables
-            if not 'bed_surfaces' in variables:
-                # run gcode command to initialize bed_surfaces
-                gcmd.respond_info("No bed surfaces found. _init_surfaces will be run now!")
-                self.gcode.run_script_from_command('_init_surfaces')
-                return
-            if not 'active' in variables['bed_surfaces']:
-                # run gcode command to initialize active surface
-                gcmd.respond_info("No active surface found. Please set one with SET_SURFACE_ACTIVE")
-                return
-            active_sheet = variables['bed_surfaces']['active']
-            if not 'temp_profile' in variables or not active_sheet in variables['temp_profile']:
-                # run gcode command to initialize active surface
-                if not self._missing_temp_profile_displayed :
-                    gcmd.respond_info("No temperature profile found for %s. Not applying any offset." % active_sheet)
-                    self._missing_temp_profile_displayed = True
-                self.bed_pheaters.set_temperature(self.bed_heater.heater, target)
-                return
-            else :
-                # find closest temp above target in temp_profile
-                temp_profile = variables['temp_profile'][active_sheet]
-                # closest measured
-                closest_m = min(temp_profile.values(), key=lambda x:abs(x-target))
-                # firs key with this value in temp_profile
-                closest = {k:v for k,v in temp_profile.items() if v == closest_m}
-                if not closest:
-                    gcmd.respond_info("No temperature profile found for %s at target temp %f. Not applying any offset." % (active_sheet, target))
-                    self.bed_pheaters.set_temperature(self.bed_heater.heater, target)
-                    return
-                # new target is list(closest.keys())[0]
-                self.bed_pheaters.set_temperature(self.bed_heater.heater, list(closest.keys())[0])
-                gcmd.respond_info("[COMPENSATION] : Compensating from %.2f to %.2f for heater %s" % (target, list(closest.keys())[0], heater))
-                return
+        # get active sheet from saved variables
+        active_sheet = self._get_active_surface(gcmd)
+        if active_sheet is None:
+            return
+        bed_heaters = self.quad_pad.pads if self.quad_pad is not None else [self.bed_heater.heater]
+        has_table = any(pad.get_name() in self._compensations for pad in bed_heaters)
+        if not has_table and not self._missing_temp_profile_displayed:
+            gcmd.respond_info("No temperature profile found for %s. Not applying any offset." % active_sheet)
+            self._missing_temp_profile_displayed = True
+        if self.quad_pad is None:
+            self.bed_pheaters.set_temperature(
+                self.bed_heater.heater, self._compensate(heater_name, target, gcmd))
+            return
+        # every pad of the bed with its own table (or the bed's one), set
+        # in a single batch
+        self.quad_pad.set_pad_targets([
+            self._compensate(pad.get_name(), target, gcmd, heater_name)
+            for pad in self.quad_pad.pads])
+
+    def _compensate(self, heater_name, target, gcmd, fallback=None):
+        '''
+        Returns the target to set on heater_name for the wanted target: the
+        profile temperature whose measured surface temperature is the closest
+        to target, or target itself without a table.
+        '''
+        temp_profile = self._compensations.get(heater_name)
+        if temp_profile is None and fallback is not None:
+            temp_profile = self._compensations.get(fallback)
+        if not temp_profile:
+            return target
+        # closest measured, first profile temperature measuring it
+        closest_m = min(temp_profile.values(), key=lambda x:abs(x-target))
+        new_target = next(k for k, v in temp_profile.items() if v == closest_m)
+        gcmd.respond_info("[COMPENSATION] : Compensating from %.2f to %.2f for heater %s" % (target, new_target, heater_name))
+        return new_target
 
     # Override to add QUIET option to control console logging from https://github.com/moggieuk/Happy-Hare/blob/76eca598d7301d6e834ed39068e83270d318afff/extras/mmu_machine.py#L1276
     cmd_SET_PRESSURE_ADVANCE_help = "Sets the pressure advance value. Usage: SET_PRESSURE_ADVANCE ADVANCE=<float> SMOOTH_TIME=<float> QUIET=<0|1>"
@@ -4,18 +4,254 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 
-from extras.heater_bed import PrinterHeaterBed
-from extras.pid_calibrate import ControlAutoTune
-
+import collections
+import configparser
 import logging
+import math
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from extras.heater_bed import PrinterHeaterBed
+
+# Interval of the bed control tick (power scheduling)
+TICK_INTERVAL = 1.
+
+def _allocate_power(weights, caps, budget, floors=None):
+    # Give every pad its floor first (scaled down if the floors alone exceed
+    # the budget), then water-fill the rest of the budget across the pads
+    # proportionally to their weight, never exceeding a pad's own max_power.
+    # Headroom left by saturated pads is redistributed to the remaining ones.
+    alloc = [0.] * len(caps)
+    if floors is not None:
+        alloc = [min(f, c) for f, c in zip(floors, caps)]
+        total_floor = sum(alloc)
+        if total_floor > budget:
+            return [a * budget / total_floor for a in alloc]
+    active = [i for i, w in enumerate(weights) if w > 0.]
+    remaining = budget - sum(alloc)
+    while active and remaining > 1e-9:
+        total = sum(weights[i] for i in active)
+        saturated = [i for i in active
+                     if remaining * weights[i] / total >= caps[i] - alloc[i]]
+        if not saturated:
+            for i in active:
+                alloc[i] += remaining * weights[i] / total
+            break
+        for i in saturated:
+            remaining -= caps[i] - alloc[i]
+            alloc[i] = caps[i]
+        active = [i for i in active if i not in saturated]
+    return alloc
+
+# Settle band used by follower pads to report busy
+FOLLOWER_SETTLE_DELTA = 1.
+
+class ControlLeader:
+    # Runs the main pad's own control and then drives the follower pads
+    # from the same step, so all pad updates share one pwm time.
+    def __init__(self, control, bed):
+        self.control = control
+        self.heater = control.heater
+        self.bed = bed
+    @property
+    def heater_max_power(self):
+        return self.control.heater_max_power
+    @heater_max_power.setter
+    def heater_max_power(self, value):
+        self.control.heater_max_power = value
+    def temperature_update(self, read_time, temp, target_temp):
+        self.control.temperature_update(read_time, temp, target_temp)
+        self.bed._drive_followers(read_time, self.heater.last_pwm_value)
+    def check_busy(self, eventtime, smoothed_temp, target_temp):
+        return self.control.check_busy(eventtime, smoothed_temp, target_temp)
+
+class ControlStaggered:
+    # Wraps a pad's own control and shifts its updates by a fixed offset.
+    # A software PWM restarts its cycle on each update, so this offsets the
+    # pad's PWM phase; time differences seen by the control are unchanged.
+    def __init__(self, control, offset):
+        self.control = control
+        self.heater = control.heater
+        self.offset = offset
+    @property
+    def heater_max_power(self):
+        return self.control.heater_max_power
+    @heater_max_power.setter
+    def heater_max_power(self, value):
+        self.control.heater_max_power = value
+    def temperature_update(self, read_time, temp, target_temp):
+        self.control.temperature_update(read_time + self.offset, temp, target_temp)
+    def check_busy(self, eventtime, smoothed_temp, target_temp):
+        return self.control.check_busy(eventtime, smoothed_temp, target_temp)
+
+class ControlFollower:
+    # No control loop of its own: output is set by the leader's step
+    def __init__(self, heater):
+        self.heater = heater
+        self.heater_max_power = heater.get_max_power()
+    def temperature_update(self, read_time, temp, target_temp):
+        pass
+    def check_busy(self, eventtime, smoothed_temp, target_temp):
+        return abs(target_temp - smoothed_temp) > FOLLOWER_SETTLE_DELTA
+
+class PadTelemetry:
+    # Bounded rolling temperature window and heat-up timing of one pad
+    def __init__(self, heater, window):
+        self.heater = heater
+        self.name = heater.get_name().split()[-1]
+        self.temps = collections.deque(maxlen=window)
+        self.temp_sum = 0.
+        self.heatup_start = None
+        self.time_to_target = None
+    def add_sample(self, temp):
+        if len(self.temps) == self.temps.maxlen:
+            self.temp_sum -= self.temps[0]
+        self.temps.append(temp)
+        self.temp_sum += temp
+    def start_heatup(self, eventtime):
+        self.heatup_start = eventtime
+        self.time_to_target = None
+    def check_heatup(self, eventtime, in_band):
+        if self.heatup_start is not None and in_band:
+            self.time_to_target = eventtime - self.heatup_start
+            self.heatup_start = None
+    def get_status(self, temp, target):
+        return {
+            'temperature': round(temp, 2),
+            'target': target,
+            'duty': round(self.heater.last_pwm_value, 3),
+            'min': round(min(self.temps), 2),
+            'max': round(max(self.temps), 2),
+            'mean': round(self.temp_sum / len(self.temps), 2),
+            'time_to_target': self.time_to_target,
+        }
+
+# Heat-up model: only learn while a pad is close to its power limit
+MODEL_MIN_DUTY = 0.9
+MODEL_MIN_SAMPLES = 10
+MODEL_DECAY = 0.999
+# save_variables entry holding the learned models
+MODEL_VARIABLE = 'quad_pad_heatup_model'
+
+class HeatupModel:
+    # Learns the heating rate per unit of duty of a pad as a linear function
+    # of its temperature (rate = duty * (a - b * temp)) from running
+    # least-squares sums
+    def __init__(self, heater):
+        self.heater = heater
+        self.n = self.sx = self.sy = self.sxx = self.sxy = 0.
+        self.last_sample = None
+    def get_state(self):
+        return [self.n, self.sx, self.sy, self.sxx, self.sxy]
+    def set_state(self, state):
+        self.n, self.sx, self.sy, self.sxx, self.sxy = [float(v) for v in state]
+    def sample(self, eventtime, temp, target, tolerance, max_power):
+        # max_power is the limit the pad's control currently applies, which
+        # the power budget may hold well below the heater's own max_power
+        last = self.last_sample
+        self.last_sample = None
+        duty = self.heater.last_pwm_value
+        if (target - temp <= tolerance or max_power <= 0.
+                or duty < MODEL_MIN_DUTY * max_power):
+            return
+        self.last_sample = (eventtime, temp)
+        if last is None or eventtime <= last[0]:
+            return
+        rate = (temp - last[1]) / (eventtime - last[0]) / duty
+        d = MODEL_DECAY
+        self.n = self.n * d + 1.
+        self.sx = self.sx * d + temp
+        self.sy = self.sy * d + rate
+        self.sxx = self.sxx * d + temp * temp
+        self.sxy = self.sxy * d + temp * rate
+    def predict(self, from_temp, to_temp, max_power):
+        # Seconds needed to heat from from_temp to to_temp with the pad
+        # limited to max_power, None if unknown
+        if to_temp <= from_temp:
+            return 0.
+        if self.n < MODEL_MIN_SAMPLES or max_power <= 0.:
+            return None
+        denom = self.n * self.sxx - self.sx * self.sx
+        if denom > 1e-9:
+            b = -(self.n * self.sxy - self.sx * self.sy) / denom
+            a = (self.sy + b * self.sx) / self.n
+            if b > 1e-6:
+                if a - b * to_temp <= 0.:
+                    return None
+                return math.log((a - b * from_temp) / (a - b * to_temp)) / (b * max_power)
+        mean_rate = self.sy / self.n
+        if mean_rate <= 0.:
+            return None
+        return (to_temp - from_temp) / (mean_rate * max_power)
 
 class QuadPadBedHeater():
     def __init__(self, config):
+        start = time.perf_counter()
         self.printer = config.get_printer()
         self.main_bed_heater : PrinterHeaterBed = self.printer.lookup_object(f'heater_bed')
         self.additional_bed_heaters = []
         for i in range(3):
             self.additional_bed_heaters.append(self.printer.load_object(config, f'heater_generic heater_bed{i+1}'))
+        self.pads = [self.main_bed_heater.heater] + self.additional_bed_heaters
+        self.reactor = self.printer.get_reactor()
+        self._calibrating = False
+
+        # Total bed power budget shared by the pads (disabled if not set)
+        self.power_budget = config.getfloat('power_budget', None, above=0.)
+        self.pad_power = config.getfloat('pad_power', None, above=0.)
+        if self.power_budget is not None and self.pad_power is None:
+            raise config.error("pad_power must be set in section '%s' when using power_budget" % (config.get_name(),))
+        self._pad_max_power = [pad.get_max_power() for pad in self.pads]
+        # With a budget, the pads' PWM phases are spread over one PWM cycle
+        # so that they don't all switch on together
+        self.pad_phase_offsets = [0.] * len(self.pads)
+        if self.power_budget is not None:
+            sections = ['heater_bed'] + ['heater_generic heater_bed%d' % (i + 1,) for i in range(3)]
+            cycle_time = max(config.getsection(section).getfloat('pwm_cycle_time', 0.100)
+                             for section in sections)
+            self.pad_phase_offsets = [i * cycle_time / len(self.pads)
+                                      for i in range(len(self.pads))]
+        self.pad_power_limits = list(self._pad_max_power)
+        # Duty last seen holding each pad in its band, reserved as a floor
+        self.pad_hold_duty = [0.] * len(self.pads)
+        # M190 in-band tolerance, one value for all pads or one per pad
+        tolerances = config.getfloatlist('pad_temp_tolerance', (1.,))
+        if len(tolerances) == 1:
+            tolerances = tolerances * len(self.pads)
+        elif len(tolerances) != len(self.pads):
+            raise config.error("pad_temp_tolerance in section '%s' needs 1 or %d values" % (config.get_name(), len(self.pads)))
+        self.pad_tolerances = list(tolerances)
+        self._wait_completion = None
+        self._wait_gcmd = None
+        self.waiting_on = None
+        self._tick_timer = None
+        self.printer.register_event_handler("klippy:ready", self._handle_ready)
+
+        # Telemetry, refreshed once per control tick
+        window = config.getint('telemetry_window', 60, minval=1)
+        self.telemetry = [PadTelemetry(pad, window) for pad in self.pads]
+        self.time_to_target = None
+        self._heatup_start = None
+        self._status = {}
+        self.models = [HeatupModel(pad) for pad in self.pads]
+        self.predicted_heatup = None
+
+        # Follower mode: the extra pads reuse the main pad's control step
+        # plus a proportional per-pad trim
+        self.pad_control = config.getchoice('pad_control', {'independent': 'independent', 'follower': 'follower'}, 'independent')
+        self.follower_trim_gain = config.getfloat('follower_trim_gain', 0.05, minval=0.)
+        self._follower_controls = []
+        if self.pad_control == 'follower':
+            main_heater = self.main_bed_heater.heater
+            main_heater.set_control(ControlLeader(main_heater.control, self))
+            for pad in self.additional_bed_heaters:
+                control = ControlFollower(pad)
+                pad.set_control(control)
+                self._follower_controls.append(control)
+        elif self.power_budget is not None:
+            for pad, offset in zip(self.additional_bed_heaters, self.pad_phase_offsets[1:]):
+                pad.set_control(ControlStaggered(pad.control, offset))
 
         # self.printer.register_event_handler("klippy:mcu_identify", self.handle_ready)
 
@@ -33,6 +269,220 @@ class QuadPadBedHeater():
         gcode.register_command("M140", self.cmd_M140, desc=self.cmd_m140_help)
         gcode.register_command("M190", self.cmd_M190, desc=self.cmd_m190_help)
         gcode.register_command("PID_CALIBRATE", self.cmd_PID_CALIBRATE, desc=self.cmd_pid_calibrate_help)
+        gcode.register_command("PREDICT_BED_HEATUP", self.cmd_PREDICT_BED_HEATUP, desc=self.cmd_predict_bed_heatup_help)
+        # Commands profiled by uboe_profiler
+        self.gcode_commands = ("M140", "M190", "PID_CALIBRATE", "PREDICT_BED_HEATUP")
+        self.startup_times = {'config': time.perf_counter() - start}
+
+    def _drive_followers(self, read_time, leader_pwm):
+        # Called from the leader's temperature update: every follower gets
+        # its update in the same batch, at the leader's read_time shifted by
+        # the pad's PWM phase offset
+        for pad, control, offset in zip(self.additional_bed_heaters,
+                                        self._follower_controls,
+                                        self.pad_phase_offsets[1:]):
+            if pad.control is not control:
+                continue
+            with pad.lock:
+                target = pad.target_temp
+                value = 0.
+                if target > 0.:
+                    trim = self.follower_trim_gain * (target - pad.smoothed_temp)
+                    value = max(0., min(control.heater_max_power, leader_pwm + trim))
+                pad.set_pwm(read_time + offset, value)
+
+    def _handle_ready(self):
+        start = time.perf_counter()
+        self._load_models()
+        self._tick_timer = self.reactor.register_timer(self._control_tick, self.reactor.NOW)
+        self.startup_times['ready'] = time.perf_counter() - start
+
+    def _control_tick(self, eventtime):
+        if self.power_budget is not None and not self._calibrating:
+            self._schedule_power(eventtime)
+        if self._wait_completion is not None:
+            self._check_wait(eventtime)
+        self._update_telemetry(eventtime)
+        return eventtime + TICK_INTERVAL
+
+    def _update_telemetry(self, eventtime):
+        # Build a fresh status dict once per tick; get_status() hands out this
+        # same object until the next tick (a new object is needed so status
+        # subscribers can see nested values change)
+        pads = {}
+        temps = []
+        heating = False
+        eta = None
+        eta_known = True
+        for stats, model, tolerance, limit in zip(self.telemetry, self.models,
+                                                  self.pad_tolerances,
+                                                  self.pad_power_limits):
+            temp, target = stats.heater.get_temp(eventtime)
+            model.sample(eventtime, temp, target, tolerance, limit)
+            if target > 0.:
+                pad_eta = model.predict(temp, target - tolerance, limit)
+                if pad_eta is None:
+                    eta_known = False
+                else:
+                    eta = max(eta or 0., pad_eta)
+            stats.add_sample(temp)
+            stats.check_heatup(eventtime, abs(target - temp) <= tolerance)
+            heating |= stats.heatup_start is not None
+            temps.append(temp)
+            pads[stats.name] = stats.get_status(temp, target)
+        if not heating and self._heatup_start is not None:
+            self.time_to_target = eventtime - self._heatup_start
+            self._heatup_start = None
+            self._save_models()
+        self._status = {
+            'pads': pads,
+            'spread': round(max(temps) - min(temps), 2),
+            'time_to_target': self.time_to_target,
+            'waiting_on': self.waiting_on,
+            'power_limits': list(self.pad_power_limits),
+            'heatup_eta': round(eta, 1) if eta is not None and eta_known else None,
+            'predicted_heatup': self.predicted_heatup,
+        }
+
+    def _note_heatup(self, eventtime, targets):
+        # Start timing the pads that have to heat up to their new target
+        # (None: target unchanged, keep timing that pad)
+        started = False
+        for stats, tolerance, target in zip(self.telemetry, self.pad_tolerances, targets):
+            if target is None:
+                continue
+            temp = stats.heater.get_temp(eventtime)[0]
+            if target > 0. and target - temp > tolerance:
+                stats.start_heatup(eventtime)
+                started = True
+            else:
+                stats.heatup_start = None
+        if started:
+            if self._heatup_start is None or None not in targets:
+                self._heatup_start = eventtime
+        elif all(stats.heatup_start is None for stats in self.telemetry):
+            self._heatup_start = None
+
+    def get_status(self, eventtime):
+        return self._status
+
+    def _load_models(self):
+        save_variables = self.printer.lookup_object('save_variables', None)
+        if save_variables is None:
+            return
+        states = save_variables.allVariables.get(MODEL_VARIABLE, {})
+        for model in self.models:
+            state = states.get(model.heater.get_name().split()[-1])
+            if state is not None:
+                model.set_state(state)
+
+    def _save_models(self):
+        # Keep what was learned across restarts, once per completed heat-up
+        save_variables = self.printer.lookup_object('save_variables', None)
+        if save_variables is None:
+            return
+        variables = dict(save_variables.allVariables)
+        variables[MODEL_VARIABLE] = {
+            model.heater.get_name().split()[-1]: model.get_state()
+            for model in self.models}
+        varfile = configparser.ConfigParser()
+        varfile.add_section('Variables')
+        for name, val in sorted(variables.items()):
+            varfile.set('Variables', name, repr(val))
+        try:
+            with open(save_variables.filename, "w") as f:
+                varfile.write(f)
+        except IOError:
+            logging.exception("quad_pad_bed_heater: unable to save heat-up model")
+            return
+        save_variables.loadVariables()
+
+    def _heatup_power_limits(self):
+        # Power each pad gets while the whole bed heats up together
+        if self.power_budget is None:
+            return list(self._pad_max_power)
+        return _allocate_power([1.] * len(self.pads), self._pad_max_power,
+                               self.power_budget / self.pad_power)
+
+    def _check_wait(self, eventtime):
+        # Find the pad furthest out of its band; the wait is over when none is
+        holdout = None
+        worst = 0.
+        for pad, tolerance in zip(self.pads, self.pad_tolerances):
+            temp, target = pad.get_temp(eventtime)
+            if target <= 0.:
+                continue
+            excess = abs(target - temp) - tolerance
+            if excess > worst:
+                worst = excess
+                holdout = pad
+        if holdout is None or self.printer.is_shutdown():
+            self.waiting_on = None
+            self._wait_completion.complete(True)
+            return
+        self.waiting_on = holdout.get_name().split()[-1]
+        self._wait_gcmd.respond_raw("%s waiting on %s" % (
+            self._temp_report(eventtime), self.waiting_on))
+
+    def _temp_report(self, eventtime):
+        report = []
+        for pad in self.pads:
+            temp, target = pad.get_temp(eventtime)
+            report.append("%s:%.1f /%.1f" % (pad.get_name().split()[-1], temp, target))
+        return " ".join(report)
+
+    def _wait_for_pads(self, gcmd):
+        # Block the command until every pad is within its tolerance. The
+        # control tick does the checking, reports the pad temperatures and
+        # completes the wait.
+        if self.printer.get_start_args().get('debugoutput') is not None:
+            return
+        # Flush the queued moves first, like heaters.set_temperature(wait=True)
+        self.printer.lookup_object('toolhead').get_last_move_time()
+        self._wait_gcmd = gcmd
+        self._wait_completion = completion = self.reactor.completion()
+        self.reactor.update_timer(self._tick_timer, self.reactor.NOW)
+        try:
+            completion.wait()
+        finally:
+            self._wait_completion = None
+            self._wait_gcmd = None
+
+    def _schedule_power(self, eventtime):
+        # Share the budget between the pads as limits on their duty. Every
+        # heating pad first gets the duty it last needed to hold its band, the
+        # rest favours the pads furthest from their target. The PWM phase
+        # offsets spread the resulting on-times over the cycle.
+        if self.power_budget is None:
+            return
+        weights = []
+        floors = []
+        for i, (pad, tolerance) in enumerate(zip(self.pads, self.pad_tolerances)):
+            temp, target = pad.get_temp(eventtime)
+            if target <= 0.:
+                self.pad_hold_duty[i] = 0.
+                weights.append(0.)
+                floors.append(0.)
+                continue
+            if abs(target - temp) <= tolerance:
+                self.pad_hold_duty[i] = pad.last_pwm_value
+            weights.append(max(target - temp, 1.))
+            floors.append(self.pad_hold_duty[i])
+        budget = self.power_budget / self.pad_power
+        limits = _allocate_power(weights, self._pad_max_power, budget, floors)
+        # Lower limits first so the sum never transiently exceeds the budget
+        order = sorted(range(len(self.pads)),
+                       key=lambda i: limits[i] - self.pad_power_limits[i])
+        for i in order:
+            self._set_power_limit(i, limits[i])
+
+    def _set_power_limit(self, index, limit):
+        pad = self.pads[index]
+        self.pad_power_limits[index] = limit
+        control = pad.control
+        if hasattr(control, 'heater_max_power'):
+            with pad.lock:
+                control.heater_max_power = limit
 
     # def cmd_SET_HEATER_TEMPERATURE(self, gcmd, wait=False):
     #     temp = gcmd.get_float('TARGET', 0.)
@@ -41,22 +491,74 @@ class QuadPadBedHeater():
     #     for pad in self.additional_bed_heaters:
     #         pheaters.set_temperature(pad, temp)
 
+    def set_pad_targets(self, targets):
+        '''
+        Set the target of every pad (same order as self.pads) in one batch:
+        heat-up timing and power budget are updated once for the whole bed.
+        A None target leaves that pad unchanged.
+        '''
+        pheaters = self.printer.lookup_object('heaters')
+        for pad, target in zip(self.pads, targets):
+            if target is not None:
+                pheaters.set_temperature(pad, target)
+        eventtime = self.reactor.monotonic()
+        self._note_heatup(eventtime, targets)
+        # Hand out the budget right away instead of waiting for the next tick
+        if not self._calibrating:
+            self._schedule_power(eventtime)
+
+    def set_pad_target(self, pad, target):
+        '''
+        Set the target of a single pad (one of self.pads), keeping the
+        heat-up timing and power budget of the bed up to date.
+        '''
+        self.set_pad_targets([target if p is pad else None for p in self.pads])
+
     cmd_m140_help = 'M140 <S> This command has been superseded by the quad_pad_bed_heater module in order to provide better support for multi-pad bed heating.'
     def cmd_M140(self, gcmd, wait=False):
         # Set Bed Temperature
         temp = gcmd.get_float('S', 0.)
-        pheaters = self.printer.lookup_object('heaters')
-        for pad in self.additional_bed_heaters:
-            pheaters.set_temperature(pad, temp)
-        pheaters.set_temperature(self.main_bed_heater.heater, temp, wait)
+        self.set_pad_targets([temp] * len(self.pads))
+        if wait and temp:
+            self._wait_for_pads(gcmd)
 
     cmd_m190_help = 'M190 <S> This command has been superseded by the quad_pad_bed_heater module in order to provide better support for multi-pad bed heating.'
     def cmd_M190(self, gcmd):
         # Set Bed Temperature and Wait
         self.cmd_M140(gcmd, wait=True)
 
+    cmd_predict_bed_heatup_help = 'PREDICT_BED_HEATUP TARGET=<temp> [FROM=<temp>] Predict the seconds needed for every pad to reach TARGET from the learned heat-up model.'
+    def cmd_PREDICT_BED_HEATUP(self, gcmd):
+        target = gcmd.get_float('TARGET', above=0.)
+        from_temp = gcmd.get_float('FROM', None)
+        eventtime = self.reactor.monotonic()
+        msg = []
+        bed_eta = 0.
+        for model, tolerance, limit in zip(self.models, self.pad_tolerances,
+                                           self._heatup_power_limits()):
+            name = model.heater.get_name().split()[-1]
+            temp = from_temp
+            if temp is None:
+                temp = model.heater.get_temp(eventtime)[0]
+            pad_eta = model.predict(temp, target - tolerance, limit)
+            if pad_eta is None:
+                bed_eta = None
+                msg.append("%s: not enough heat-up history" % (name,))
+                continue
+            if bed_eta is not None:
+                bed_eta = max(bed_eta, pad_eta)
+            msg.append("%s: %.0fs from %.1f" % (name, pad_eta, temp))
+        self.predicted_heatup = {'target': target,
+                                 'seconds': None if bed_eta is None else round(bed_eta, 1)}
+        if bed_eta is None:
+            msg.append("Bed heat-up time to %.1f unknown" % (target,))
+        else:
+            msg.append("Bed expected to reach %.1f in %.0fs" % (target, bed_eta))
+        gcmd.respond_info("\n".join(msg))
+
     cmd_pid_calibrate_help = 'PID_CALIBRATE <HEATER> <TARGET> [WRITE_FILE=<0|1>] This command has been superseded by the quad_pad_bed_heater module in order to provide better support for multi-pad bed heating.'
     def cmd_PID_CALIBRATE(self, gcmd):
+        from extras.pid_calibrate import ControlAutoTune
         heater_name = gcmd.get('HEATER')
         target = gcmd.get_float('TARGET')
         write_file = gcmd.get_int('WRITE_FILE', 0)
@@ -66,45 +568,82 @@ class QuadPadBedHeater():
         except self.printer.config_error as e:
             raise gcmd.error(str(e))
         self.printer.lookup_object('toolhead').get_last_move_time()
-        calibrate = ControlAutoTune(heater, target)
-        old_control = heater.set_control(calibrate)
+        # Calibrating the bed tunes every pad in the same heat cycle
+        heaters = [heater]
         if heater_name == 'heater_bed':
-            for pad in self.additional_bed_heaters:
-                exec(f'calibrate{self.additional_bed_heaters.index(pad)} =  ControlAutoTune(pad, target)')
-                exec(f'old_control{self.additional_bed_heaters.index(pad)} =  pad.set_control(calibrate{self.additional_bed_heaters.index(pad)})')
+            heaters.extend(self.additional_bed_heaters)
+        # The budget scheduler is held off while tuning: the pads under test
+        # share what the other pads leave of the budget, as a fixed limit so
+        # the autotune sees a constant heater power
+        self._calibrating = True
+        calibrations = [ControlAutoTune(h, target) for h in heaters]
+        if self.power_budget is not None and heater in self.pads:
+            indexes = [self.pads.index(h) for h in heaters]
+            others = sum(limit for i, limit in enumerate(self.pad_power_limits)
+                         if i not in indexes)
+            budget = max(0., self.power_budget / self.pad_power - others)
+            limits = _allocate_power([1.] * len(heaters),
+                                     [self._pad_max_power[i] for i in indexes],
+                                     budget)
+            for i, calibrate, limit in zip(indexes, calibrations, limits):
+                calibrate.heater_max_power = limit
+                self.pad_power_limits[i] = limit
+        old_controls = [h.set_control(c) for h, c in zip(heaters, calibrations)]
         try:
-            if heater_name == 'heater_bed':
-                for pad in self.additional_bed_heaters:
-                    pheaters.set_temperature(pad, target)
-            pheaters.set_temperature(heater, target, True)
-        except self.printer.command_error as e:
-            heater.set_control(old_control)
-            if heater_name == 'heater_bed':
-                for pad in self.additional_bed_heaters:
-                    exec(f'pad.set_control(old_control{self.additional_bed_heaters.index(pad)})')
-            raise
-        heater.set_control(old_control)
-        if heater_name == 'heater_bed':
-            for pad in self.additional_bed_heaters:
-                exec(f'pad.set_control(old_control{self.additional_bed_heaters.index(pad)})')
+            for h in heaters:
+                pheaters.set_temperature(h, target)
+            durations = self._wait_for_autotune(gcmd, heaters, calibrations)
+        finally:
+            for h, old_control in zip(heaters, old_controls):
+                h.set_control(old_control)
+            self._calibrating = False
         if write_file:
-            calibrate.write_file('/tmp/heattest.txt')
-        if calibrate.check_busy(0., 0., 0.):
+            calibrations[0].write_file('/tmp/heattest.txt')
+            for h, calibrate in zip(heaters[1:], calibrations[1:]):
+                suffix = h.get_name().split()[-1]
+                calibrate.write_file('/tmp/heattest_%s.txt' % (suffix,))
+        if any(c.check_busy(0., 0., 0.) for c in calibrations):
             raise gcmd.error("pid_calibrate interrupted")
-        # Log and report results
-        Kp, Ki, Kd = calibrate.calc_final_pid()
-        logging.info("Autotune: final: Kp=%f Ki=%f Kd=%f", Kp, Ki, Kd)
+        # Log and report results, then store them for SAVE_CONFIG
+        configfile = self.printer.lookup_object('configfile')
+        for h, calibrate in zip(heaters, calibrations):
+            Kp, Ki, Kd = calibrate.calc_final_pid()
+            cfgname = h.get_name()
+            logging.info("Autotune %s: final: Kp=%f Ki=%f Kd=%f", cfgname, Kp, Ki, Kd)
+            gcmd.respond_info(
+                "%s PID parameters: pid_Kp=%.3f pid_Ki=%.3f pid_Kd=%.3f"
+                % (cfgname, Kp, Ki, Kd))
+            configfile.set(cfgname, 'control', 'pid')
+            configfile.set(cfgname, 'pid_Kp', "%.3f" % (Kp,))
+            configfile.set(cfgname, 'pid_Ki', "%.3f" % (Ki,))
+            configfile.set(cfgname, 'pid_Kd', "%.3f" % (Kd,))
+        if len(heaters) > 1:
+            elapsed = max(durations)
+            sequential = sum(durations)
+            gcmd.respond_info(
+                "Tuned %d pads concurrently in %.0fs (sequential runs: ~%.0fs, saved ~%.0fs)"
+                % (len(heaters), elapsed, sequential, sequential - elapsed))
         gcmd.respond_info(
-            "PID parameters: pid_Kp=%.3f pid_Ki=%.3f pid_Kd=%.3f\n"
             "The SAVE_CONFIG command will update the printer config file\n"
-            "with these parameters and restart the printer." % (Kp, Ki, Kd))
-        # Store results for SAVE_CONFIG
-        cfgname = heater.get_name()
-        configfile = self.printer.lookup_object('configfile')
-        configfile.set(cfgname, 'control', 'pid')
-        configfile.set(cfgname, 'pid_Kp', "%.3f" % (Kp,))
-        configfile.set(cfgname, 'pid_Ki', "%.3f" % (Ki,))
-        configfile.set(cfgname, 'pid_Kd', "%.3f" % (Kd,))
+            "with these parameters and restart the printer.")
+
+    def _wait_for_autotune(self, gcmd, heaters, calibrations):
+        # Wait until every autotune controller has collected its peaks and
+        # return the time each one needed
+        reactor = self.printer.get_reactor()
+        start = eventtime = reactor.monotonic()
+        durations = [None] * len(calibrations)
+        while not self.printer.is_shutdown():
+            for i, calibrate in enumerate(calibrations):
+                if durations[i] is None and not calibrate.check_busy(eventtime, 0., 0.):
+                    durations[i] = eventtime - start
+            if None not in durations:
+                break
+            gcmd.respond_raw(" ".join(
+                "%s:%.1f" % (h.get_name().split()[-1], h.get_temp(eventtime)[0])
+                for h in heaters))
+            eventtime = reactor.pause(eventtime + 1.)
+        return [d if d is not None else eventtime - start for d in durations]
 
 def load_config(config):
     return QuadPadBedHeater(config)
@@ -4,74 +4,293 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 
+import json
 import logging
+import os
+import queue
+import threading
+import time
+
+from .uboe_status import register_status
 
 logger = logging.getLogger(__name__)
 
+# Minimum time ahead of the MCU clock at which a brake change is scheduled
+BRAKE_SCHEDULE_MARGIN = 0.050
+
+
+class BrakeStatsLog:
+    """Brake cycle counters of one group, persisted to a JSON file.
+
+    Transitions only update in-memory counters. A flush snapshots them on
+    the reactor and hands the snapshot to a background writer thread, so
+    the enable/disable callback path never touches the disk.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.cycles = 0
+        self.released_time = 0.
+        self.last_transition = None
+        self.released_since = None
+        self._dirty = False
+        self._queue = None
+        self._write_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+            self.cycles = int(data.get("cycles", 0))
+            self.released_time = float(data.get("released_time", 0.))
+            self.last_transition = data.get("last_transition")
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.exception(f"Unable to read brake stats from {self.filename}")
+
+    def note_transition(self, print_time, engage):
+        if engage:
+            self.cycles += 1
+            if self.released_since is not None:
+                self.released_time += max(0., print_time - self.released_since)
+                self.released_since = None
+        else:
+            self.released_since = print_time
+        self.last_transition = time.time()
+        self._dirty = True
+
+    def get_released_time(self, print_time):
+        if self.released_since is None:
+            return self.released_time
+        return self.released_time + max(0., print_time - self.released_since)
+
+    def _snapshot(self):
+        return {
+            "cycles": self.cycles,
+            "released_time": round(self.released_time, 3),
+            "last_transition": self.last_transition,
+        }
+
+    def flush(self):
+        """Queue the current counters for the writer thread (if changed)."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        if self._queue is None:
+            self._queue = queue.SimpleQueue()
+            threading.Thread(target=self._writer, daemon=True,
+                             name="stepper_brake_stats").start()
+        self._queue.put(self._snapshot())
+
+    def write_now(self):
+        """Synchronous write (if changed), used on host disconnect."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        self._write(self._snapshot())
+
+    def _writer(self):
+        while True:
+            snapshot = self._queue.get()
+            # Only the latest snapshot matters if several were queued
+            while not self._queue.empty():
+                snapshot = self._queue.get()
+            self._write(snapshot)
+
+    def _write(self, snapshot):
+        tmp = self.filename + ".tmp"
+        with self._write_lock:
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp, self.filename)
+            except Exception:
+                logger.exception(f"Unable to write brake stats to {self.filename}")
+
+
+class BrakeRegistry:
+    """Module-level index of the configured [stepper_brake] groups.
+
+    The permanently-installed PrinterStepper patch and the shared
+    STEPPER_BRAKE_* commands resolve a stepper's group here with a single
+    dict lookup, so any number of brake sections can coexist.
+    """
+
+    def __init__(self):
+        self.printer = None
+        self.groups = {}
+        self.by_stepper = {}
+
+    def add_group(self, brake):
+        """Index a new brake group; returns True for the first group of a config load."""
+        if brake.printer is not self.printer:
+            # New config load (startup or FIRMWARE_RESTART): drop stale groups
+            self.printer = brake.printer
+            self.groups = {}
+            self.by_stepper = {}
+        for stepper_name in brake.stepper_names:
+            other = self.by_stepper.get(stepper_name)
+            if other is not None:
+                raise brake.printer.config_error(
+                    f"Stepper '{stepper_name}' is used by both [{other.name}] and [{brake.name}]"
+                )
+            self.by_stepper[stepper_name] = brake
+        self.groups[brake.short_name] = brake
+        return len(self.groups) == 1
+
+    def lookup_stepper(self, stepper_name):
+        """Brake group of a stepper, accepting short names (``z`` for ``stepper_z``)."""
+        group = self.by_stepper.get(stepper_name)
+        if group is None:
+            group = self.by_stepper.get(f"stepper_{stepper_name}")
+        return group
+
+    def _lookup_group(self, gcmd):
+        stepper_name = gcmd.get("STEPPER", None)
+        if stepper_name is None:
+            raise gcmd.error("STEPPER parameter required")
+        group = self.lookup_stepper(stepper_name)
+        if group is None:
+            raise gcmd.error(f"Stepper '{stepper_name}' not found in brake configuration")
+        return group
+
+    def cmd_STEPPER_BRAKE_ENGAGE(self, gcmd):
+        self._lookup_group(gcmd).cmd_STEPPER_BRAKE_ENGAGE(gcmd)
+
+    def cmd_STEPPER_BRAKE_RELEASE(self, gcmd):
+        self._lookup_group(gcmd).cmd_STEPPER_BRAKE_RELEASE(gcmd)
+
+    def cmd_STEPPER_BRAKE_STATUS(self, gcmd):
+        for group in self.groups.values():
+            group.cmd_STEPPER_BRAKE_STATUS(gcmd)
+
+
+_registry = BrakeRegistry()
+
+
 class StepperBrake:
     """Klipper plugin to control stepper brakes.
 
     Config example:
      [stepper_brake xz_brakes]
-     pin: PB4
+     pin: PB4                  # or several pins: PB4, EBBCan:PA1
      stepper: stepper_x, stepper_z
      release_on_move: True
      engage_on_motor_off: True
+     release_lead_time: 0.05
+     engage_delay: 0.5
     """
 
-    # Updated on each init so the permanently-installed PrinterStepper patch
-    # closure always routes stepper registration to the current instance.
-    _current_instance = None
-
     def __init__(self, config):
+        start = time.perf_counter()
         logger.info("StepperBrake.__init__ called")
         self.printer = config.get_printer()
         self.name = config.get_name()
-        self.pin = config.get("pin")
+        self.short_name = self.name.split()[-1]
+        # One pin, or several pins (possibly on different MCUs) driven together
+        self.pins = config.getlist("pin")
         self.stepper_names = config.getlist("stepper", [])
         self.release_on_move = config.getboolean("release_on_move", True)
         self.engage_on_motor_off = config.getboolean("engage_on_motor_off", True)
+        # Time the electromagnet needs to fully release before the motor moves
+        self.release_lead_time = config.getfloat("release_lead_time", 0., minval=0., maxval=0.5)
+        self._last_pin_time = 0.
+        self.release_count = 0
+        self.last_added_latency = 0.
+        self.max_added_latency = 0.
+        self.total_added_latency = 0.
+        # Automatic releases that came too late to meet the lead time
+        self.missed_lead_count = 0
+        self.max_missed_lead = 0.
+        self._scan_time = 0.
+        # Spare time the last release had before the lead time was at risk
+        self._release_slack = 0.
+        # Hysteresis: delay the engage so short motor-off gaps don't cycle the brake
+        self.engage_delay = config.getfloat("engage_delay", 0., minval=0.)
+        self._pending_engage_time = None
+        self._engage_timer = self.printer.get_reactor().register_timer(
+            self._handle_engage_timer)
+        # Cycle counters, flushed to disk in batches
+        config_dir = os.path.dirname(self.printer.get_start_args().get("config_file", ""))
+        default_stats = os.path.join(config_dir, f"stepper_brake_{self.short_name}.json")
+        self.stats = BrakeStatsLog(os.path.expanduser(config.get("stats_file", default_stats)))
+        self.stats_flush_interval = config.getfloat("stats_flush_interval", 60., above=0.)
+        self._stats_timer = self.printer.get_reactor().register_timer(self._handle_stats_timer)
         self.brake_configs = []
+        # Aggregate brake state: one bit per braked stepper plus the pin state
+        self._stepper_bits = {}
+        self._all_mask = 0
+        self._engaged_mask = 0
+        self._pin_engaged = True
+        self._last_enable_event = None
         self.initialized = False
         self._stepper_enable_hooked = False
         self._patched = False
-        self._pin_obj = None  # Reference to output_pin object
-        logger.info(f"StepperBrake initialized: name={self.name}, pin={self.pin}, steppers={self.stepper_names}")
+        self._pin_objs = []  # digital_out pin objects, one per configured pin
+        self._mcus = []  # distinct MCUs of those pins
+        self.last_estimated_skew = 0.
+        self.max_estimated_skew = 0.
+        # Status published only on change (see uboe_status)
+        self.status = register_status(self.printer, self.name)
+        self._publish_status()
+        logger.info(f"StepperBrake initialized: name={self.name}, pins={self.pins}, steppers={self.stepper_names}")
+
+        # Index this group so stepper registration and the shared commands
+        # can find it (a new config load starts a fresh index).
+        first_group = _registry.add_group(self)
 
         # Register G-code commands immediately
-        self._register_gcode_commands()
+        self._register_gcode_commands(first_group)
 
         # Create output_pin object programmatically
         self._create_output_pin()
 
-        # On MCU reset a new StepperBrake instance is created; updating the
-        # class-level reference ensures the closure routes to the new instance.
-        StepperBrake._current_instance = self
-
         # Patch stepper module immediately (might fail if not loaded yet, that's OK)
         self._patch_stepper_module()
 
         # Also register event handler to try again after printer is ready as fallback
         self.printer.register_event_handler("klippy:ready", self._on_printer_ready)
         self.printer.register_event_handler("klippy:shutdown", self._on_printer_shutdown)
+        self.printer.register_event_handler("klippy:disconnect", self._on_printer_disconnect)
+        self.startup_times = {'config': time.perf_counter() - start}
 
     def _create_output_pin(self):
-        """Create a GPIO output pin."""
-        try:
-            ppins = self.printer.lookup_object("pins")
-            self._pin_obj = ppins.setup_pin("digital_out", self.pin)
-            # Disable max_duration (default 2s causes "exceed max_duration" shutdown
-            # when pin changes are scheduled far ahead via register_lookahead_callback)
-            self._pin_obj.setup_max_duration(0)
-            # Logical 1 XOR invert=True → physical LOW → electromagnet OFF → ENGAGED.
-            # Both start and shutdown values are 1 so the brake is engaged at
-            # boot and on any emergency stop / MCU shutdown.
-            self._pin_obj.setup_start_value(1, 1)
-            logger.debug(f"Created GPIO output pin for {self.pin}")
-        except Exception as e:
-            raise self.printer.config_error(
-                f"Failed to setup GPIO pin {self.pin}: {e}"
-            )
+        """Create the GPIO output pins."""
+        ppins = self.printer.lookup_object("pins")
+        for pin in self.pins:
+            try:
+                pin_obj = ppins.setup_pin("digital_out", pin)
+                # Disable max_duration (default 2s causes "exceed max_duration" shutdown
+                # when pin changes are scheduled far ahead via register_lookahead_callback)
+                pin_obj.setup_max_duration(0)
+                # Logical 1 XOR invert=True → physical LOW → electromagnet OFF → ENGAGED.
+                # Both start and shutdown values are 1 so the brake is engaged at
+                # boot and on any emergency stop / MCU shutdown.
+                pin_obj.setup_start_value(1, 1)
+                logger.debug(f"Created GPIO output pin for {pin}")
+            except Exception as e:
+                raise self.printer.config_error(
+                    f"Failed to setup GPIO pin {pin}: {e}"
+                )
+            self._pin_objs.append(pin_obj)
+            mcu = pin_obj.get_mcu()
+            if mcu not in self._mcus:
+                self._mcus.append(mcu)
+
+    def _estimated_print_time(self, eventtime):
+        """Latest of the brake MCUs' print time estimates (safe scheduling bound)."""
+        return max(mcu.estimated_print_time(eventtime) for mcu in self._mcus)
+
+    def _estimated_skew(self, eventtime):
+        """Spread of the brake MCUs' print time estimates for the same host
+        time. This is the disagreement of their clock estimates, not a
+        measurement of when the pins actually switch."""
+        if len(self._mcus) < 2:
+            return 0.
+        estimates = [mcu.estimated_print_time(eventtime) for mcu in self._mcus]
+        return max(estimates) - min(estimates)
 
     def _on_printer_shutdown(self):
         """Called on emergency stop / klippy shutdown.
@@ -81,24 +300,48 @@ class StepperBrake:
         needed here.  This handler just syncs the software state flags so
         STEPPER_BRAKE_STATUS reflects reality after a restart.
         """
-        for cfg in self.brake_configs:
-            cfg['stepper']._brake_engaged = True
+        self._cancel_pending_engage()
+        if not self._pin_engaged:
+            eventtime = self.printer.get_reactor().monotonic()
+            print_time = self._estimated_print_time(eventtime)
+            self.stats.note_transition(print_time, True)
+        self._pin_engaged = True
+        self._engaged_mask = self._all_mask
+        self._last_enable_event = None
+        self._publish_status()
         logger.info("Emergency stop: brake state flags set to ENGAGED")
 
+    def _on_printer_disconnect(self):
+        """Write the brake counters one last time when klippy exits."""
+        self.stats.write_now()
+
+    def _handle_stats_timer(self, eventtime):
+        self.stats.flush()
+        return eventtime + self.stats_flush_interval
+
     def _on_printer_ready(self):
         """Called when printer is ready: patch stepper module and hook
         stepper_enable callbacks for auto engage/release."""
+        start = time.perf_counter()
         if not self._patched:
             self._patch_stepper_module()
         if not self._stepper_enable_hooked:
             self._hook_stepper_enable()
+        reactor = self.printer.get_reactor()
+        reactor.update_timer(self._stats_timer, reactor.monotonic() + self.stats_flush_interval)
+        if self.release_lead_time:
+            # Generate steps (and thus the enable callback) far enough ahead
+            # that the release fits before the move. The toolhead also adds
+            # this scan time to the start of the first move after idle.
+            self._set_scan_time(self.release_lead_time + BRAKE_SCHEDULE_MARGIN)
+        self.startup_times['ready'] = time.perf_counter() - start
 
     def _patch_stepper_module(self):
         """Monkey-patch the stepper module to integrate our helper registration."""
         try:
             from .. import stepper
 
-            # If already patched by us, just update the class ref and skip re-wrapping
+            # If already patched by us, the registry routes to the new groups; skip re-wrapping
             if getattr(stepper.PrinterStepper, '_stepper_brake_patched', False):
                 logger.info("stepper.PrinterStepper already patched, skipping re-wrap")
                 self._patched = True
@@ -109,12 +352,10 @@ class StepperBrake:
             def patched_PrinterStepper(config, units_in_radians=False):
                 mcu_stepper = original_PrinterStepper(config, units_in_radians)
                 stepper_name = mcu_stepper.get_name()
-                logger.info(f"Patched PrinterStepper called for {stepper_name}, calling hook")
-                instance = StepperBrake._current_instance
-                if instance is not None:
-                    instance.register_stepper(config, mcu_stepper)
-                else:
-                    logger.warning("No StepperBrake instance available, cannot register stepper")
+                group = _registry.by_stepper.get(stepper_name)
+                if group is not None:
+                    logger.info(f"Patched PrinterStepper called for {stepper_name}, routing to {group.name}")
+                    group.register_stepper(config, mcu_stepper)
                 return mcu_stepper
 
             patched_PrinterStepper._stepper_brake_patched = True
@@ -146,15 +387,106 @@ class StepperBrake:
             logger.info(f"Stepper brakes fully initialized with {len(self.brake_configs)} steppers")
 
     def _augment_stepper_with_brake(self, stepper):
-        """Tag a stepper so its brake state can be tracked."""
-        stepper._brake_engaged = True  # Default to engaged at startup
-        self.brake_configs.append({'stepper': stepper, 'name': stepper.get_name()})
+        """Give a stepper a bit in the engaged mask so its brake state can be tracked."""
+        name = stepper.get_name()
+        if name in self._stepper_bits:
+            return
+        bit = 1 << len(self.brake_configs)
+        self._stepper_bits[name] = bit
+        self._all_mask |= bit
+        self._engaged_mask |= bit  # Default to engaged at startup
+        self.brake_configs.append({'stepper': stepper, 'name': name, 'bit': bit})
+        self._publish_status()
 
     def _set_all_brakes(self, print_time, engage):
-        """Set the shared brake pin and sync all per-stepper state flags."""
-        self._pin_obj.set_digital(print_time, 1 if engage else 0)
-        for cfg in self.brake_configs:
-            cfg['stepper']._brake_engaged = engage
+        """Set the shared brake pin and the aggregate state."""
+        self._cancel_pending_engage()
+        if engage != self._pin_engaged:
+            self.stats.note_transition(print_time, engage)
+        # Same print_time on every pin: each MCU converts it to its own clock
+        value = 1 if engage else 0
+        for pin_obj in self._pin_objs:
+            pin_obj.set_digital(print_time, value)
+        if len(self._mcus) > 1:
+            self.last_estimated_skew = self._estimated_skew(self.printer.get_reactor().monotonic())
+            self.max_estimated_skew = max(self.max_estimated_skew, self.last_estimated_skew)
+        self._last_pin_time = print_time
+        self._pin_engaged = engage
+        self._engaged_mask = self._all_mask if engage else 0
+        self._publish_status()
+
+    def _schedule_engage(self, print_time):
+        """Engage the brakes engage_delay after print_time unless the motors
+        are enabled again before then."""
+        if self._pending_engage_time is not None:
+            return
+        self._pending_engage_time = engage_time = print_time + self.engage_delay
+        reactor = self.printer.get_reactor()
+        eventtime = reactor.monotonic()
+        est_print_time = self._estimated_print_time(eventtime)
+        waketime = eventtime + max(0., engage_time - BRAKE_SCHEDULE_MARGIN - est_print_time)
+        reactor.update_timer(self._engage_timer, waketime)
+
+    def _cancel_pending_engage(self):
+        if self._pending_engage_time is not None:
+            self._pending_engage_time = None
+            reactor = self.printer.get_reactor()
+            reactor.update_timer(self._engage_timer, reactor.NEVER)
+
+    def _handle_engage_timer(self, eventtime):
+        engage_time = self._pending_engage_time
+        if engage_time is not None:
+            est_print_time = self._estimated_print_time(eventtime)
+            engage_time = max(engage_time, est_print_time + BRAKE_SCHEDULE_MARGIN,
+                              self._last_pin_time)
+            self._set_all_brakes(engage_time, True)
+            logger.debug("Auto-engaged brakes after engage_delay")
+        return self.printer.get_reactor().NEVER
+
+    def _release_ahead(self, move_time):
+        """Release the brakes release_lead_time ahead of move_time.
+
+        The release is never scheduled before the MCU can act on it (or
+        before the previous brake change). Returns the part of the lead time
+        that could not be met, i.e. the delay the move would need to start
+        on a fully released brake.
+        """
+        if not self.release_lead_time:
+            self._set_all_brakes(move_time, False)
+            return 0.
+        eventtime = self.printer.get_reactor().monotonic()
+        earliest = max(self._estimated_print_time(eventtime) + BRAKE_SCHEDULE_MARGIN,
+                       self._last_pin_time)
+        release_time = min(move_time, max(move_time - self.release_lead_time, earliest))
+        self._set_all_brakes(release_time, False)
+        self.release_count += 1
+        self._release_slack = max(0., move_time - self.release_lead_time - earliest)
+        return max(0., release_time + self.release_lead_time - move_time)
+
+    def _set_scan_time(self, scan_time):
+        toolhead = self.printer.lookup_object("toolhead")
+        toolhead.note_step_generation_scan_time(scan_time, self._scan_time)
+        self._scan_time = scan_time
+
+    def _adjust_scan_time(self, delta):
+        """Change the scan time by delta, between the configured scan time
+        and twice that. It grows by a missed lead time and shrinks back by
+        the spare time of later releases, so the extra delay on every
+        toolhead resync and flush doesn't outlive the need for it."""
+        base = self.release_lead_time + BRAKE_SCHEDULE_MARGIN
+        scan_time = min(max(self._scan_time + delta, base), 2. * base)
+        if scan_time != self._scan_time:
+            self._set_scan_time(scan_time)
+
+    def _note_added_latency(self, added):
+        """Account for a delay actually inserted before the next move."""
+        self.last_added_latency = added
+        self.max_added_latency = max(self.max_added_latency, added)
+        self.total_added_latency += added
+
+    def is_engaged(self, stepper_name):
+        """Brake state of one braked stepper."""
+        return bool(self._engaged_mask & self._stepper_bits[stepper_name])
 
     def _hook_stepper_enable(self):
         """Register state callbacks on stepper_enable to engage brakes on M84/M18."""
@@ -185,55 +517,91 @@ class StepperBrake:
         stepper enable pin itself. No lookahead indirection needed.
 
         The callback is registered for every braked stepper, so it fires once
-        per stepper per event. The any_engaged/any_released guards ensure the
-        shared brake pin is only written once regardless of stepper count.
+        per stepper per event. Repeats of the same (print_time, is_enabled)
+        event are dropped and the aggregate pin flag ensures the shared brake
+        pin is only written once regardless of stepper count.
         """
+        event = (print_time, is_enabled)
+        if event == self._last_enable_event:
+            return
+        self._last_enable_event = event
         if is_enabled:
-            if self.release_on_move and any(
-                cfg['stepper']._brake_engaged for cfg in self.brake_configs
-            ):
-                self._set_all_brakes(print_time, False)
-                logger.debug("Auto-released brakes on motor enable")
+            if self._pending_engage_time is not None:
+                # Re-enabled within the engage_delay window: brake never engaged
+                self._cancel_pending_engage()
+                logger.debug("Cancelled pending brake engage on motor enable")
+            if self.release_on_move and self._pin_engaged:
+                # The steps of this move are being generated, so it can no
+                # longer be pushed back: the step generation scan time is what
+                # delays moves. A shortfall is counted (it is not latency that
+                # was added) and the scan time is extended, outside of step
+                # generation, so later moves start late enough. Releases with
+                # spare time give the extension back.
+                missed = self._release_ahead(print_time)
+                self._note_added_latency(0.)
+                reactor = self.printer.get_reactor()
+                if missed:
+                    self.missed_lead_count += 1
+                    self.max_missed_lead = max(self.max_missed_lead, missed)
+                    reactor.register_callback(
+                        lambda eventtime: self._adjust_scan_time(missed))
+                    logger.warning(f"Auto-released brakes {missed * 1000.:.1f}ms short of release_lead_time")
+                else:
+                    slack = self._release_slack
+                    if slack and self._scan_time > self.release_lead_time + BRAKE_SCHEDULE_MARGIN:
+                        reactor.register_callback(
+                            lambda eventtime: self._adjust_scan_time(-slack))
+                    logger.debug("Auto-released brakes on motor enable")
         else:
-            if self.engage_on_motor_off and any(
-                not cfg['stepper']._brake_engaged for cfg in self.brake_configs
-            ):
-                self._set_all_brakes(print_time, True)
-                logger.debug("Auto-engaged brakes on motor disable")
-
-    def _register_gcode_commands(self):
-        """Register G-code commands for manual brake control."""
+            if self.engage_on_motor_off and not self._pin_engaged:
+                if self.engage_delay:
+                    self._schedule_engage(print_time)
+                else:
+                    self._set_all_brakes(print_time, True)
+                    logger.debug("Auto-engaged brakes on motor disable")
+
+    def _register_gcode_commands(self, first_group):
+        """Register G-code commands for manual brake control.
+
+        The STEPPER_BRAKE_* commands are shared by all brake groups: the first
+        group of a config load registers them and they dispatch through the
+        registry. Each group registers its own SET_PIN mux value.
+        """
         logger.debug("_register_gcode_commands called")
         gcode = self.printer.lookup_object("gcode")
 
-        # Register STEPPER_BRAKE_ENGAGE command
-        gcode.register_command(
-            "STEPPER_BRAKE_ENGAGE",
-            self.cmd_STEPPER_BRAKE_ENGAGE,
-            desc="Engage stepper brake"
-        )
+        if first_group:
+            # Register STEPPER_BRAKE_ENGAGE command
+            gcode.register_command(
+                "STEPPER_BRAKE_ENGAGE",
+                _registry.cmd_STEPPER_BRAKE_ENGAGE,
+                desc="Engage stepper brake"
+            )
 
-        # Register STEPPER_BRAKE_RELEASE command
-        gcode.register_command(
-            "STEPPER_BRAKE_RELEASE",
-            self.cmd_STEPPER_BRAKE_RELEASE,
-            desc="Release stepper brake"
-        )
+            # Register STEPPER_BRAKE_RELEASE command
+            gcode.register_command(
+                "STEPPER_BRAKE_RELEASE",
+                _registry.cmd_STEPPER_BRAKE_RELEASE,
+                desc="Release stepper brake"
+            )
 
-        # Register STEPPER_BRAKE_STATUS command
-        gcode.register_command(
-            "STEPPER_BRAKE_STATUS",
-            self.cmd_STEPPER_BRAKE_STATUS,
-            desc="Report stepper brake status"
-        )
+            # Register STEPPER_BRAKE_STATUS command
+            gcode.register_command(
+                "STEPPER_BRAKE_STATUS",
+                _registry.cmd_STEPPER_BRAKE_STATUS,
+                desc="Report stepper brake status"
+            )
 
         # Register SET_PIN mux handler so macros can use SET_PIN PIN=<brake_name>
-        brake_name = self.name.split()[-1]
         gcode.register_mux_command(
-            "SET_PIN", "PIN", brake_name,
+            "SET_PIN", "PIN", self.short_name,
             self.cmd_SET_PIN_brake,
             desc="Set stepper brake via SET_PIN"
         )
+        # Commands profiled by uboe_profiler (every group lists the shared
+        # STEPPER_BRAKE_* ones, SET_PIN is Klipper's)
+        self.gcode_commands = ("STEPPER_BRAKE_ENGAGE", "STEPPER_BRAKE_RELEASE",
+                               "STEPPER_BRAKE_STATUS")
         logger.debug("G-code commands registered successfully")
 
     def _cmd_brake_action(self, gcmd, engage):
@@ -243,19 +611,32 @@ class StepperBrake:
         stepper_name = gcmd.get("STEPPER", None)
         if stepper_name is None:
             raise gcmd.error("STEPPER parameter required")
-        matched = any(
-            cfg['name'] == stepper_name or cfg['name'] == f"stepper_{stepper_name}"
-            for cfg in self.brake_configs
-        )
+        matched = (stepper_name in self._stepper_bits
+                   or f"stepper_{stepper_name}" in self._stepper_bits)
         if not matched:
             raise gcmd.error(f"Stepper '{stepper_name}' not found in brake configuration")
-        toolhead = self.printer.lookup_object('toolhead')
-        toolhead.register_lookahead_callback(
-            lambda pt: self._set_all_brakes(pt, engage)
-        )
+        self._apply_manual(engage)
         action = "Engaged" if engage else "Released"
         gcmd.respond_info(f"{action} brake for {stepper_name}")
 
+    def _apply_manual(self, engage):
+        """Apply a brake change requested from G-code.
+
+        Engaging goes through the lookahead queue. Releasing with a lead time
+        schedules the release ahead of the next move and only dwells for the
+        part of the lead time that could not be met.
+        """
+        toolhead = self.printer.lookup_object("toolhead")
+        if engage or not self.release_lead_time:
+            toolhead.register_lookahead_callback(
+                lambda print_time: self._set_all_brakes(print_time, engage)
+            )
+            return
+        added = self._release_ahead(toolhead.get_last_move_time())
+        if added:
+            toolhead.dwell(added)
+        self._note_added_latency(added)
+
     def cmd_STEPPER_BRAKE_ENGAGE(self, gcmd):
         """G-code command to engage brake on a specific stepper."""
         self._cmd_brake_action(gcmd, engage=True)
@@ -265,7 +646,7 @@ class StepperBrake:
         self._cmd_brake_action(gcmd, engage=False)
 
     def cmd_STEPPER_BRAKE_STATUS(self, gcmd):
-        """G-code command to report brake status for all configured steppers."""
+        """G-code command to report brake status for the steppers of this group."""
         if not self.initialized:
             raise gcmd.error("Stepper brakes not yet initialized. Wait a moment and retry.")
 
@@ -273,10 +654,58 @@ class StepperBrake:
             gcmd.respond_info("No steppers configured for brakes")
             return
 
-        gcmd.respond_info("Stepper brake status:")
+        gcmd.respond_info(f"Stepper brake status ({self.short_name}):")
         for cfg in self.brake_configs:
-            state = "ENGAGED" if cfg['stepper']._brake_engaged else "RELEASED"
+            state = "ENGAGED" if self._engaged_mask & cfg['bit'] else "RELEASED"
             gcmd.respond_info(f"  {cfg['name']}: {state}")
+        eventtime = self.printer.get_reactor().monotonic()
+        print_time = self._estimated_print_time(eventtime)
+        last = self.stats.last_transition
+        last = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last)) if last else "never"
+        gcmd.respond_info(
+            f"  cycles: {self.stats.cycles}, released time: {self.stats.get_released_time(print_time):.0f}s,"
+            f" last transition: {last}"
+        )
+        if len(self._mcus) > 1:
+            gcmd.respond_info(
+                f"  pins: {', '.join(self.pins)} on {len(self._mcus)} MCUs,"
+                f" estimated skew last {self.last_estimated_skew * 1e6:.0f}us,"
+                f" max {self.max_estimated_skew * 1e6:.0f}us"
+            )
+        if self.release_lead_time:
+            avg = self.total_added_latency / self.release_count if self.release_count else 0.
+            gcmd.respond_info(
+                f"  release lead time: {self.release_lead_time * 1000.:.1f}ms, added latency:"
+                f" last {self.last_added_latency * 1000.:.1f}ms,"
+                f" avg {avg * 1000.:.1f}ms, max {self.max_added_latency * 1000.:.1f}ms"
+                f" over {self.release_count} releases"
+            )
+            if self.missed_lead_count:
+                gcmd.respond_info(
+                    f"  lead time missed on {self.missed_lead_count} automatic releases,"
+                    f" max {self.max_missed_lead * 1000.:.1f}ms"
+                )
+
+    def _publish_status(self):
+        """Refresh the status after a brake state change (no-op if unchanged).
+
+        released_time is the total up to the last engage; while released,
+        released_since holds the print_time of the release.
+        """
+        self.status.update({
+            "engaged": self._pin_engaged,
+            "steppers": {cfg['name']: bool(self._engaged_mask & cfg['bit'])
+                         for cfg in self.brake_configs},
+            "cycles": self.stats.cycles,
+            "released_time": round(self.stats.released_time, 1),
+            "released_since": self.stats.released_since,
+            "last_transition": self.stats.last_transition,
+            "estimated_skew": self.last_estimated_skew,
+            "max_estimated_skew": self.max_estimated_skew,
+        })
+
+    def get_status(self, eventtime):
+        return self.status.get()
 
     def cmd_SET_PIN_brake(self, gcmd):
         """Handle SET_PIN PIN=<brake_name> VALUE=0/1 from macros.
@@ -287,10 +716,7 @@ class StepperBrake:
         """
         value = gcmd.get_float("VALUE", minval=0.0, maxval=1.0)
         engage = value < 0.5
-        toolhead = self.printer.lookup_object("toolhead")
-        toolhead.register_lookahead_callback(
-            lambda print_time: self._set_all_brakes(print_time, engage)
-        )
+        self._apply_manual(engage)
 
 
 def load_config_prefix(config):
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# Per-handler latency and allocation benchmark of the uboe plugins
+#
+# Copyright (C) 2026 Yannick Le Provost <yannick.leprovost@uboe.fr>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+# Usage: python tests/bench.py [--repeat N] [--json FILE] [--tracemalloc] [PLUGIN ...]
+#
+# Every scenario builds a rig (see rigs.py), wraps all its registered G-code
+# handlers, event handlers and reactor timers, then runs its steps. Latency is
+# host wall time (the stand-in reactor's time is virtual, so waits such as
+# M190 cost only the simulation work). 'blocks' is the net number of memory
+# blocks a call leaves allocated; with --tracemalloc 'peak' is the peak traced
+# memory of outermost calls.
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import rigs
+
+class HandlerStats:
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.
+        self.max = 0.
+        self.blocks = 0
+        self.peak = None
+    def note(self, elapsed, blocks, peak):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.blocks += blocks
+        if peak is not None:
+            self.peak = max(self.peak or 0, peak)
+    def get_result(self):
+        return {
+            'calls': self.calls,
+            'mean_us': round(self.total / self.calls * 1e6, 2),
+            'max_us': round(self.max * 1e6, 2),
+            'blocks_per_call': round(self.blocks / self.calls, 2),
+            'peak_kib': None if self.peak is None else round(self.peak / 1024., 2),
+        }
+
+class Recorder:
+    """Times every wrapped handler of one rig."""
+    def __init__(self):
+        self.stats = {}
+        self.depth = 0
+    def wrap(self, label, func):
+        def wrapper(*args, **kwargs):
+            outer = self.depth == 0 and tracemalloc.is_tracing()
+            if outer:
+                tracemalloc.reset_peak()
+                traced = tracemalloc.get_traced_memory()[0]
+            self.depth += 1
+            blocks = sys.getallocatedblocks()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                blocks = sys.getallocatedblocks() - blocks
+                self.depth -= 1
+                peak = None
+                if outer:
+                    peak = tracemalloc.get_traced_memory()[1] - traced
+                self.stats.setdefault(label, HandlerStats()).note(elapsed, blocks, peak)
+        return wrapper
+    def instrument(self, rig):
+        gcode = rig.gcode
+        for cmd, func in list(gcode.ready_gcode_handlers.items()):
+            gcode.ready_gcode_handlers[cmd] = self.wrap('gcode:' + cmd, func)
+        for event, callbacks in rig.printer.event_handlers.items():
+            callbacks[:] = [self.wrap('event:%s:%s' % (event, cb.__qualname__), cb)
+                            for cb in callbacks]
+        for timer in rig.reactor.timers:
+            timer.callback = self.wrap('timer:' + timer.callback.__qualname__,
+                                       timer.callback)
+        stepper_enable = rig.printer.lookup_object('stepper_enable', None)
+        if stepper_enable is not None:
+            for enable in stepper_enable.enable_lines.values():
+                enable.callbacks[:] = [
+                    self.wrap('enable:' + cb.__qualname__, cb)
+                    for cb in enable.callbacks]
+        gcode_move = rig.printer.lookup_object('gcode_move', None)
+        if gcode_move is not None:
+            transform = gcode_move.move_transform
+            transform.move = self.wrap('transform:' + transform.move.__qualname__,
+                                       transform.move)
+    def get_results(self):
+        return {label: stats.get_result()
+                for label, stats in sorted(self.stats.items())}
+
+######################################################################
+# Scenarios
+######################################################################
+
+def _motor_cycle(rig):
+    rigs.motor_enable(rig)
+    rig.stepper_enable.motor_off()
+    rig.advance(1.)
+
+def _motor_off_event(rig):
+    rig.printer.send_event("stepper_enable:motor_off", rig.toolhead.get_last_move_time())
+
+def _homing_events(rig):
+    rig.printer.send_event("homing:homing_move_begin", None)
+    rig.printer.send_event("homing:homing_move_end", None)
+
+def _mesh_moves(rig):
+    for i in range(100):
+        rig.gcode_move.move_transform.move((10. + i, 150., .2, 0.), 100.)
+
+def _advance(seconds):
+    def advance(rig):
+        rig.advance(seconds)
+    return advance
+
+# name -> (plugin, rig factory, steps); a step is a G-code line or a
+# callable taking the rig
+SCENARIOS = {
+    'klipper_macros': ('klipper_macros', lambda: rigs.klipper_macros({
+        'bed_surfaces': {'active': 'pei', 'pei': {}},
+        'temp_profile': {'pei': {60.: 55.2, 80.: 72.5, 100.: 90.1}}}), [
+        'SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=73',
+        'SET_HEATER_TEMPERATURE_COMPENSATE HEATER=extruder TARGET=200',
+    ]),
+    'klipper_macros_profile': ('klipper_macros', lambda: rigs.klipper_macros({
+        'bed_surfaces': {'active': 'pei', 'pei': {}}}), [
+        'MAKE_SURFACE_TEMP_PROFILE',
+        'SAVE_TEMP_PROFILE MEASURED=28.5',
+        'SAVE_TEMP_PROFILE MEASURED=33.5',
+    ]),
+    'quad_pad': ('quad_pad_bed_heater', rigs.quad_pad_bed_heater, [
+        'M140 S60', 'M190 S60', _advance(30.),
+        'PREDICT_BED_HEATUP TARGET=80', 'M140 S0', _advance(30.),
+    ]),
+    'quad_pad_budget': ('quad_pad_bed_heater', lambda: rigs.quad_pad_bed_heater(
+        power_budget=400., pad_power=200.), [
+        'M190 S60', _advance(30.), 'M140 S0', _advance(30.),
+    ]),
+    'quad_pad_follower': ('quad_pad_bed_heater', lambda: rigs.quad_pad_bed_heater(
+        pad_control='follower'), [
+        'M190 S60', _advance(30.), 'M140 S0', _advance(30.),
+    ]),
+    'quad_pad_pid': ('quad_pad_bed_heater', rigs.quad_pad_bed_heater, [
+        'PID_CALIBRATE HEATER=heater_bed TARGET=60',
+    ]),
+    'stepper_brake': ('stepper_brake', rigs.stepper_brake, [
+        _motor_cycle,
+        'STEPPER_BRAKE_RELEASE STEPPER=z', 'STEPPER_BRAKE_ENGAGE STEPPER=z',
+        'SET_PIN PIN=z VALUE=1', 'SET_PIN PIN=z VALUE=0',
+        'STEPPER_BRAKE_STATUS',
+    ]),
+    'stepper_brake_lead_delay': ('stepper_brake', lambda: rigs.stepper_brake(
+        {'z': {'pin': 'PA1, ebb:PB2', 'stepper': ', '.join(rigs.Z_STEPPERS),
+               'release_lead_time': .05, 'engage_delay': .5}},
+        mcu_offsets={'ebb': .002}), [
+        _motor_cycle, 'STEPPER_BRAKE_RELEASE STEPPER=z',
+        'STEPPER_BRAKE_ENGAGE STEPPER=z', 'STEPPER_BRAKE_STATUS',
+    ]),
+    'uboe_tenor': ('uboe_tenor', rigs.uboe_tenor, [
+        'IDLE_MOTORS', 'WAKE_UP', 'SET_Z_ENDSTOPS', 'SET_Z_SAFEGUARDS',
+        _homing_events, _motor_off_event, 'ECHO_UBOE_TENOR',
+    ]),
+    'uboe_tenor_heatsoak': ('uboe_tenor', rigs.uboe_tenor, [
+        'HEATSOAK ITERATIONS=3',
+    ]),
+    'bed_mesh_idex_copy': ('bed_mesh_idex', lambda: rigs.bed_mesh_idex('COPY'), [
+        _mesh_moves, 'TEST_BED_MESH_IDEX X0=50 Y0=100 X1=250 Y1=100',
+    ]),
+    'bed_mesh_idex_primary': ('bed_mesh_idex', lambda: rigs.bed_mesh_idex('PRIMARY'), [
+        _mesh_moves,
+    ]),
+}
+
+def run_scenario(name, repeat=10):
+    plugin, factory, steps = SCENARIOS[name]
+    start = time.perf_counter()
+    rig = factory()
+    setup = time.perf_counter() - start
+    recorder = Recorder()
+    recorder.instrument(rig)
+    try:
+        for i in range(repeat):
+            for step in steps:
+                if callable(step):
+                    step(rig)
+                else:
+                    rig.run(step)
+    finally:
+        rig.close()
+    return {'plugin': plugin, 'setup_ms': round(setup * 1e3, 3),
+            'handlers': recorder.get_results()}
+
+def run_all(repeat=10, plugins=None):
+    return {name: run_scenario(name, repeat) for name, (plugin, f, s) in SCENARIOS.items()
+            if not plugins or plugin in plugins}
+
+def format_results(results):
+    lines = []
+    header = "%-64s %6s %10s %10s %8s %9s" % (
+        "handler", "calls", "mean_us", "max_us", "blocks", "peak_kib")
+    for name, scenario in results.items():
+        lines.append("%s (%s, setup %.3fms)" % (name, scenario['plugin'], scenario['setup_ms']))
+        lines.append(header)
+        for label, r in scenario['handlers'].items():
+            peak = '-' if r['peak_kib'] is None else '%.2f' % (r['peak_kib'],)
+            lines.append("%-64s %6d %10.2f %10.2f %8.2f %9s" % (
+                label[:64], r['calls'], r['mean_us'], r['max_us'],
+                r['blocks_per_call'], peak))
+        lines.append("")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="uboe plugin benchmarks")
+    parser.add_argument('plugins', nargs='*', help="only run these plugins' scenarios")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="record peak traced memory (slower)")
+    args = parser.parse_args()
+    if args.tracemalloc:
+        tracemalloc.start()
+    results = run_all(args.repeat, args.plugins)
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+# Printer set-ups driving each uboe plugin on the local stand-ins
+#
+# Copyright (C) 2026 Yannick Le Provost <yannick.leprovost@uboe.fr>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import os
+import shutil
+import sys
+import tempfile
+
+import standins
+
+class Rig:
+    """One simulated printer with a single plugin loaded.
+
+    The plugin is built from its config section like klippy does, then the
+    rig sends the startup events. Tests and the benchmark drive it through
+    run() (one G-code command line) and advance() (virtual time).
+    """
+    def __init__(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='uboe_rig_')
+        self.printer = standins.Printer(
+            {'config_file': os.path.join(self.tmpdir, 'printer.cfg')})
+        self.reactor = self.printer.get_reactor()
+        self.gcode = self.printer.lookup_object('gcode')
+        self.heaters = self.printer.lookup_object('heaters')
+        self.pins = self.printer.lookup_object('pins')
+        self.plugin = None
+    def add_toolhead(self, rails=None):
+        kin = standins.Kinematics(rails or [])
+        self.toolhead = standins.ToolHead(self.printer, kin)
+        self.printer.add_object('toolhead', self.toolhead)
+        return self.toolhead
+    def add_bed(self, **kwargs):
+        heater = self.heaters.add_heater('heater_bed', **kwargs)
+        self.printer.add_object('heater_bed', standins.PrinterHeaterBed(heater))
+        return heater
+    def start(self, *events):
+        for event in events:
+            self.printer.send_event(event)
+    def run(self, line):
+        return self.gcode.run(line)
+    def advance(self, seconds):
+        self.reactor.advance(seconds)
+    def close(self):
+        self.printer.send_event("klippy:disconnect")
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+######################################################################
+# klipper_macros
+######################################################################
+
+def klipper_macros(variables=None, quad_pad=False):
+    rig = Rig()
+    rig.add_toolhead()
+    rig.bed = rig.add_bed()
+    rig.extruder = rig.heaters.add_heater('extruder', max_temp=300.)
+    if quad_pad:
+        add_quad_pad(rig)
+    filename = os.path.join(rig.tmpdir, 'variables.cfg')
+    rig.save_variables = standins.SaveVariables(filename)
+    if variables is not None:
+        rig.save_variables.write(variables)
+        # written well before startup: its stat() can be trusted
+        os.utime(filename, ns=(10**9, 10**9))
+    rig.printer.add_object('save_variables', rig.save_variables)
+    module = standins.load_plugin('klipper_macros')
+    rig.plugin = module.load_config(rig.printer.add_section('klipper_macros'))
+    rig.printer.add_object('klipper_macros', rig.plugin)
+    rig.start("klippy:ready")
+    return rig
+
+######################################################################
+# quad_pad_bed_heater
+######################################################################
+
+def add_quad_pad(rig, **options):
+    """Load quad_pad_bed_heater and its three extra pads on a rig with a bed."""
+    for i in range(3):
+        section = 'heater_generic heater_bed%d' % (i + 1,)
+        rig.printer.add_section(section)
+        rig.printer.register_loader(
+            section, lambda config: rig.heaters.add_heater(config.get_name()))
+    module = standins.load_plugin('quad_pad_bed_heater')
+    rig.quad_pad = module.load_config(
+        rig.printer.add_section('quad_pad_bed_heater', **options))
+    rig.printer.add_object('quad_pad_bed_heater', rig.quad_pad)
+    rig.pads = rig.quad_pad.pads
+    return rig.quad_pad
+
+def quad_pad_bed_heater(variables=None, **options):
+    """variables (a dict, may be empty) also loads save_variables."""
+    rig = Rig()
+    rig.add_toolhead()
+    rig.bed = rig.add_bed()
+    if variables is not None:
+        filename = os.path.join(rig.tmpdir, 'variables.cfg')
+        rig.save_variables = standins.SaveVariables(filename)
+        rig.save_variables.write(variables)
+        # save_variables reads its file when it is loaded
+        rig.save_variables.loadVariables()
+        rig.printer.add_object('save_variables', rig.save_variables)
+    rig.plugin = add_quad_pad(rig, **options)
+    rig.start("klippy:ready")
+    return rig
+
+######################################################################
+# stepper_brake
+######################################################################
+
+Z_STEPPERS = ('stepper_z', 'stepper_z1', 'stepper_z2', 'stepper_z3')
+
+def stepper_brake(groups=None, mcu_offsets=None):
+    """groups maps a brake name to its config options (pin, stepper, ...)."""
+    rig = Rig()
+    for name, offset in (mcu_offsets or {}).items():
+        rig.pins.add_mcu(name, offset)
+    rig.add_toolhead()
+    rig.stepper_enable = standins.PrinterStepperEnable(rig.printer)
+    rig.printer.add_object('stepper_enable', rig.stepper_enable)
+    if groups is None:
+        groups = {'z': {'pin': '!PA1', 'stepper': ', '.join(Z_STEPPERS)}}
+    module = standins.load_plugin('stepper_brake', package='klippy.extras')
+    rig.brakes = {}
+    for name, options in groups.items():
+        section = 'stepper_brake %s' % (name,)
+        rig.brakes[name] = brake = module.load_config_prefix(
+            rig.printer.add_section(section, **options))
+        rig.printer.add_object(section, brake)
+    rig.plugin = rig.brakes[next(iter(groups))]
+    # The steppers are created after the brake sections, through the
+    # (patched) stepper module
+    stepper = sys.modules['klippy.stepper']
+    rig.steppers = {}
+    for name in Z_STEPPERS:
+        config = rig.printer.add_section(name)
+        rig.steppers[name] = stepper.PrinterStepper(config)
+    rig.start("klippy:ready")
+    return rig
+
+def motor_enable(rig):
+    # Enable every stepper at the next move time, like a move does
+    print_time = rig.toolhead.get_last_move_time()
+    for name in Z_STEPPERS:
+        rig.stepper_enable.lookup_enable(name).motor_enable(print_time)
+
+######################################################################
+# uboe_tenor
+######################################################################
+
+def uboe_tenor(quad_pad=False, **options):
+    rig = Rig()
+    x_rail = standins.PrinterRail('stepper_x', [standins.MCUStepper('stepper_x')])
+    y_rail = standins.PrinterRail('stepper_y', [standins.MCUStepper('stepper_y')])
+    z_rail = standins.PrinterRail(
+        'stepper_z', [standins.MCUStepper(n) for n in Z_STEPPERS],
+        position_min=-5., position_max=300., position_endstop=0.)
+    rig.add_toolhead([x_rail, y_rail, z_rail])
+    # TMC drivers and their command helpers (found through gc by the plugin)
+    rig.current_helpers = {}
+    rig.tmc_helpers = []
+    for stepper in rig.toolhead.kin.get_steppers():
+        name = stepper.get_name()
+        rig.printer.add_object('tmc2209 %s' % (name,), standins.TMCDriver(1.2))
+        rig.current_helpers[name] = helper = standins.CurrentHelper(1.2)
+        rig.tmc_helpers.append(standins.TMCCommandHelper(name, helper))
+    rig.ratos = standins.RatOS()
+    rig.printer.add_object('ratos', rig.ratos)
+    rig.printer.add_object('gcode_macro DEBUG_ECHO', standins.DebugEchoMacro())
+    rig.printer.add_object('ratos_homing', standins.RatOSHoming())
+    rig.printer.add_object('query_endstops', standins.QueryEndstops())
+    rig.qgl = standins.QuadGantryLevel()
+    rig.printer.add_object('quad_gantry_level', rig.qgl)
+    rig.probe = standins.Probe()
+    rig.printer.add_object('probe', rig.probe)
+    rig.pause_resume = standins.PauseResume()
+    rig.printer.add_object('pause_resume', rig.pause_resume)
+    rig.print_stats = standins.PrintStats()
+    rig.printer.add_object('print_stats', rig.print_stats)
+    rig.bed = rig.add_bed()
+    rig.extruder = rig.heaters.add_heater('extruder', max_temp=300.)
+    if quad_pad:
+        add_quad_pad(rig)
+    config = {
+        'z_offset_probe_x_coord': 150.,
+        'z_offset_probe_y_coord': 150.,
+        'z_safeguard_position': 0.,
+        'z_safeguard_endstop_pins': 'PG10, PG11, PG12, PG13',
+        'idle_motor_current_percentage': 40.,
+    }
+    config.update(options)
+    module = standins.load_plugin('uboe_tenor')
+    rig.plugin = module.load_config(rig.printer.add_section('uboe_tenor', **config))
+    rig.printer.add_object('uboe_tenor', rig.plugin)
+    rig.start("klippy:mcu_identify", "klippy:connect", "klippy:ready")
+    return rig
+
+######################################################################
+# bed_mesh_idex
+######################################################################
+
+BED_MESH_IDEX_PATH = os.path.join(standins.REPO_DIR, 'bed_mesh_idex', 'src',
+                                  'bed_mesh_idex.py')
+
+def bed_mesh_idex(mode='COPY', z_mesh=None, **options):
+    rig = Rig()
+    rig.add_toolhead()
+    rig.gcode_move = standins.GCodeMove(rig.printer)
+    rig.printer.add_object('gcode_move', rig.gcode_move)
+    rig.qgl = standins.QuadGantryLevel()
+    rig.printer.add_object('quad_gantry_level', rig.qgl)
+    rig.dual_carriage = standins.DualCarriage(mode)
+    rig.printer.add_object('dual_carriage', rig.dual_carriage)
+    rig.z_mesh = z_mesh if z_mesh is not None else standins.ZMesh()
+    rig.printer.add_section('bed_mesh')
+    rig.printer.register_loader(
+        'bed_mesh', lambda config: standins.BedMesh(rig.printer, rig.z_mesh))
+    module = standins.load_plugin('bed_mesh_idex', BED_MESH_IDEX_PATH)
+    rig.plugin = module.load_config(rig.printer.add_section('bed_mesh_idex', **options))
+    rig.printer.add_object('bed_mesh_idex', rig.plugin)
+    rig.bed_mesh = rig.printer.lookup_object('bed_mesh')
+    # printing moves: the axes are homed
+    rig.toolhead.kin.limits = [(0., 300.)] * 3
+    rig.start("klippy:connect", "klippy:ready")
+    return rig
+
+######################################################################
+# uboe_profiler
+######################################################################
+
+def add_profiler(rig, **options):
+    """Load the profiler on top of an already started rig."""
+    module = standins.load_plugin('uboe_profiler')
+    profiler = module.load_config(rig.printer.add_section('uboe_profiler', **options))
+    rig.printer.add_object('uboe_profiler', profiler)
+    profiler._handle_ready()
+    return profiler
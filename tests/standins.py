@@ -0,0 +1,988 @@
+# Lightweight local stand-ins for the klippy objects used by the uboe plugins
+#
+# Copyright (C) 2026 Yannick Le Provost <yannick.leprovost@uboe.fr>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+#
+# The stand-ins only implement the parts of the klippy API the plugins in
+# this repository touch. Time is virtual: the reactor clock only moves when a
+# test (or a plugin wait) asks it to, so every run is deterministic.
+import collections
+import configparser
+import importlib.util
+import os
+import sys
+import threading
+import types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class ConfigError(Exception):
+    pass
+
+class CommandError(Exception):
+    pass
+
+######################################################################
+# Reactor
+######################################################################
+
+class ReactorTimer:
+    def __init__(self, callback, waketime):
+        self.callback = callback
+        self.waketime = waketime
+
+class ReactorCompletion:
+    sentinel = object()
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.result = self.sentinel
+    def test(self):
+        return self.result is not self.sentinel
+    def complete(self, result):
+        self.result = result
+    def wait(self, waketime=None, waketime_result=None):
+        if waketime is None:
+            waketime = self.reactor.NEVER
+        while not self.test():
+            next_waketime = self.reactor.next_waketime()
+            if next_waketime >= waketime:
+                if waketime >= self.reactor.NEVER:
+                    raise RuntimeError("completion waits forever")
+                self.reactor.run_until(waketime)
+                return waketime_result
+            self.reactor.run_until(next_waketime)
+        return self.result
+
+class Reactor:
+    NOW = 0.
+    NEVER = 9999999999999999.
+    def __init__(self):
+        self.now = 1.
+        self.timers = []
+        self.pause_count = 0
+    def monotonic(self):
+        return self.now
+    def register_timer(self, callback, waketime=NEVER):
+        timer = ReactorTimer(callback, waketime)
+        self.timers.append(timer)
+        return timer
+    def unregister_timer(self, timer):
+        self.timers.remove(timer)
+    def update_timer(self, timer, waketime):
+        timer.waketime = waketime
+    def register_callback(self, callback, waketime=NOW):
+        def once(eventtime):
+            self.unregister_timer(timer)
+            callback(eventtime)
+            return self.NEVER
+        timer = self.register_timer(once, waketime)
+        return timer
+    def completion(self):
+        return ReactorCompletion(self)
+    def next_waketime(self):
+        return min([t.waketime for t in self.timers], default=self.NEVER)
+    def run_until(self, until):
+        # Run every timer due up to 'until' in waketime order
+        while True:
+            due = [t for t in self.timers if t.waketime <= until]
+            if not due:
+                break
+            timer = min(due, key=lambda t: t.waketime)
+            self.now = max(self.now, timer.waketime)
+            timer.waketime = self.NEVER
+            waketime = timer.callback(self.now)
+            if timer in self.timers and timer.waketime == self.NEVER:
+                timer.waketime = waketime
+        self.now = max(self.now, until)
+    def advance(self, seconds):
+        self.run_until(self.now + seconds)
+    def pause(self, waketime):
+        self.pause_count += 1
+        self.run_until(waketime)
+        return self.now
+
+######################################################################
+# Config
+######################################################################
+
+class ConfigWrapper:
+    error = ConfigError
+    sentinel = object()
+    def __init__(self, printer, fileconfig, section):
+        self.printer = printer
+        self.fileconfig = fileconfig
+        self.section = section
+    def get_printer(self):
+        return self.printer
+    def get_name(self):
+        return self.section
+    def getsection(self, section):
+        return ConfigWrapper(self.printer, self.fileconfig, section)
+    def has_section(self, section):
+        return self.fileconfig.has_section(section)
+    def _get(self, option, default, parser, minval=None, maxval=None,
+             above=None, below=None):
+        if not self.fileconfig.has_option(self.section, option):
+            if default is self.sentinel:
+                raise ConfigError("Option '%s' in section '%s' must be specified"
+                                  % (option, self.section))
+            return default
+        value = parser(self.fileconfig.get(self.section, option))
+        if minval is not None and value < minval:
+            raise ConfigError("Option '%s' must have minimum of %s" % (option, minval))
+        if maxval is not None and value > maxval:
+            raise ConfigError("Option '%s' must have maximum of %s" % (option, maxval))
+        if above is not None and value <= above:
+            raise ConfigError("Option '%s' must be above %s" % (option, above))
+        if below is not None and value >= below:
+            raise ConfigError("Option '%s' must be below %s" % (option, below))
+        return value
+    def get(self, option, default=sentinel):
+        return self._get(option, default, str.strip)
+    def getint(self, option, default=sentinel, minval=None, maxval=None):
+        return self._get(option, default, int, minval, maxval)
+    def getfloat(self, option, default=sentinel, minval=None, maxval=None,
+                 above=None, below=None):
+        return self._get(option, default, float, minval, maxval, above, below)
+    def getboolean(self, option, default=sentinel):
+        def parse(value):
+            return value.strip().lower() in ('1', 'true', 'yes', 'on')
+        return self._get(option, default, parse)
+    def getlist(self, option, default=sentinel, sep=','):
+        def parse(value):
+            return [v.strip() for v in value.split(sep)]
+        return self._get(option, default, parse)
+    def getfloatlist(self, option, default=sentinel, sep=',', count=None):
+        def parse(value):
+            return [float(v) for v in value.split(sep)]
+        return self._get(option, default, parse)
+    def getchoice(self, option, choices, default=sentinel):
+        value = self.get(option, default)
+        if value not in choices:
+            raise ConfigError("Choice '%s' for option '%s' is not valid" % (value, option))
+        return choices[value]
+
+class PrinterConfig:
+    def __init__(self):
+        self.saved = {}
+    def set(self, section, option, value):
+        self.saved.setdefault(section, {})[option] = value
+
+######################################################################
+# G-code
+######################################################################
+
+class GCodeCommand:
+    error = CommandError
+    sentinel = object()
+    def __init__(self, gcode, command, commandline, params):
+        self._gcode = gcode
+        self._command = command
+        self._commandline = commandline
+        self._params = params
+    def get_command(self):
+        return self._command
+    def get_commandline(self):
+        return self._commandline
+    def get_command_parameters(self):
+        return self._params
+    def respond_info(self, msg, log=True):
+        self._gcode.respond_info(msg, log)
+    def respond_raw(self, msg):
+        self._gcode.respond_raw(msg)
+    def get(self, name, default=sentinel, parser=str, minval=None, maxval=None,
+            above=None, below=None):
+        value = self._params.get(name)
+        if value is None:
+            if default is self.sentinel:
+                raise self.error("Error on '%s': missing %s" % (self._commandline, name))
+            return default
+        try:
+            value = parser(value)
+        except ValueError:
+            raise self.error("Error on '%s': unable to parse %s" % (self._commandline, value))
+        if minval is not None and value < minval:
+            raise self.error("Error on '%s': %s must have minimum of %s" % (self._commandline, name, minval))
+        if maxval is not None and value > maxval:
+            raise self.error("Error on '%s': %s must have maximum of %s" % (self._commandline, name, maxval))
+        if above is not None and value <= above:
+            raise self.error("Error on '%s': %s must be above %s" % (self._commandline, name, above))
+        if below is not None and value >= below:
+            raise self.error("Error on '%s': %s must be below %s" % (self._commandline, name, below))
+        return value
+    def get_int(self, name, default=sentinel, minval=None, maxval=None):
+        return self.get(name, default, parser=int, minval=minval, maxval=maxval)
+    def get_float(self, name, default=sentinel, minval=None, maxval=None,
+                  above=None, below=None):
+        return self.get(name, default, parser=float, minval=minval,
+                        maxval=maxval, above=above, below=below)
+
+class Mutex:
+    def __init__(self):
+        self.locked = False
+    def test(self):
+        return self.locked
+
+class GCodeDispatch:
+    error = CommandError
+    def __init__(self, printer):
+        self.printer = printer
+        self.mutex = Mutex()
+        self.ready_gcode_handlers = {}
+        self.mux_commands = {}
+        self.gcode_help = {}
+        self.scripts = []
+        self.responses = []
+    def register_command(self, cmd, func, when_not_ready=False, desc=None):
+        if func is None:
+            old = self.ready_gcode_handlers.pop(cmd, None)
+            self.gcode_help.pop(cmd, None)
+            return old
+        if cmd in self.ready_gcode_handlers:
+            raise self.printer.config_error("gcode command %s already registered" % (cmd,))
+        if not self.is_traditional_gcode(cmd):
+            # Like Klipper, extended commands are called through a lambda
+            # that re-parses their parameters
+            origfunc = func
+            func = lambda gcmd: origfunc(self._get_extended_params(gcmd))
+        self.ready_gcode_handlers[cmd] = func
+        if desc is not None:
+            self.gcode_help[cmd] = desc
+    def register_mux_command(self, cmd, key, value, func, desc=None):
+        prev = self.mux_commands.get(cmd)
+        if prev is None:
+            def mux(gcmd):
+                key_param = gcmd.get(key, None)
+                if key_param not in values:
+                    raise gcmd.error("The value '%s' is not valid for %s" % (key_param, key))
+                values[key_param](gcmd)
+            self.register_command(cmd, mux, desc=desc)
+            self.mux_commands[cmd] = prev = (key, {})
+        prev_key, values = prev
+        if value in values:
+            raise self.printer.config_error("mux command %s %s %s already registered" % (cmd, key, value))
+        values[value] = func
+    def get_mutex(self):
+        return self.mutex
+    def respond_info(self, msg, log=True):
+        self.responses.append(msg)
+    def respond_raw(self, msg):
+        self.responses.append(msg)
+    def is_traditional_gcode(self, cmd):
+        return cmd[0] in 'GMT' and cmd[1:].replace('.', '').isdigit()
+    def _get_extended_params(self, gcmd):
+        return GCodeCommand(self, gcmd.get_command(), gcmd.get_commandline(),
+                            dict(gcmd.get_command_parameters()))
+    def _parse(self, line):
+        parts = line.split()
+        cmd = parts[0].upper()
+        params = {}
+        if self.is_traditional_gcode(cmd):
+            for part in parts[1:]:
+                params[part[0].upper()] = part[1:]
+        else:
+            for part in parts[1:]:
+                if '=' in part:
+                    key, value = part.split('=', 1)
+                    params[key.upper()] = value
+        return cmd, params
+    def run(self, line):
+        # Execute one command line (used by the tests and the benchmark)
+        cmd, params = self._parse(line)
+        gcmd = GCodeCommand(self, cmd, line, params)
+        self.mutex.locked = True
+        try:
+            return self.ready_gcode_handlers[cmd](gcmd)
+        finally:
+            self.mutex.locked = False
+    def run_script_from_command(self, script):
+        for line in script.split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            self.scripts.append(line)
+            cmd, params = self._parse(line)
+            if cmd in self.ready_gcode_handlers:
+                self.ready_gcode_handlers[cmd](GCodeCommand(self, cmd, line, params))
+    run_script = run_script_from_command
+
+######################################################################
+# MCU, pins, steppers
+######################################################################
+
+class MCU:
+    def __init__(self, name, reactor, offset=0.):
+        self.name = name
+        self.reactor = reactor
+        # offset between the host clock and this MCU's print time estimate,
+        # used to simulate clock sync skew between boards
+        self.offset = offset
+    def get_name(self):
+        return self.name
+    def estimated_print_time(self, eventtime):
+        return eventtime + self.offset
+    def print_time_to_clock(self, print_time):
+        return int(print_time * 1000000.)
+
+class DigitalOut:
+    def __init__(self, mcu, pin):
+        self.mcu = mcu
+        self.pin = pin
+        self.max_duration = 2.
+        self.start_value = self.shutdown_value = 0
+        self.events = []
+    def get_mcu(self):
+        return self.mcu
+    def setup_max_duration(self, max_duration):
+        self.max_duration = max_duration
+    def setup_start_value(self, start_value, shutdown_value):
+        self.start_value = start_value
+        self.shutdown_value = shutdown_value
+    def set_digital(self, print_time, value):
+        self.events.append((print_time, value))
+
+class MCUEndstop:
+    def __init__(self, mcu, pin):
+        self.mcu = mcu
+        self.pin = pin
+        self.steppers = []
+    def get_mcu(self):
+        return self.mcu
+    def add_stepper(self, stepper):
+        self.steppers.append(stepper)
+    def get_steppers(self):
+        return list(self.steppers)
+
+class PrinterPins:
+    def __init__(self, printer):
+        self.printer = printer
+        self.mcus = {}
+        self.pins = {}
+    def add_mcu(self, name, offset=0.):
+        self.mcus[name] = mcu = MCU(name, self.printer.get_reactor(), offset)
+        return mcu
+    def parse_pin(self, pin_desc, can_invert=False, can_pullup=False):
+        desc = pin_desc.strip()
+        invert = pullup = 0
+        if can_pullup and desc.startswith('^'):
+            pullup, desc = 1, desc[1:].strip()
+        if can_invert and desc.startswith('!'):
+            invert, desc = 1, desc[1:].strip()
+        chip_name, pin = 'mcu', desc
+        if ':' in desc:
+            chip_name, pin = [s.strip() for s in desc.split(':', 1)]
+        if chip_name not in self.mcus:
+            self.add_mcu(chip_name)
+        return {'chip': self.mcus[chip_name], 'chip_name': chip_name,
+                'pin': pin, 'invert': invert, 'pullup': pullup}
+    def setup_pin(self, pin_type, pin_desc):
+        params = self.parse_pin(pin_desc, True, True)
+        if pin_type == 'endstop':
+            obj = MCUEndstop(params['chip'], params['pin'])
+        else:
+            obj = DigitalOut(params['chip'], params['pin'])
+        self.pins[pin_desc] = obj
+        return obj
+
+class MCUStepper:
+    def __init__(self, name):
+        self._name = name
+    def get_name(self, short=False):
+        if short and self._name.startswith('stepper_'):
+            return self._name[8:]
+        return self._name
+
+def PrinterStepper(config, units_in_radians=False):
+    return MCUStepper(config.get_name())
+
+class EnableTracking:
+    def __init__(self, name):
+        self.name = name
+        self.callbacks = []
+        self.is_enabled = False
+    def register_state_callback(self, callback):
+        self.callbacks.append(callback)
+    def motor_enable(self, print_time):
+        if not self.is_enabled:
+            self.is_enabled = True
+            for cb in self.callbacks:
+                cb(print_time, True)
+    def motor_disable(self, print_time):
+        if self.is_enabled:
+            self.is_enabled = False
+            for cb in self.callbacks:
+                cb(print_time, False)
+
+class PrinterStepperEnable:
+    def __init__(self, printer):
+        self.printer = printer
+        self.enable_lines = {}
+    def lookup_enable(self, name):
+        if name not in self.enable_lines:
+            self.enable_lines[name] = EnableTracking(name)
+        return self.enable_lines[name]
+    def motor_off(self):
+        toolhead = self.printer.lookup_object('toolhead')
+        toolhead.dwell(.1)
+        print_time = toolhead.get_last_move_time()
+        for el in self.enable_lines.values():
+            el.motor_disable(print_time)
+        self.printer.send_event("stepper_enable:motor_off", print_time)
+
+######################################################################
+# Toolhead and kinematics
+######################################################################
+
+Coord = collections.namedtuple('Coord', ('x', 'y', 'z', 'e'))
+
+class PrinterRail:
+    def __init__(self, name, steppers, position_min=0., position_max=300.,
+                 position_endstop=0.):
+        self.name = name
+        self.steppers = steppers
+        self.endstops = []
+        self.endstop_map = {}
+        self.position_min = position_min
+        self.position_max = position_max
+        self.position_endstop = position_endstop
+        self.homing_speed = 10.
+        self.homing_retract_dist = 5.
+        self.homing_retract_speed = 10.
+        self.homing_positive_dir = False
+    def get_name(self, short=False):
+        return self.name
+    def get_steppers(self):
+        return list(self.steppers)
+
+class Kinematics:
+    def __init__(self, rails):
+        self.rails = rails
+        self.limits = [(1.0, -1.0)] * 3
+        self.axes_min = Coord(0., 0., 0., 0.)
+        self.axes_max = Coord(300., 300., 300., 0.)
+    def get_steppers(self):
+        return [s for rail in self.rails for s in rail.get_steppers()]
+
+class ToolHead:
+    BUFFER_TIME = .250
+    def __init__(self, printer, kin):
+        self.printer = printer
+        self.reactor = printer.get_reactor()
+        self.kin = kin
+        self.print_time = 0.
+        self.max_velocity = 300.
+        self.position = [0., 0., 0., 0.]
+        self.step_generation_scan_times = []
+        self.lookahead_callbacks = 0
+        self.dwells = []
+        self.moves = []
+    def get_kinematics(self):
+        return self.kin
+    def get_last_move_time(self):
+        curtime = self.reactor.monotonic()
+        est_print_time = curtime
+        if self.print_time < est_print_time + self.BUFFER_TIME:
+            # Idle toolhead: resync print_time like toolhead._calc_print_time
+            self.print_time = est_print_time + self.BUFFER_TIME
+            self.printer.send_event("toolhead:sync_print_time", curtime,
+                                    est_print_time, self.print_time)
+        return self.print_time
+    def dwell(self, delay):
+        self.dwells.append(delay)
+        self.print_time = self.get_last_move_time() + max(0., delay)
+    def register_lookahead_callback(self, callback):
+        self.lookahead_callbacks += 1
+        callback(self.get_last_move_time())
+    def note_step_generation_scan_time(self, delay, old_delay=0.):
+        self.step_generation_scan_times.append(delay)
+    def check_busy(self, eventtime):
+        return self.print_time, eventtime, True
+    def get_position(self):
+        return list(self.position)
+    def set_position(self, newpos, homing_axes=()):
+        self.position = list(newpos)
+    def move(self, newpos, speed):
+        for axis in range(3):
+            low, high = self.kin.limits[axis]
+            if newpos[axis] != self.position[axis] and low > high:
+                # Like the kinematics' check_move on an unhomed axis
+                raise self.printer.command_error("Must home axis first")
+        self.moves.append((tuple(newpos), speed))
+        self.position = list(newpos)
+        self.print_time = self.get_last_move_time() + .1
+
+######################################################################
+# Heaters
+######################################################################
+
+class ControlPID:
+    # Proportional only; enough to drive the simulated heaters
+    def __init__(self, heater, kp=1.):
+        self.heater = heater
+        self.heater_max_power = heater.get_max_power()
+        self.kp = kp
+    def temperature_update(self, read_time, temp, target_temp):
+        co = self.kp * (target_temp - temp)
+        self.heater.set_pwm(read_time, max(0., min(self.heater_max_power, co)))
+    def check_busy(self, eventtime, smoothed_temp, target_temp):
+        return abs(target_temp - smoothed_temp) > 1.
+
+class ControlAutoTune:
+    # Stand-in for pid_calibrate.ControlAutoTune: bang-bang around the target
+    # until 'cycles' crossings have been observed
+    cycles = 12
+    def __init__(self, heater, target):
+        self.heater = heater
+        self.heater_max_power = heater.get_max_power()
+        self.calibrate_temp = target
+        self.heating = False
+        self.peaks = []
+    def temperature_update(self, read_time, temp, target_temp):
+        if self.heating and temp >= target_temp:
+            self.heating = False
+            self.peaks.append((temp, read_time))
+            self.heater.alter_target(self.calibrate_temp - 5.)
+        elif not self.heating and temp <= target_temp:
+            self.heating = True
+            self.peaks.append((temp, read_time))
+            self.heater.alter_target(self.calibrate_temp)
+        self.heater.set_pwm(read_time, self.heater_max_power if self.heating else 0.)
+    def check_busy(self, eventtime, smoothed_temp, target_temp):
+        return self.heating or len(self.peaks) < self.cycles
+    def write_file(self, filename):
+        pass
+    def calc_final_pid(self):
+        return 50., 1.5, 400.
+
+class Heater:
+    SENSOR_PERIOD = .3
+    def __init__(self, printer, name, max_power=1., max_temp=120.,
+                 heat_rate=2., loss=.01, ambient=20.):
+        self.printer = printer
+        self.name = name.split()[-1]
+        self.max_power = max_power
+        self.max_temp = max_temp
+        self.lock = threading.Lock()
+        self.target_temp = 0.
+        self.last_temp = self.smoothed_temp = ambient
+        self.last_pwm_value = 0.
+        self.pwm_updates = 0
+        self.last_pwm_time = None
+        # simple first order thermal model
+        self.heat_rate = heat_rate
+        self.loss = loss
+        self.ambient = ambient
+        self.control = ControlPID(self)
+        reactor = printer.get_reactor()
+        self.sensor_timer = reactor.register_timer(self._sensor_event, reactor.NOW)
+    def _sensor_event(self, eventtime):
+        dt = self.SENSOR_PERIOD
+        temp = self.last_temp + (self.last_pwm_value * self.heat_rate
+                                 - (self.last_temp - self.ambient) * self.loss) * dt
+        self.temperature_callback(eventtime, temp)
+        return eventtime + dt
+    def temperature_callback(self, read_time, temp):
+        with self.lock:
+            self.last_temp = self.smoothed_temp = temp
+            self.control.temperature_update(read_time, temp, self.target_temp)
+    def set_pwm(self, read_time, value):
+        if self.target_temp <= 0.:
+            value = 0.
+        self.pwm_updates += 1
+        self.last_pwm_value = value
+        self.last_pwm_time = read_time
+    def get_name(self):
+        return self.name
+    def get_max_power(self):
+        return self.max_power
+    def set_temp(self, degrees):
+        with self.lock:
+            self.target_temp = degrees
+    def alter_target(self, target_temp):
+        self.target_temp = target_temp
+    def get_temp(self, eventtime):
+        with self.lock:
+            return self.smoothed_temp, self.target_temp
+    def check_busy(self, eventtime):
+        with self.lock:
+            return self.control.check_busy(eventtime, self.smoothed_temp, self.target_temp)
+    def set_control(self, control):
+        with self.lock:
+            old_control = self.control
+            self.control = control
+            self.target_temp = 0.
+        return old_control
+    def get_status(self, eventtime):
+        return {'temperature': round(self.smoothed_temp, 2),
+                'target': self.target_temp, 'power': self.last_pwm_value}
+
+class PrinterHeaterBed:
+    def __init__(self, heater):
+        self.heater = heater
+    def get_status(self, eventtime):
+        return self.heater.get_status(eventtime)
+
+class PrinterHeaters:
+    def __init__(self, printer):
+        self.printer = printer
+        self.heaters = {}
+        self.available_sensors = []
+    def add_heater(self, name, **kwargs):
+        heater = Heater(self.printer, name, **kwargs)
+        self.heaters[heater.get_name()] = heater
+        return heater
+    def lookup_heater(self, heater_name):
+        if heater_name not in self.heaters:
+            raise self.printer.config_error("Unknown heater '%s'" % (heater_name,))
+        return self.heaters[heater_name]
+    def set_temperature(self, heater, temp, wait=False):
+        heater.set_temp(temp)
+        if wait and temp:
+            reactor = self.printer.get_reactor()
+            eventtime = reactor.monotonic()
+            while not self.printer.is_shutdown() and heater.check_busy(eventtime):
+                eventtime = reactor.pause(eventtime + 1.)
+
+######################################################################
+# Other printer objects
+######################################################################
+
+class SaveVariables:
+    def __init__(self, filename):
+        self.filename = filename
+        self.allVariables = {}
+        self.loads = 0
+    def loadVariables(self):
+        self.loads += 1
+        allvars = {}
+        varfile = configparser.ConfigParser()
+        varfile.read(self.filename)
+        if varfile.has_section('Variables'):
+            for name, val in varfile.items('Variables'):
+                allvars[name] = eval(val)
+        self.allVariables = allvars
+    def write(self, variables):
+        varfile = configparser.ConfigParser()
+        varfile.add_section('Variables')
+        for name, val in sorted(variables.items()):
+            varfile.set('Variables', name, repr(val))
+        with open(self.filename, 'w') as f:
+            varfile.write(f)
+
+class CurrentHelper:
+    def __init__(self, run_current, max_current=2.):
+        self.run_current = run_current
+        self.hold_current = run_current
+        self.max_current = max_current
+        self.history = []
+    def get_current(self):
+        return (self.run_current, self.hold_current, self.hold_current,
+                self.max_current)
+    def set_current(self, run_current, hold_current, print_time):
+        self.run_current = run_current
+        self.history.append((print_time, run_current))
+
+class TMCCommandHelper:
+    def __init__(self, stepper_name, current_helper):
+        self.stepper_name = stepper_name
+        self.current_helper = current_helper
+
+class TMCDriver:
+    def __init__(self, run_current):
+        self.run_current = run_current
+    def get_status(self, eventtime=None):
+        return {'run_current': self.run_current}
+
+class ZStatus:
+    def __init__(self):
+        self.applied = True
+        self.resets = 0
+    def reset(self):
+        self.applied = False
+        self.resets += 1
+
+class ZAdjustHelper:
+    def __init__(self):
+        self.adjustments = []
+    def adjust_steppers(self, adjustments, speed):
+        self.adjustments.append((list(adjustments), speed))
+
+class QuadGantryLevel:
+    def __init__(self, gantry_corners=((-60., -10.), (360., 370.))):
+        self.z_status = ZStatus()
+        self.z_helper = ZAdjustHelper()
+        self.gantry_corners = [list(c) for c in gantry_corners]
+
+class ZMesh:
+    # Planar mesh z = base + slope_x * x + slope_y * y, over a
+    # mesh_x_count x mesh_y_count interpolated matrix like bed_mesh's ZMesh
+    def __init__(self, slope_x=.001, slope_y=0., base=0., count=7,
+                 mesh_min=(0., 0.), mesh_max=(300., 300.)):
+        self.slope_x = slope_x
+        self.slope_y = slope_y
+        self.base = base
+        self.mesh = [[0.]]
+        self.calls = 0
+        self.mesh_x_count = self.mesh_y_count = count
+        self.mesh_x_min, self.mesh_y_min = mesh_min
+        self.mesh_x_max, self.mesh_y_max = mesh_max
+    def calc_z(self, x, y):
+        self.calls += 1
+        return self.base + self.slope_x * x + self.slope_y * y
+    def get_mesh_matrix(self):
+        xs = [self.mesh_x_min + i * (self.mesh_x_max - self.mesh_x_min) / (self.mesh_x_count - 1)
+              for i in range(self.mesh_x_count)]
+        ys = [self.mesh_y_min + i * (self.mesh_y_max - self.mesh_y_min) / (self.mesh_y_count - 1)
+              for i in range(self.mesh_y_count)]
+        return [[round(self.base + self.slope_x * x + self.slope_y * y, 6) for x in xs]
+                for y in ys]
+
+class BedMesh:
+    # Registers itself as the move transform like bed_mesh does and passes
+    # the moves on to the toolhead (without applying the mesh)
+    FADE_DISABLE = 0x7FFFFFFF
+    def __init__(self, printer, z_mesh=None):
+        self.printer = printer
+        self.z_mesh = z_mesh
+        self.moves = []
+        self.set_fade(1., 0.)
+        gcode_move = printer.lookup_object('gcode_move')
+        gcode_move.set_move_transform(self)
+    def move(self, newpos, speed):
+        self.moves.append((tuple(newpos), speed))
+        self.printer.lookup_object('toolhead').move(newpos, speed)
+    def set_fade(self, fade_start, fade_end, fade_target=0.):
+        self.fade_start = fade_start
+        self.fade_end = fade_end
+        self.fade_dist = fade_end - fade_start
+        self.fade_target = fade_target
+        if self.fade_dist <= 0.:
+            self.fade_start = self.fade_end = self.FADE_DISABLE
+            self.fade_target = 0.
+
+class GCodeMove:
+    def __init__(self, printer):
+        self.printer = printer
+        self.move_transform = None
+    def set_move_transform(self, transform, force=False):
+        if self.move_transform is not None and not force:
+            raise self.printer.config_error("G-Code move transform already specified")
+        old_transform = self.move_transform
+        self.move_transform = transform
+        return old_transform
+
+class DualCarriage:
+    def __init__(self, mode='PRIMARY'):
+        self.mode = mode
+    def get_status(self, eventtime=None):
+        return {'carriage_0': 'PRIMARY', 'carriage_1': self.mode}
+
+class RatOS:
+    def __init__(self):
+        self.echoes = []
+    def console_echo(self, title, type, msg):
+        self.echoes.append((title, type, msg))
+
+class DebugEchoMacro:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+    def get_status(self, eventtime):
+        return {'enabled': self.enabled}
+
+class RatOSHoming:
+    def __init__(self):
+        self.z_hop = 10.
+
+class QueryEndstops:
+    def __init__(self):
+        self.endstops = []
+    def register_endstop(self, mcu_endstop, name):
+        self.endstops.append((mcu_endstop, name))
+
+class PauseResume:
+    def __init__(self):
+        self.is_paused = False
+
+class PrintStats:
+    def __init__(self):
+        self.state = 'standby'
+
+class Probe:
+    def __init__(self):
+        self.last_z_result = 0.
+    def get_status(self, eventtime):
+        return {'last_z_result': self.last_z_result}
+
+######################################################################
+# Printer
+######################################################################
+
+class WebRequestError(Exception):
+    pass
+
+class WebRequest:
+    error = WebRequestError
+    def __init__(self, params):
+        self.params = params
+        self.response = None
+    def get_str(self, item, default=ConfigWrapper.sentinel):
+        if item not in self.params:
+            if default is ConfigWrapper.sentinel:
+                raise self.error("Missing Argument [%s]" % (item,))
+            return default
+        return str(self.params[item])
+    def get_int(self, item, default=ConfigWrapper.sentinel):
+        value = self.get_str(item, default)
+        return value if value is default else int(value)
+    def send(self, data):
+        self.response = data
+
+class WebHooks:
+    def __init__(self):
+        self.endpoints = {}
+    def register_endpoint(self, path, callback):
+        if path in self.endpoints:
+            raise WebRequestError("Path already registered to an endpoint")
+        self.endpoints[path] = callback
+    def call(self, path, **params):
+        # Run an API request and return its response
+        web_request = WebRequest(params)
+        self.endpoints[path](web_request)
+        return web_request.response
+
+class Printer:
+    config_error = ConfigError
+    command_error = CommandError
+    def __init__(self, start_args=None):
+        self.reactor = Reactor()
+        self.objects = collections.OrderedDict()
+        self.event_handlers = {}
+        self.loaders = {}
+        self.start_args = start_args or {}
+        self.shutdown = False
+        self.fileconfig = configparser.RawConfigParser()
+        self.objects['gcode'] = GCodeDispatch(self)
+        self.objects['pins'] = PrinterPins(self)
+        self.objects['heaters'] = PrinterHeaters(self)
+        self.objects['configfile'] = PrinterConfig()
+        self.objects['webhooks'] = WebHooks()
+    def get_reactor(self):
+        return self.reactor
+    def get_start_args(self):
+        return self.start_args
+    def is_shutdown(self):
+        return self.shutdown
+    def add_object(self, name, obj):
+        self.objects[name] = obj
+    def lookup_object(self, name, default=ConfigWrapper.sentinel):
+        if name in self.objects:
+            return self.objects[name]
+        if default is ConfigWrapper.sentinel:
+            raise self.config_error("Unknown config object '%s'" % (name,))
+        return default
+    def lookup_objects(self, module=None):
+        if module is None:
+            return list(self.objects.items())
+        return [(n, o) for n, o in self.objects.items()
+                if n == module or n.startswith(module + ' ')]
+    def register_loader(self, section, factory):
+        # factory(config) is called by load_object for sections not loaded yet
+        self.loaders[section] = factory
+    def load_object(self, config, section, default=ConfigWrapper.sentinel):
+        if section in self.objects:
+            return self.objects[section]
+        if section not in self.loaders:
+            if default is not ConfigWrapper.sentinel:
+                return default
+            raise self.config_error("Unable to load module '%s'" % (section,))
+        self.objects[section] = obj = self.loaders[section](config.getsection(section))
+        return obj
+    def register_event_handler(self, event, callback):
+        self.event_handlers.setdefault(event, []).append(callback)
+    def send_event(self, event, *params):
+        return [cb(*params) for cb in self.event_handlers.get(event, [])]
+    def invoke_shutdown(self, msg):
+        self.shutdown = True
+        self.send_event("klippy:shutdown")
+    def set_rollover_info(self, name, info, log=True):
+        pass
+    def add_section(self, section, **options):
+        # Add a config section and return its ConfigWrapper
+        self.fileconfig.add_section(section)
+        for option, value in options.items():
+            self.fileconfig.set(section, option, str(value))
+        return ConfigWrapper(self, self.fileconfig, section)
+
+######################################################################
+# Module stand-ins
+######################################################################
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+def _package(name, path=(), **attrs):
+    module = _module(name, **attrs)
+    module.__path__ = list(path)
+    return module
+
+def install_modules():
+    """Register the klippy module stand-ins in sys.modules."""
+    if 'klippy_standins_installed' in sys.modules:
+        return
+    stepper = _module('stepper', PrinterStepper=PrinterStepper,
+                      GenericPrinterRail=PrinterRail, PrinterRail=PrinterRail,
+                      error=CommandError)
+    modules = {
+        'reactor': _module('reactor', Reactor=Reactor),
+        'mcu': _module('mcu', TRSYNC_TIMEOUT=.025, MCU=MCU),
+        'configfile': _module('configfile', ConfigWrapper=ConfigWrapper,
+                              error=ConfigError),
+        'toolhead': _module('toolhead', ToolHead=ToolHead),
+        'stepper': stepper,
+        'kinematics': _package('kinematics'),
+        'kinematics.ratos_hybrid_corexy': _module(
+            'kinematics.ratos_hybrid_corexy',
+            RatOSHybridCoreXYKinematics=Kinematics),
+        # the plugins are symlinked into klippy/extras: helper modules of
+        # this repository are found there too
+        'extras': _package('extras', [REPO_DIR]),
+        'extras.heater_bed': _module('extras.heater_bed',
+                                     PrinterHeaterBed=PrinterHeaterBed),
+        'extras.pid_calibrate': _module('extras.pid_calibrate',
+                                        ControlAutoTune=ControlAutoTune),
+        'extras.tmc': _module('extras.tmc', TMCCommandHelper=TMCCommandHelper),
+        'extras.temperature_sensor': _module('extras.temperature_sensor',
+                                             PrinterSensorGeneric=object),
+        # stepper_brake uses "from .. import stepper", so it is loaded as a
+        # submodule of a klippy package
+        'klippy': _package('klippy', stepper=stepper),
+        'klippy.extras': _package('klippy.extras', [REPO_DIR]),
+        'klippy.stepper': stepper,
+        'klippy_standins_installed': _module('klippy_standins_installed'),
+    }
+    sys.modules.update(modules)
+    for name, module in modules.items():
+        if '.' in name:
+            parent, child = name.rsplit('.', 1)
+            setattr(sys.modules[parent], child, module)
+
+def load_plugin(name, path=None, package='extras'):
+    """Import a plugin file of this repository as <package>.<name>.
+
+    The module is imported once per process, like klippy does: module level
+    state (e.g. the stepper_brake registry) must outlive a single printer.
+    """
+    install_modules()
+    modname = '%s.%s' % (package, name)
+    if modname in sys.modules:
+        return sys.modules[modname]
+    if path is None:
+        path = os.path.join(REPO_DIR, name + '.py')
+    spec = importlib.util.spec_from_file_location(modname, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[modname] = module
+    spec.loader.exec_module(module)
+    return module
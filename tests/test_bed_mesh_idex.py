@@ -0,0 +1,176 @@
+import os
+import unittest
+
+import rigs
+import standins
+
+def gantry_plane(rig, correction):
+    # Plane through the corrected corners (front_left, rear_left, rear_right,
+    # front_right) as a function of XY
+    (x_min, y_min), (x_max, y_max) = rig.qgl.gantry_corners
+    fl, rl, rr, fr = correction
+    assert abs(rr - (rl + fr - fl)) < 1e-9, "corrections are not planar"
+    slope_x = (fr - fl) / (x_max - x_min)
+    slope_y = (rl - fl) / (y_max - y_min)
+    return lambda x, y: fl + slope_x * (x - x_min) + slope_y * (y - y_min)
+
+class TestBedMeshIDEX(unittest.TestCase):
+
+    def make_rig(self, mode='COPY'):
+        rig = rigs.bed_mesh_idex(mode)
+        self.addCleanup(rig.close)
+        return rig
+
+    def test_move_transform_chain(self):
+        rig = self.make_rig()
+        self.assertIs(rig.gcode_move.move_transform, rig.plugin)
+        self.assertIs(rig.plugin.mono_toolhead_bed_mesh_transform, rig.bed_mesh)
+
+    def test_primary_mode_uses_bed_mesh(self):
+        rig = self.make_rig('PRIMARY')
+        rig.plugin.move((100., 100., 1., 0.), 50.)
+        self.assertEqual(rig.bed_mesh.moves, [((100., 100., 1., 0.), 50.)])
+        self.assertEqual(rig.qgl.z_helper.adjustments, [])
+
+    def test_copy_mode_tilts_gantry(self):
+        rig = self.make_rig('COPY')
+        newpos, speed = rig.plugin.move((100., 100., 1., 0.), 50.)
+        self.assertAlmostEqual(newpos[2], 1.1)
+        adjustments, lift_speed = rig.qgl.z_helper.adjustments[-1]
+        # quad_gantry_level lowers a stepper for a positive adjustment
+        plane = gantry_plane(rig, [-a for a in adjustments])
+        self.assertAlmostEqual(plane(100., 100.), 0.)
+        self.assertAlmostEqual(plane(150., 100.), .05)
+
+    def test_idex_offset_from_config(self):
+        rig = rigs.bed_mesh_idex('COPY', idex_offset_x=80.)
+        self.addCleanup(rig.close)
+        rig.plugin.move((100., 100., 1., 0.), 50.)
+        adjustments, lift_speed = rig.qgl.z_helper.adjustments[-1]
+        plane = gantry_plane(rig, [-a for a in adjustments])
+        self.assertAlmostEqual(plane(180., 100.), .08)
+
+    def test_solver_tilts_in_y(self):
+        rig = self.make_rig('COPY')
+        correction = rig.plugin._solve_gantry(((100., 50.), (150., 300.)), (.1, -.2))
+        plane = gantry_plane(rig, correction)
+        self.assertAlmostEqual(plane(100., 50.), .1)
+        self.assertAlmostEqual(plane(150., 300.), -.2)
+        self.assertNotAlmostEqual(correction[0], correction[1])
+        # coinciding points: only the first one is honoured
+        correction = rig.plugin._solve_gantry(((100., 50.), (100., 50.)), (.1, .3))
+        self.assertAlmostEqual(gantry_plane(rig, correction)(100., 50.), .1)
+
+    def test_only_deltas_are_sent(self):
+        rig = self.make_rig('COPY')
+        rig.plugin.move((100., 100., 1., 0.), 50.)
+        rig.plugin.move((120., 100., 1., 0.), 50.)
+        first, second = [a for a, speed in rig.qgl.z_helper.adjustments]
+        # the adjustments add up to the correction of the last move
+        plane = gantry_plane(rig, [-a - b for a, b in zip(first, second)])
+        self.assertAlmostEqual(plane(120., 100.), 0.)
+        self.assertAlmostEqual(plane(170., 100.), .05)
+
+    def test_same_xy_moves_are_memoised(self):
+        rig = self.make_rig('COPY')
+        rig.plugin.move((100., 100., 1., 0.), 50.)
+        calls = rig.z_mesh.calls
+        # retract, Z-hop, unretract at the same XY
+        rig.plugin.move((100., 100., 1., -.8), 30.)
+        newpos, speed = rig.plugin.move((100., 100., 1.4, -.8), 10.)
+        self.assertAlmostEqual(newpos[2], 1.5)
+        self.assertEqual(rig.z_mesh.calls, calls)
+        self.assertEqual(len(rig.qgl.z_helper.adjustments), 1)
+        rig.dual_carriage.mode = 'MIRROR'
+        rig.plugin.move((100., 100., 1.4, -.8), 10.)
+        self.assertEqual(len(rig.qgl.z_helper.adjustments), 2)
+        self.assertEqual(rig.plugin.get_status(),
+                         {'memo_hits': 2, 'memo_misses': 2, 'fade_bypasses': 0,
+                          'binary_profile': None})
+
+    def test_fade(self):
+        rig = self.make_rig('COPY')
+        rig.bed_mesh.set_fade(1., 5.)
+        newpos, speed = rig.plugin.move((100., 100., 3., 0.), 50.)
+        # half way through the fade: half the compensation
+        self.assertAlmostEqual(newpos[2], 3.05)
+        adjustments, lift_speed = rig.qgl.z_helper.adjustments[-1]
+        plane = gantry_plane(rig, [-a for a in adjustments])
+        self.assertAlmostEqual(plane(150., 100.), .025)
+        # same layer, same XY: nothing recomputed
+        rig.plugin.move((100., 100., 3., -.8), 30.)
+        self.assertEqual(len(rig.qgl.z_helper.adjustments), 1)
+        # above fade end the move goes through untouched
+        calls = rig.z_mesh.calls
+        self.assertEqual(rig.plugin.move((120., 100., 6., 0.), 50.),
+                         ((120., 100., 6., 0.), 50.))
+        self.assertEqual(rig.z_mesh.calls, calls)
+        # the gantry is leveled once on the way out
+        self.assertEqual(len(rig.qgl.z_helper.adjustments), 2)
+        self.assertEqual(rig.qgl.z_helper.adjustments[-1][0],
+                         [-a for a in adjustments])
+        rig.plugin.move((120., 100., 7., 0.), 50.)
+        self.assertEqual(len(rig.qgl.z_helper.adjustments), 2)
+        self.assertEqual(rig.plugin.get_status()['fade_bypasses'], 2)
+
+    def test_fade_target(self):
+        rig = self.make_rig('COPY')
+        rig.bed_mesh.set_fade(1., 5., fade_target=.2)
+        newpos, speed = rig.plugin.move((100., 100., 3., 0.), 50.)
+        # half way from the mesh Z (.1) to fade_target
+        self.assertAlmostEqual(newpos[2], 3.15)
+        adjustments, lift_speed = rig.qgl.z_helper.adjustments[-1]
+        plane = gantry_plane(rig, [-a for a in adjustments])
+        self.assertAlmostEqual(plane(150., 100.), .025)
+        # above fade end: fade_target is still applied, with a level gantry
+        calls = rig.z_mesh.calls
+        newpos, speed = rig.plugin.move((120., 100., 6., 0.), 50.)
+        self.assertAlmostEqual(newpos[2], 6.2)
+        self.assertEqual(rig.z_mesh.calls, calls)
+        self.assertEqual(rig.qgl.z_helper.adjustments[-1][0],
+                         [-a for a in adjustments])
+
+    def test_binary_profile(self):
+        rig = self.make_rig('COPY')
+        rig.run('BED_MESH_IDEX_SAVE_BINARY PROFILE=hires')
+        filename = os.path.join(rig.tmpdir, 'bed_mesh_idex', 'hires.mesh')
+        self.assertEqual(os.path.getsize(filename), 32 + 4 * 7 * 7)
+        rig.run('BED_MESH_IDEX_LOAD_BINARY PROFILE=hires')
+        binary_mesh = rig.plugin.binary_mesh
+        self.assertEqual(binary_mesh.matrix.format, 'f')
+        self.assertAlmostEqual(binary_mesh.calc_z(125., 80.), .125, places=6)
+        # out of the mesh: clamped like bed_mesh
+        self.assertAlmostEqual(binary_mesh.calc_z(400., 80.), .3, places=6)
+        calls = rig.z_mesh.calls
+        newpos, speed = rig.plugin.move((100., 100., 1., 0.), 50.)
+        self.assertAlmostEqual(newpos[2], 1.1, places=6)
+        self.assertEqual(rig.z_mesh.calls, calls)
+        self.assertEqual(rig.plugin.get_status()['binary_profile'], 'hires')
+        rig.run('BED_MESH_IDEX_UNLOAD_BINARY')
+        self.assertIsNone(rig.plugin.binary_mesh)
+        self.assertIsNone(binary_mesh.matrix)
+        rig.plugin.move((100., 100., 1., 0.), 50.)
+        self.assertEqual(rig.z_mesh.calls, calls + 2)
+
+    def test_binary_profile_errors(self):
+        rig = self.make_rig('COPY')
+        with self.assertRaises(standins.CommandError):
+            rig.run('BED_MESH_IDEX_LOAD_BINARY PROFILE=missing')
+        os.makedirs(os.path.join(rig.tmpdir, 'bed_mesh_idex'))
+        with open(os.path.join(rig.tmpdir, 'bed_mesh_idex', 'bad.mesh'), 'wb') as f:
+            f.write(b'UBMI' + bytes(40))
+        with self.assertRaises(standins.CommandError):
+            rig.run('BED_MESH_IDEX_LOAD_BINARY PROFILE=bad')
+        with self.assertRaises(standins.CommandError):
+            rig.run('BED_MESH_IDEX_SAVE_BINARY PROFILE=../escape')
+        self.assertIsNone(rig.plugin.binary_mesh)
+
+    def test_command(self):
+        rig = self.make_rig()
+        rig.run('TEST_BED_MESH_IDEX X0=50 Y0=100 X1=250 Y1=100')
+        self.assertIn("Calculated Gantry Corrections: front_left=-0.0893,"
+                      " rear_left=-0.1608, rear_right=0.2592, front_right=0.3307",
+                      rig.gcode.responses)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+
+import bench
+
+class TestBench(unittest.TestCase):
+
+    def test_every_scenario_runs(self):
+        results = bench.run_all(repeat=1)
+        self.assertEqual(sorted(results), sorted(bench.SCENARIOS))
+        handlers = results['quad_pad']['handlers']
+        self.assertEqual(handlers['gcode:M190']['calls'], 1)
+        self.assertIn('timer:QuadPadBedHeater._control_tick', handlers)
+        self.assertIn('gcode:STEPPER_BRAKE_STATUS', results['stepper_brake']['handlers'])
+        self.assertTrue(bench.format_results(results))
+
+if __name__ == '__main__':
+    unittest.main()
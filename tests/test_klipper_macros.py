@@ -0,0 +1,133 @@
+import os
+import time
+import unittest
+
+import rigs
+import standins
+
+PROFILE_VARIABLES = {
+    'bed_surfaces': {'active': 'pei', 'pei': {}},
+    'temp_profile': {'pei': {60.: 55.2, 80.: 72.5, 100.: 90.1}},
+}
+
+class TestKlipperMacros(unittest.TestCase):
+
+    def setUp(self):
+        self.rig = rigs.klipper_macros(PROFILE_VARIABLES)
+        self.addCleanup(self.rig.close)
+
+    def test_uses_printer_reactor(self):
+        self.assertIs(self.rig.plugin.reactor, self.rig.reactor)
+        self.assertEqual(sorted(self.rig.plugin.startup_times), ['config', 'ready'])
+
+    def test_compensate_bed_target(self):
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=73')
+        self.assertEqual(self.rig.bed.target_temp, 80.)
+
+    def test_compensate_other_heater_without_table(self):
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=extruder TARGET=200')
+        self.assertEqual(self.rig.extruder.target_temp, 200.)
+        # set directly, not through a new G-code command
+        self.assertEqual(self.rig.gcode.scripts, [])
+        with self.assertRaises(standins.CommandError):
+            self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=chamber TARGET=40')
+
+    def test_compensate_quad_pad_bed(self):
+        variables = dict(PROFILE_VARIABLES, heater_temp_profile={'pei': {
+            'heater_bed2': {60.: 50., 70.: 58.}}})
+        rig = rigs.klipper_macros(variables, quad_pad=True)
+        self.addCleanup(rig.close)
+        rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=57')
+        # the pads without their own table follow the bed's one
+        self.assertEqual([pad.target_temp for pad in rig.pads], [60., 60., 70., 60.])
+        self.assertEqual(rig.plugin.get_status(0.)['compensated_heaters'],
+                         ['heater_bed', 'heater_bed2'])
+
+    def test_compensate_single_pad(self):
+        variables = dict(PROFILE_VARIABLES, heater_temp_profile={'pei': {
+            'heater_bed2': {60.: 50., 70.: 58.}}})
+        rig = rigs.klipper_macros(variables, quad_pad=True)
+        self.addCleanup(rig.close)
+        rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed2 TARGET=57')
+        self.assertEqual([pad.target_temp for pad in rig.pads], [0., 0., 70., 0.])
+        # set through quad_pad_bed_heater, which times the pad's heat-up
+        self.assertIsNotNone(rig.quad_pad.telemetry[2].heatup_start)
+
+    def test_pad_tables_without_bed_profile(self):
+        variables = {'bed_surfaces': {'active': 'pei', 'pei': {}},
+                     'heater_temp_profile': {'pei': {'heater_bed2': {70.: 58.}}}}
+        rig = rigs.klipper_macros(variables, quad_pad=True)
+        self.addCleanup(rig.close)
+        rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=57')
+        self.assertEqual([pad.target_temp for pad in rig.pads], [57., 57., 70., 57.])
+        self.assertFalse([msg for msg in rig.gcode.responses
+                          if msg.startswith('No temperature profile')])
+
+    def test_status(self):
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=73')
+        status = self.rig.plugin.get_status(0.)
+        self.assertEqual(status['active_surface'], 'pei')
+        self.assertEqual(status['profile_temps'], [60., 80., 100.])
+        self.assertNotIn('cache', status)
+        self.assertIs(self.rig.plugin.get_status(1.), status)
+        # Cache hits alone do not make a new status version
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=73')
+        self.assertIs(self.rig.plugin.get_status(2.), status)
+
+    def test_variables_are_cached(self):
+        for i in range(5):
+            self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=60')
+        self.assertEqual(self.rig.save_variables.loads, 1)
+        self.assertEqual(self.rig.plugin.get_cache_stats(), {'hits': 4, 'misses': 1})
+
+    def test_external_write_reloads(self):
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=60')
+        variables = dict(PROFILE_VARIABLES, temp_profile={'pei': {70.: 60.}})
+        self.rig.save_variables.write(variables)
+        os.utime(self.rig.save_variables.filename, ns=(1, 1))
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=60')
+        self.assertEqual(self.rig.save_variables.loads, 2)
+        self.assertEqual(self.rig.bed.target_temp, 70.)
+
+    def test_save_variables_reload_is_used(self):
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=60')
+        stat = os.stat(self.rig.save_variables.filename)
+        # SAVE_VARIABLE: the file is rewritten and save_variables reloads it
+        self.rig.save_variables.write(dict(PROFILE_VARIABLES, temp_profile={'pei': {70.: 60.}}))
+        self.rig.save_variables.loadVariables()
+        os.utime(self.rig.save_variables.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=60')
+        self.assertEqual(self.rig.save_variables.loads, 2)
+        self.assertEqual(self.rig.bed.target_temp, 70.)
+
+    def test_recent_rewrite_is_reread(self):
+        filename = self.rig.save_variables.filename
+        mtime = time.time_ns()
+        os.utime(filename, ns=(mtime, mtime))
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=60')
+        # same size, same mtime: only the age of the file tells it may differ
+        self.rig.save_variables.write(dict(PROFILE_VARIABLES, temp_profile={'pei': {60.: 73.2, 80.: 72.5, 100.: 90.1}}))
+        os.utime(filename, ns=(mtime, mtime))
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=73')
+        self.assertEqual(self.rig.bed.target_temp, 60.)
+
+    def test_missing_surfaces_runs_init(self):
+        self.rig.save_variables.write({})
+        os.utime(self.rig.save_variables.filename, ns=(1, 1))
+        self.rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=heater_bed TARGET=60')
+        self.assertIn('_init_surfaces', self.rig.gcode.scripts)
+
+    def test_make_and_save_profile(self):
+        self.rig.run('MAKE_SURFACE_TEMP_PROFILE')
+        self.assertIn('G28', self.rig.gcode.scripts)
+        self.assertEqual(self.rig.bed.target_temp, 30.)
+        self.assertAlmostEqual(self.rig.bed.smoothed_temp, 30., delta=1.)
+        self.rig.run('SAVE_TEMP_PROFILE MEASURED=28.5')
+        # saving moves the profile on to the next temperature
+        self.assertEqual(self.rig.bed.target_temp, 35.)
+        self.rig.save_variables.loadVariables()
+        saved = self.rig.save_variables.allVariables['temp_profile']['pei']
+        self.assertEqual(saved[30.], 28.5)
+
+if __name__ == '__main__':
+    unittest.main()
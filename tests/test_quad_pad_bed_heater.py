@@ -0,0 +1,119 @@
+import unittest
+
+import rigs
+
+class TestQuadPadBedHeater(unittest.TestCase):
+
+    def make_rig(self, **options):
+        rig = rigs.quad_pad_bed_heater(**options)
+        self.addCleanup(rig.close)
+        return rig
+
+    def test_m140_sets_every_pad(self):
+        rig = self.make_rig()
+        rig.run('M140 S60')
+        self.assertEqual([pad.target_temp for pad in rig.pads], [60.] * 4)
+
+    def test_m190_waits_for_every_pad(self):
+        rig = self.make_rig(pad_temp_tolerance=2.)
+        rig.run('M190 S60')
+        for pad in rig.pads:
+            self.assertAlmostEqual(pad.smoothed_temp, 60., delta=2.)
+        rig.advance(1.)
+        status = rig.plugin.get_status(rig.reactor.monotonic())
+        self.assertIsNone(status['waiting_on'])
+        self.assertIsNotNone(status['time_to_target'])
+        self.assertEqual(sorted(status['pads']), ['heater_bed', 'heater_bed1',
+                                                  'heater_bed2', 'heater_bed3'])
+
+    def test_m190_flushes_moves_and_reports(self):
+        rig = self.make_rig()
+        syncs = []
+        rig.printer.register_event_handler(
+            "toolhead:sync_print_time", lambda *args: syncs.append(args))
+        rig.advance(5.)
+        rig.run('M190 S40')
+        self.assertTrue(syncs)
+        reports = [msg for msg in rig.gcode.responses if 'waiting on' in msg]
+        self.assertGreater(len(reports), 1)
+        self.assertIn('heater_bed:', reports[0])
+
+    def test_power_budget(self):
+        rig = self.make_rig(power_budget=400., pad_power=200.)
+        rig.run('M140 S80')
+        rig.advance(5.)
+        self.assertLessEqual(sum(rig.plugin.pad_power_limits), 2. + 1e-9)
+        self.assertLessEqual(sum(pad.last_pwm_value for pad in rig.pads), 2. + 1e-9)
+
+    def test_power_budget_staggers_pwm_phases(self):
+        for pad_control in ('independent', 'follower'):
+            rig = self.make_rig(power_budget=400., pad_power=200., pad_control=pad_control)
+            rig.run('M140 S80')
+            rig.advance(1.)
+            start = rig.pads[0].last_pwm_time
+            offsets = [pad.last_pwm_time - start for pad in rig.pads]
+            for offset, expected in zip(offsets, [0., .025, .05, .075]):
+                self.assertAlmostEqual(offset, expected)
+
+    def test_power_budget_keeps_holding_floor(self):
+        rig = self.make_rig(power_budget=400., pad_power=200., pad_temp_tolerance=2.)
+        rig.run('M190 S60')
+        rig.advance(5.)
+        hold = rig.plugin.pad_hold_duty[0]
+        self.assertGreater(hold, 0.)
+        # The other pads heating far away must not starve the one at target
+        rig.plugin.set_pad_targets([60., 100., 100., 100.])
+        rig.advance(2.)
+        self.assertGreaterEqual(rig.plugin.pad_power_limits[0], hold - 1e-9)
+        self.assertLessEqual(sum(rig.plugin.pad_power_limits), 2. + 1e-9)
+
+    def test_pid_calibrate_keeps_power_budget(self):
+        rig = self.make_rig(power_budget=400., pad_power=200.)
+        rig.run('PID_CALIBRATE HEATER=heater_bed TARGET=60')
+        self.assertEqual(rig.plugin.pad_power_limits, [.5] * 4)
+
+    def test_follower_mode(self):
+        rig = self.make_rig(pad_control='follower')
+        rig.run('M190 S60')
+        for pad in rig.pads[1:]:
+            self.assertAlmostEqual(pad.smoothed_temp, 60., delta=1.)
+
+    def test_pid_calibrate_all_pads(self):
+        rig = self.make_rig()
+        controls = [pad.control for pad in rig.pads]
+        rig.run('PID_CALIBRATE HEATER=heater_bed TARGET=60')
+        saved = rig.printer.lookup_object('configfile').saved
+        self.assertEqual(sorted(saved), ['heater_bed', 'heater_bed1',
+                                         'heater_bed2', 'heater_bed3'])
+        self.assertEqual([pad.control for pad in rig.pads], controls)
+
+    def test_predict_heatup(self):
+        rig = self.make_rig()
+        rig.run('M190 S80')
+        rig.run('PREDICT_BED_HEATUP TARGET=90 FROM=25')
+        self.assertIsNotNone(rig.plugin.predicted_heatup['seconds'])
+
+    def test_heatup_model_under_power_budget(self):
+        rig = self.make_rig(power_budget=400., pad_power=200.)
+        rig.run('M190 S80')
+        self.assertGreaterEqual(rig.plugin.models[0].n, 10)
+        rig.run('PREDICT_BED_HEATUP TARGET=90 FROM=25')
+        budget_eta = rig.plugin.predicted_heatup['seconds']
+        rig.plugin.power_budget = None
+        rig.run('PREDICT_BED_HEATUP TARGET=90 FROM=25')
+        self.assertAlmostEqual(rig.plugin.predicted_heatup['seconds'] * 2.,
+                               budget_eta, delta=1.)
+
+    def test_heatup_model_persisted(self):
+        rig = self.make_rig(variables={})
+        rig.run('M190 S80')
+        saved = rig.save_variables.allVariables['quad_pad_heatup_model']
+        self.assertEqual(sorted(saved), ['heater_bed', 'heater_bed1',
+                                         'heater_bed2', 'heater_bed3'])
+        restored = self.make_rig(variables=rig.save_variables.allVariables)
+        self.assertEqual(restored.plugin.models[0].get_state(), saved['heater_bed'])
+        restored.run('PREDICT_BED_HEATUP TARGET=90 FROM=25')
+        self.assertIsNotNone(restored.plugin.predicted_heatup['seconds'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import json
+import os
+import unittest
+
+import rigs
+import standins
+
+class TestStepperBrake(unittest.TestCase):
+
+    def make_rig(self, **kwargs):
+        rig = rigs.stepper_brake(**kwargs)
+        self.addCleanup(rig.close)
+        return rig
+
+    def pin_values(self, brake, index=0):
+        return [value for print_time, value in brake._pin_objs[index].events]
+
+    def test_steppers_are_registered(self):
+        rig = self.make_rig()
+        self.assertTrue(rig.plugin.initialized)
+        for name in rigs.Z_STEPPERS:
+            self.assertTrue(rig.plugin.is_engaged(name))
+
+    def test_auto_release_and_engage(self):
+        rig = self.make_rig()
+        rigs.motor_enable(rig)
+        self.assertFalse(rig.plugin.is_engaged('stepper_z'))
+        rig.stepper_enable.motor_off()
+        self.assertTrue(rig.plugin.is_engaged('stepper_z'))
+        # one pin write per event, whatever the number of steppers
+        self.assertEqual(self.pin_values(rig.plugin), [0, 1])
+        self.assertEqual(rig.plugin.get_status(rig.reactor.monotonic())['cycles'], 1)
+
+    def test_status(self):
+        rig = self.make_rig()
+        status = rig.plugin.get_status(rig.reactor.monotonic())
+        self.assertTrue(status['engaged'])
+        self.assertEqual(len(status['steppers']), 4)
+        rig.run('STEPPER_BRAKE_STATUS')
+        self.assertIs(rig.plugin.get_status(rig.reactor.monotonic()), status)
+        rigs.motor_enable(rig)
+        response = rig.printer.lookup_object('webhooks').call(
+            'uboe/status_changes', object='stepper_brake z', version=status['version'])
+        self.assertFalse(response['changes']['engaged'])
+        self.assertIsNotNone(response['changes']['released_since'])
+
+    def test_engage_delay(self):
+        rig = self.make_rig(groups={'z': {'pin': 'PA1', 'stepper': 'stepper_z',
+                                          'engage_delay': 2.}})
+        rigs.motor_enable(rig)
+        rig.stepper_enable.motor_off()
+        rig.advance(.5)
+        rigs.motor_enable(rig)
+        rig.advance(5.)
+        self.assertEqual(self.pin_values(rig.plugin), [0])
+        rig.stepper_enable.motor_off()
+        rig.advance(5.)
+        self.assertEqual(self.pin_values(rig.plugin), [0, 1])
+
+    def test_release_lead_time(self):
+        rig = self.make_rig(groups={'z': {'pin': 'PA1', 'stepper': 'stepper_z',
+                                          'release_lead_time': .05}})
+        self.assertEqual(rig.toolhead.step_generation_scan_times, [.1])
+        rig.toolhead.dwell(1.)
+        move_time = rig.toolhead.get_last_move_time()
+        rig.stepper_enable.lookup_enable('stepper_z').motor_enable(move_time)
+        release_time = rig.plugin._pin_objs[0].events[-1][0]
+        self.assertAlmostEqual(move_time - release_time, .05)
+        self.assertEqual(rig.plugin.missed_lead_count, 0)
+
+    def test_missed_lead_time_pushes_later_moves(self):
+        rig = self.make_rig(groups={'z': {'pin': 'PA1', 'stepper': 'stepper_z',
+                                          'release_lead_time': .2}})
+        # Steps generated too late: the release cannot precede the move by
+        # the full lead time and no latency is reported for it
+        move_time = rig.reactor.monotonic() + .1
+        rig.stepper_enable.lookup_enable('stepper_z').motor_enable(move_time)
+        rig.advance(.01)
+        self.assertEqual(rig.toolhead.dwells, [])
+        self.assertEqual(rig.plugin.last_added_latency, 0.)
+        self.assertEqual(rig.plugin.missed_lead_count, 1)
+        self.assertAlmostEqual(rig.plugin.max_missed_lead, .15)
+        self.assertAlmostEqual(rig.toolhead.step_generation_scan_times[-1], .4)
+        # a later release with time to spare gives the extra delay back
+        rig.stepper_enable.motor_off()
+        rig.advance(5.)
+        move_time = rig.reactor.monotonic() + 1.
+        rig.stepper_enable.lookup_enable('stepper_z').motor_enable(move_time)
+        rig.advance(.01)
+        self.assertEqual(rig.plugin.missed_lead_count, 1)
+        self.assertAlmostEqual(rig.toolhead.step_generation_scan_times[-1], .25)
+
+    def test_pins_on_several_mcus(self):
+        rig = self.make_rig(groups={'z': {'pin': 'PA1, ebb:PB2', 'stepper': 'stepper_z'}},
+                            mcu_offsets={'ebb': .002})
+        rigs.motor_enable(rig)
+        self.assertEqual(self.pin_values(rig.plugin, 0), [0])
+        self.assertEqual(self.pin_values(rig.plugin, 1), [0])
+        self.assertAlmostEqual(rig.plugin.max_estimated_skew, .002)
+
+    def test_commands(self):
+        rig = self.make_rig()
+        rig.run('STEPPER_BRAKE_RELEASE STEPPER=z')
+        self.assertFalse(rig.plugin.is_engaged('stepper_z'))
+        rig.run('SET_PIN PIN=z VALUE=0')
+        self.assertTrue(rig.plugin.is_engaged('stepper_z'))
+        rig.run('STEPPER_BRAKE_STATUS')
+        self.assertIn('  stepper_z: ENGAGED', rig.gcode.responses)
+        with self.assertRaises(standins.CommandError):
+            rig.run('STEPPER_BRAKE_ENGAGE STEPPER=x')
+
+    def test_several_groups(self):
+        rig = self.make_rig(groups={
+            'front': {'pin': 'PA1', 'stepper': 'stepper_z, stepper_z3'},
+            'rear': {'pin': 'PA2', 'stepper': 'stepper_z1, stepper_z2'}})
+        rig.run('STEPPER_BRAKE_RELEASE STEPPER=z1')
+        self.assertTrue(rig.brakes['front'].is_engaged('stepper_z'))
+        self.assertFalse(rig.brakes['rear'].is_engaged('stepper_z1'))
+
+    def test_stepper_in_two_groups(self):
+        with self.assertRaises(standins.ConfigError):
+            self.make_rig(groups={'a': {'pin': 'PA1', 'stepper': 'stepper_z'},
+                                  'b': {'pin': 'PA2', 'stepper': 'stepper_z'}})
+
+    def test_stats_written_on_disconnect(self):
+        rig = self.make_rig()
+        rigs.motor_enable(rig)
+        rig.stepper_enable.motor_off()
+        rig.printer.send_event("klippy:disconnect")
+        with open(rig.plugin.stats.filename) as f:
+            self.assertEqual(json.load(f)['cycles'], 1)
+        self.assertEqual(os.path.dirname(rig.plugin.stats.filename), rig.tmpdir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import unittest
+
+import rigs
+
+class TestUboeProfiler(unittest.TestCase):
+
+    def make_rig(self, factory, **options):
+        rig = factory()
+        self.addCleanup(rig.close)
+        profiler = rigs.add_profiler(rig, **options)
+        return rig, profiler
+
+    def test_wraps_plugin_commands(self):
+        rig, profiler = self.make_rig(rigs.stepper_brake, commands='SET_PIN')
+        self.assertEqual(sorted(profiler.profiles), [
+            'SET_PIN', 'STEPPER_BRAKE_ENGAGE', 'STEPPER_BRAKE_RELEASE',
+            'STEPPER_BRAKE_STATUS'])
+        rig.run('STEPPER_BRAKE_RELEASE STEPPER=z')
+        rig.run('STEPPER_BRAKE_STATUS')
+        self.assertFalse(rig.plugin.is_engaged('stepper_z'))
+        self.assertEqual(profiler.profiles['STEPPER_BRAKE_RELEASE'].calls, 1)
+        self.assertEqual(sum(profiler.profiles['STEPPER_BRAKE_STATUS'].wall.counts), 1)
+
+    def test_wraps_declared_commands_only(self):
+        rig, profiler = self.make_rig(rigs.uboe_tenor)
+        self.assertEqual(sorted(profiler.profiles), sorted(rig.plugin.gcode_commands))
+        rig.run('ECHO_UBOE_TENOR')
+        self.assertEqual(profiler.profiles['ECHO_UBOE_TENOR'].calls, 1)
+
+    def test_blocking_excludes_pauses(self):
+        rig, profiler = self.make_rig(rigs.quad_pad_bed_heater)
+        rig.run('PID_CALIBRATE HEATER=heater_bed TARGET=60')
+        profile = profiler.profiles['PID_CALIBRATE']
+        self.assertEqual(profile.calls, 1)
+        self.assertLess(profile.blocking.total, profile.wall.total)
+
+    def test_dump(self):
+        rig, profiler = self.make_rig(rigs.quad_pad_bed_heater, cprofile_slowest=2)
+        for i in range(3):
+            rig.run('M140 S%d' % (40 + i,))
+        filename = os.path.join(rig.tmpdir, 'profile.txt')
+        rig.run('UBOE_PROFILE_DUMP FILE=%s RESET=1' % (filename,))
+        with open(filename) as f:
+            report = f.read()
+        self.assertIn('M140: calls=3', report)
+        self.assertEqual(report.count("cProfile of 'M140"), 2)
+        self.assertEqual(profiler.profiles['M140'].calls, 0)
+
+    def test_dump_cache_stats(self):
+        rig, profiler = self.make_rig(rigs.klipper_macros)
+        rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=extruder TARGET=200')
+        rig.run('SET_HEATER_TEMPERATURE_COMPENSATE HEATER=extruder TARGET=200')
+        filename = os.path.join(rig.tmpdir, 'profile.txt')
+        rig.run('UBOE_PROFILE_DUMP FILE=%s' % (filename,))
+        with open(filename) as f:
+            report = f.read()
+        self.assertIn('klipper_macros: hits=1 misses=1', report)
+
+    def test_startup_report(self):
+        rig, profiler = self.make_rig(rigs.uboe_tenor)
+        rig.run('UBOE_STARTUP_REPORT')
+        report = rig.gcode.responses[-1].split('\n')
+        self.assertTrue(report[0].startswith('uboe_tenor: config='))
+        self.assertIn('connect=', report[0])
+        self.assertTrue(report[-1].startswith('uboe startup total: '))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+import standins
+
+standins.install_modules()
+from extras.uboe_status import VersionedStatus, register_status
+
+class TestVersionedStatus(unittest.TestCase):
+
+    def test_same_object_until_change(self):
+        status = VersionedStatus({'a': 1, 'b': [1, 2]})
+        first = status.get()
+        self.assertFalse(status.update({'a': 1, 'b': [1, 2]}))
+        self.assertIs(status.get(), first)
+        self.assertTrue(status.set('a', 2))
+        self.assertIsNot(status.get(), first)
+        self.assertEqual(first['a'], 1)
+        self.assertEqual(status.get(), {'a': 2, 'b': [1, 2], 'version': 2})
+
+    def test_changed_since(self):
+        status = VersionedStatus({'a': 1, 'b': 1})
+        version = status.version
+        status.set('b', 2)
+        status.set('c', 3)
+        self.assertEqual(status.changed_since(version), {'b': 2, 'c': 3})
+        self.assertEqual(status.changed_since(0), {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(status.changed_since(status.version), {})
+
+    def test_endpoint(self):
+        printer = standins.Printer()
+        status = register_status(printer, 'foo', {'a': 1})
+        webhooks = printer.lookup_object('webhooks')
+        status.set('a', 2)
+        response = webhooks.call('uboe/status_changes', object='foo', version=1)
+        self.assertEqual(response, {'version': 2, 'changes': {'a': 2}})
+        with self.assertRaises(standins.WebRequestError):
+            webhooks.call('uboe/status_changes', object='bar')
+
+if __name__ == '__main__':
+    unittest.main()
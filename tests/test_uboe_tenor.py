@@ -0,0 +1,234 @@
+import gc
+import unittest
+
+import rigs
+import standins
+
+class TestUboeTenor(unittest.TestCase):
+
+    def setUp(self):
+        self.rig = rigs.uboe_tenor()
+
+    def tearDown(self):
+        self.rig.close()
+        # the plugin finds the TMC helpers through gc: drop the previous rig's
+        del self.rig
+        gc.collect()
+
+    def replace_rig(self, **options):
+        self.tearDown()
+        self.rig = rigs.uboe_tenor(**options)
+        return self.rig
+
+    def test_safeguard_rail(self):
+        rail = self.rig.plugin.safeguard_rail
+        self.assertEqual([name for endstop, name in rail.endstops],
+                         ['safeguard_z', 'safeguard_z1', 'safeguard_z2', 'safeguard_z3'])
+        self.assertEqual(len(self.rig.printer.lookup_object('query_endstops').endstops), 4)
+        self.assertEqual(self.rig.printer.lookup_object('ratos_homing').z_hop, 0)
+
+    def test_idle_and_wake_up(self):
+        self.rig.run('IDLE_MOTORS')
+        for helper in self.rig.current_helpers.values():
+            self.assertAlmostEqual(helper.run_current, 1.2 * .4)
+        self.assertEqual(self.rig.toolhead.kin.limits, [(1.0, -1.0)] * 3)
+        self.assertEqual(self.rig.qgl.z_status.resets, 1)
+        self.assertFalse(self.rig.plugin.woken_up)
+        self.rig.run('WAKE_UP')
+        for helper in self.rig.current_helpers.values():
+            self.assertAlmostEqual(helper.run_current, 1.2)
+        self.assertTrue(self.rig.plugin.woken_up)
+
+    def test_auto_idle_and_wake(self):
+        rig = self.replace_rig(auto_idle_timeout=60.)
+        helper = rig.current_helpers['stepper_z']
+        rig.toolhead.kin.limits = [(0., 300.)] * 3
+        rig.advance(30.)
+        self.assertAlmostEqual(helper.run_current, 1.2)
+        rig.advance(40.)
+        self.assertAlmostEqual(helper.run_current, 1.2 * .4)
+        self.assertTrue(rig.plugin.motors_idle)
+        # the axes may have moved at the idle current: homing is required
+        self.assertEqual(rig.toolhead.kin.limits, [(1.0, -1.0)] * 3)
+        with self.assertRaises(standins.CommandError):
+            rig.toolhead.move((10., 10., 10., 0.), 100.)
+        self.assertTrue(rig.plugin.motors_idle)
+        # the first move after homing wakes the motors up at the print time
+        # the toolhead resynced to, before the move itself
+        rig.advance(10.)
+        rig.toolhead.kin.limits = [(0., 300.)] * 3
+        rig.toolhead.move((10., 10., 10., 0.), 100.)
+        self.assertAlmostEqual(helper.run_current, 1.2)
+        wake_time, current = helper.history[-1]
+        self.assertAlmostEqual(wake_time, rig.reactor.monotonic() + rig.toolhead.BUFFER_TIME)
+        self.assertLess(wake_time, rig.toolhead.print_time)
+        self.assertTrue(rig.plugin.woken_up)
+        # idle again after another period without activity
+        rig.advance(61.)
+        self.assertTrue(rig.plugin.motors_idle)
+
+    def test_auto_idle_waits_for_gcode(self):
+        rig = self.replace_rig(auto_idle_timeout=60.)
+        rig.gcode.mutex.locked = True
+        rig.advance(70.)
+        self.assertFalse(rig.plugin.motors_idle)
+        rig.gcode.mutex.locked = False
+        rig.advance(2.)
+        self.assertTrue(rig.plugin.motors_idle)
+
+    def test_auto_idle_skipped_during_print(self):
+        rig = self.replace_rig(auto_idle_timeout=60.)
+        rig.pause_resume.is_paused = True
+        rig.print_stats.state = 'paused'
+        rig.advance(130.)
+        self.assertFalse(rig.plugin.motors_idle)
+        rig.pause_resume.is_paused = False
+        rig.print_stats.state = 'printing'
+        rig.advance(130.)
+        self.assertFalse(rig.plugin.motors_idle)
+        # the timer keeps running: idle once the print is over
+        rig.print_stats.state = 'complete'
+        rig.advance(61.)
+        self.assertTrue(rig.plugin.motors_idle)
+
+    def retained_idle(self, probe_results):
+        rig = self.replace_rig(retain_position=True)
+        results = iter(probe_results)
+        def probe(gcmd):
+            # like the probe, through a homing move
+            rig.printer.send_event("homing:homing_move_begin", None)
+            rig.probe.last_z_result = next(results)
+            rig.printer.send_event("homing:homing_move_end", None)
+        rig.gcode.register_command('PROBE', probe)
+        rig.toolhead.kin.limits = [(0., 300.)] * 3
+        # safeguards selected, but not homed through
+        rig.run('SET_Z_SAFEGUARDS')
+        rig.run('IDLE_MOTORS')
+        self.assertEqual(rig.toolhead.kin.limits, [(1.0, -1.0)] * 3)
+        self.assertFalse(rig.qgl.z_status.applied)
+        rig.run('WAKE_UP')
+        return rig
+
+    def test_retained_position_rejected_with_auto_idle(self):
+        self.tearDown()
+        with self.assertRaises(standins.ConfigError):
+            rigs.uboe_tenor(retain_position=True, auto_idle_timeout=60.)
+        self.rig = rigs.uboe_tenor()
+
+    def test_retained_position_restored(self):
+        rig = self.retained_idle([.100, .105])
+        self.assertEqual(rig.toolhead.kin.limits, [(0., 300.)] * 3)
+        self.assertTrue(rig.qgl.z_status.applied)
+        self.assertEqual(rig.gcode.scripts.count('PROBE'), 2)
+        # absolute, lifted travel whatever the G-code state was
+        self.assertEqual(rig.gcode.scripts[:7], [
+            'SAVE_GCODE_STATE NAME=uboe_retain_position', 'G90', 'G0 Z5 F6000',
+            'G1 X150.0 Y150.0 F6000', 'PROBE', 'G0 Z5 F6000',
+            'RESTORE_GCODE_STATE NAME=uboe_retain_position'])
+        self.assertIsNone(rig.plugin.retained_state)
+        # the state from before the reference probe
+        self.assertIsNone(rig.plugin.get_status(0.)['safeguard_state'])
+
+    def test_retained_position_drifted(self):
+        rig = self.retained_idle([.100, .2])
+        self.assertEqual(rig.toolhead.kin.limits, [(1.0, -1.0)] * 3)
+        self.assertFalse(rig.qgl.z_status.applied)
+        self.assertIsNone(rig.plugin.get_status(0.)['safeguard_state'])
+        self.assertIn('homing is required', rig.gcode.responses[-1])
+
+    def test_retained_position_lost_on_motor_off(self):
+        rig = self.replace_rig(retain_position=True)
+        rig.toolhead.kin.limits = [(0., 300.)] * 3
+        rig.run('IDLE_MOTORS')
+        self.assertIsNotNone(rig.plugin.retained_state)
+        rig.printer.send_event("stepper_enable:motor_off", 1.)
+        rig.run('WAKE_UP')
+        self.assertEqual(rig.gcode.scripts.count('PROBE'), 1)
+        self.assertEqual(rig.toolhead.kin.limits, [(1.0, -1.0)] * 3)
+
+    def test_z_endstop_selection(self):
+        kin = self.rig.toolhead.kin
+        self.rig.run('SET_Z_ENDSTOPS')
+        self.assertIs(kin.rails[2], self.rig.plugin.prev_z_rail)
+        self.assertEqual(self.rig.printer.lookup_object('ratos_homing').z_hop, 10.)
+        self.rig.run('SET_Z_SAFEGUARDS')
+        self.assertIs(kin.rails[2], self.rig.plugin.safeguard_rail)
+        self.rig.printer.send_event("homing:homing_move_begin", None)
+        self.rig.printer.send_event("homing:homing_move_end", None)
+        self.assertEqual(self.rig.plugin.get_status(0.)['safeguard_state'], 'done')
+        self.rig.printer.send_event("stepper_enable:motor_off", 1.)
+        self.assertIsNone(self.rig.plugin.get_status(0.)['safeguard_state'])
+
+    def test_heatsoak(self):
+        self.rig.run('HEATSOAK ITERATIONS=3')
+        scripts = self.rig.gcode.scripts
+        # already cold: no cooldown wait, no fan
+        self.assertEqual(scripts[:3], ['G28', 'QUAD_GANTRY_LEVEL', 'M106 S0'])
+        self.assertEqual(scripts.count('PROBE SAMPLES_TOLERANCE_RETRIES=10'), 3)
+        self.assertEqual(scripts[-1], 'TURN_OFF_HEATERS')
+
+    def test_heatsoak_cooldown(self):
+        rig = self.rig
+        rig.bed.last_temp = rig.bed.smoothed_temp = 80.
+        rig.extruder.last_temp = rig.extruder.smoothed_temp = 120.
+        qgl_temps = []
+        rig.gcode.register_command('QUAD_GANTRY_LEVEL', lambda gcmd: qgl_temps.append(
+            (rig.reactor.monotonic(), rig.bed.smoothed_temp, rig.extruder.smoothed_temp)))
+        timers = len(rig.reactor.timers)
+        rig.run('HEATSOAK ITERATIONS=1')
+        scripts = rig.gcode.scripts
+        # homing right away, levelling once the bed is nearly cooled down
+        # while the nozzle is still cooling
+        self.assertEqual(scripts[0], 'G28')
+        (qgl_time, bed_temp, nozzle_temp), = qgl_temps
+        self.assertLessEqual(bed_temp, 43.)
+        self.assertGreater(bed_temp, 40.)
+        self.assertGreater(nozzle_temp, 50.)
+        # the fan slows down as the excess temperature drops, then stops
+        fan = [int(s.split('S')[1]) for s in scripts[:scripts.index('M106 S0') + 1]
+               if s.startswith('M106')]
+        self.assertEqual(fan[:3], [255, 230, 204])
+        self.assertEqual(fan[-1], 0)
+        self.assertLess(len(fan), 20)
+        self.assertLessEqual(rig.extruder.smoothed_temp, 50.)
+        self.assertEqual(len(rig.reactor.timers), timers)
+
+    def test_heatsoak_cooldown_quad_pad(self):
+        rig = self.replace_rig(quad_pad=True)
+        for pad in rig.pads:
+            pad.last_temp = pad.smoothed_temp = 60.
+        rig.pads[2].last_temp = rig.pads[2].smoothed_temp = 80.
+        targets = []
+        qgl_temps = []
+        rig.gcode.register_command('G28', lambda gcmd: targets.append(
+            [pad.target_temp for pad in rig.pads]))
+        rig.gcode.register_command('QUAD_GANTRY_LEVEL', lambda gcmd: qgl_temps.append(
+            [pad.smoothed_temp for pad in rig.pads]))
+        rig.run('HEATSOAK ITERATIONS=1')
+        # every pad cools down, levelling waits for the hottest one
+        self.assertEqual(targets, [[40.] * 4])
+        self.assertLessEqual(max(qgl_temps[0]), 43.)
+
+    def test_heatsoak_calibrate_stabilizes(self):
+        self.rig.run('HEATSOAK ACTION=calibrate')
+        scripts = self.rig.gcode.scripts
+        # five identical probe results are within tolerance: stop right there
+        self.assertEqual(scripts.count('PROBE SAMPLES_TOLERANCE_RETRIES=10'), 5)
+
+    def test_status_only_changes_with_state(self):
+        status = self.rig.plugin.get_status(0.)
+        self.assertIs(self.rig.plugin.get_status(1.), status)
+        self.rig.run('IDLE_MOTORS')
+        idle_status = self.rig.plugin.get_status(2.)
+        self.assertFalse(idle_status['woken_up'])
+        self.assertTrue(status['woken_up'])
+        self.assertEqual(self.rig.plugin.status.changed_since(status['version']),
+                         {'woken_up': False})
+
+    def test_echo(self):
+        self.rig.run('ECHO_UBOE_TENOR')
+        title, type, msg = self.rig.ratos.echoes[-1]
+        self.assertEqual(title, 'UboeTenor configuration')
+
+if __name__ == '__main__':
+    unittest.main()
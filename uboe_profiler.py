@@ -0,0 +1,243 @@
+# Opt-in G-code latency profiling of the uboe plugins
+#
+# Copyright (C) 2026 Yannick Le Provost <yannick.leprovost@uboe.fr>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import cProfile
+import heapq
+import io
+import logging
+import os
+import pstats
+import time
+
+# Upper bounds (ms) of the histogram buckets; the last bucket is unbounded
+BUCKETS_MS = (1., 2., 5., 10., 20., 50., 100., 200., 500., 1000., 2000.,
+              5000., 10000., 30000., 60000.)
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.
+        self.max = 0.
+    def add(self, seconds):
+        ms = seconds * 1000.
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                break
+        else:
+            i = len(BUCKETS_MS)
+        self.counts[i] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+    def format(self):
+        out = []
+        low = 0.
+        for bound, count in zip(BUCKETS_MS + (None,), self.counts):
+            if count:
+                if bound is None:
+                    out.append(">%gms:%d" % (low, count))
+                else:
+                    out.append("<=%gms:%d" % (bound, count))
+            low = bound
+        return " ".join(out)
+
+class CommandProfile:
+    # Statistics of one profiled command
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = Histogram()
+        self.blocking = Histogram()
+
+class UboeProfiler:
+    '''
+    Wraps the G-code commands registered by the uboe plugins and records, per
+    command, the wall-clock time and the reactor-blocking time (wall time
+    minus the time spent in reactor.pause, i.e. while other reactor work
+    could run) into fixed-bucket histograms.
+    '''
+    def __init__(self, config):
+        start = time.perf_counter()
+        self.printer = config.get_printer()
+        self.reactor = self.printer.get_reactor()
+        self.gcode = self.printer.lookup_object('gcode')
+        # Extra commands to profile on top of the uboe plugins' own ones
+        self.extra_commands = [c.upper() for c in config.getlist('commands', [])]
+        # Keep a cProfile capture of the N slowest calls (0 disables)
+        self.cprofile_slowest = config.getint('cprofile_slowest', 0, minval=0)
+        self.default_file = config.get('dump_file', '/tmp/uboe_profile.txt')
+        self.profiles = {}
+        self._slowest = []
+        self._seq = 0
+        # Stack of the commands being run: [start, paused] per command
+        self._active = []
+        self._pause_start = None
+        self._orig_pause = None
+        self.printer.register_event_handler("klippy:ready", self._handle_ready)
+        self.gcode.register_command('UBOE_PROFILE_DUMP', self.cmd_UBOE_PROFILE_DUMP,
+                                    desc=self.cmd_UBOE_PROFILE_DUMP_help)
+        self.gcode.register_command('UBOE_STARTUP_REPORT', self.cmd_UBOE_STARTUP_REPORT,
+                                    desc=self.cmd_UBOE_STARTUP_REPORT_help)
+        self.startup_times = {'config': time.perf_counter() - start}
+
+    def _handle_ready(self):
+        start = time.perf_counter()
+        # Every plugin has registered its commands by now
+        for cmd in self._find_commands():
+            self._wrap_command(cmd)
+        self._orig_pause = self.reactor.pause
+        self.reactor.pause = self._pause
+        self.startup_times['ready'] = time.perf_counter() - start
+
+    def _find_commands(self):
+        # The uboe plugins list their commands in gcode_commands: the
+        # registered handlers cannot be traced back to a plugin, as Klipper
+        # wraps extended commands in a lambda
+        commands = set(self.extra_commands)
+        for name, obj in self.printer.lookup_objects():
+            commands.update(getattr(obj, 'gcode_commands', ()))
+        return sorted(cmd for cmd in commands
+                      if cmd in self.gcode.ready_gcode_handlers)
+
+    def _wrap_command(self, cmd):
+        func = self.gcode.register_command(cmd, None)
+        profile = self.profiles[cmd] = CommandProfile(cmd)
+        def wrapper(gcmd):
+            self._run(profile, func, gcmd)
+        self.gcode.register_command(cmd, wrapper, desc=self.gcode.gcode_help.get(cmd))
+
+    def _pause(self, waketime):
+        # Time in reactor.pause is charged to the innermost running command.
+        # Pauses started while another one is in progress (other greenlets)
+        # are not counted twice.
+        if not self._active or self._pause_start is not None:
+            return self._orig_pause(waketime)
+        self._pause_start = start = time.perf_counter()
+        try:
+            return self._orig_pause(waketime)
+        finally:
+            self._pause_start = None
+            if self._active:
+                self._active[-1][1] += time.perf_counter() - start
+
+    def _run(self, profile, func, gcmd):
+        frame = [time.perf_counter(), 0.]
+        profiler = None
+        if self.cprofile_slowest and not self._active:
+            profiler = cProfile.Profile()
+        self._active.append(frame)
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                func(gcmd)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            self._active.pop()
+            wall = time.perf_counter() - frame[0]
+            profile.calls += 1
+            profile.wall.add(wall)
+            profile.blocking.add(max(0., wall - frame[1]))
+            if self._active:
+                # A nested command's pauses also paused its caller
+                self._active[-1][1] += frame[1]
+            if profiler is not None:
+                self._keep_slowest(wall, gcmd.get_commandline(), profiler)
+
+    def _keep_slowest(self, wall, commandline, profiler):
+        self._seq += 1
+        entry = (wall, self._seq, commandline, profiler)
+        if len(self._slowest) < self.cprofile_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif wall > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def reset(self):
+        for cmd in self.profiles:
+            self.profiles[cmd] = CommandProfile(cmd)
+        self._slowest = []
+
+    def format_startup_report(self):
+        # Config-load and connect/ready phase times of every object that
+        # records them in a startup_times dict
+        lines = []
+        total = 0.
+        for name, obj in self.printer.lookup_objects():
+            times = getattr(obj, 'startup_times', None)
+            if not times:
+                continue
+            obj_total = sum(times.values())
+            total += obj_total
+            lines.append("%s: %s total=%.3f" % (name, " ".join(
+                "%s=%.3f" % (phase, t * 1000.) for phase, t in times.items()),
+                obj_total * 1000.))
+        lines.append("uboe startup total: %.3fms" % (total * 1000.,))
+        return lines
+
+    def format_cache_report(self):
+        # Hit/miss counters of every object exposing get_cache_stats(); kept
+        # out of the plugins' status so counting does not bump its version
+        lines = []
+        for name, obj in self.printer.lookup_objects():
+            get_cache_stats = getattr(obj, 'get_cache_stats', None)
+            if get_cache_stats is None:
+                continue
+            lines.append("%s: %s" % (name, " ".join(
+                "%s=%d" % (k, v) for k, v in sorted(get_cache_stats().items()))))
+        return lines
+
+    def format_report(self):
+        lines = ["uboe startup (times in ms)"]
+        lines.extend(self.format_startup_report())
+        lines.append("")
+        cache_lines = self.format_cache_report()
+        if cache_lines:
+            lines.append("uboe caches")
+            lines.extend(cache_lines)
+            lines.append("")
+        lines.append("uboe command profile (times in ms)")
+        for cmd, profile in sorted(self.profiles.items()):
+            if not profile.calls:
+                continue
+            lines.append("%s: calls=%d wall avg=%.3f max=%.3f blocking avg=%.3f max=%.3f" % (
+                cmd, profile.calls,
+                profile.wall.total / profile.calls * 1000., profile.wall.max * 1000.,
+                profile.blocking.total / profile.calls * 1000.,
+                profile.blocking.max * 1000.))
+            lines.append("  wall:     " + profile.wall.format())
+            lines.append("  blocking: " + profile.blocking.format())
+        for wall, seq, commandline, profiler in sorted(self._slowest, reverse=True):
+            out = io.StringIO()
+            stats = pstats.Stats(profiler, stream=out)
+            stats.sort_stats('cumulative').print_stats(25)
+            lines.append("")
+            lines.append("cProfile of '%s' (%.3fms):" % (commandline, wall * 1000.))
+            lines.append(out.getvalue())
+        return "\n".join(lines)
+
+    cmd_UBOE_PROFILE_DUMP_help = "Write the uboe command latency profile to a file. Usage: UBOE_PROFILE_DUMP [FILE=<path>] [RESET=<0|1>]"
+    def cmd_UBOE_PROFILE_DUMP(self, gcmd):
+        filename = os.path.expanduser(gcmd.get('FILE', self.default_file))
+        report = self.format_report()
+        try:
+            with open(filename, 'w') as f:
+                f.write(report)
+        except Exception:
+            msg = "Unable to write profile to %s" % (filename,)
+            logging.exception(msg)
+            raise gcmd.error(msg)
+        calls = sum(p.calls for p in self.profiles.values())
+        gcmd.respond_info("Profile of %d commands (%d calls) written to %s"
+                          % (len(self.profiles), calls, filename))
+        if gcmd.get_int('RESET', 0, minval=0, maxval=1):
+            self.reset()
+
+    cmd_UBOE_STARTUP_REPORT_help = "Report the config-load and connect times (ms) of the uboe plugins"
+    def cmd_UBOE_STARTUP_REPORT(self, gcmd):
+        gcmd.respond_info("\n".join(self.format_startup_report()))
+
+def load_config(config):
+    return UboeProfiler(config)
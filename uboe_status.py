@@ -0,0 +1,75 @@
+# Versioned, change-only status objects shared by the uboe plugins
+#
+# Copyright (C) 2026 Yannick Le Provost <yannick.leprovost@uboe.fr>
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+
+class VersionedStatus:
+    '''
+    Status dict handed out by a plugin's get_status().
+
+    The same dict object is returned until a value actually changes; a
+    change copies the dict (copy-on-write), so status subscribers holding
+    the previous object still see the old values. Every change bumps
+    'version' and records, per key, the version it last changed in, so a
+    client can ask for the changes since the version it last saw.
+    Values must be replaced, never mutated in place.
+    '''
+    def __init__(self, initial=None):
+        self.version = 0
+        self._key_versions = {}
+        self._status = {'version': 0}
+        if initial:
+            self.update(initial)
+    def get(self):
+        return self._status
+    def update(self, values):
+        changed = [key for key, value in values.items()
+                   if key not in self._status or self._status[key] != value]
+        if not changed:
+            return False
+        self.version += 1
+        status = dict(self._status)
+        for key in changed:
+            status[key] = values[key]
+            self._key_versions[key] = self.version
+        status['version'] = self.version
+        self._status = status
+        return True
+    def set(self, key, value):
+        return self.update({key: value})
+    def changed_since(self, version):
+        return {key: self._status[key] for key, key_version in self._key_versions.items()
+                if key_version > version}
+
+class StatusEndpoint:
+    # The "uboe/status_changes" webhooks endpoint: returns the changes of
+    # one object's status since a version. A new printer (config load or
+    # FIRMWARE_RESTART) starts a fresh index.
+    def __init__(self):
+        self.printer = None
+        self.statuses = {}
+    def add(self, printer, name, status):
+        if printer is not self.printer:
+            self.printer = printer
+            self.statuses = {}
+            webhooks = printer.lookup_object('webhooks', None)
+            if webhooks is not None:
+                webhooks.register_endpoint("uboe/status_changes", self._handle_request)
+        self.statuses[name] = status
+    def _handle_request(self, web_request):
+        name = web_request.get_str('object')
+        version = web_request.get_int('version', 0)
+        status = self.statuses.get(name)
+        if status is None:
+            raise web_request.error("Unknown object '%s'" % (name,))
+        web_request.send({'version': status.version,
+                          'changes': status.changed_since(version)})
+
+_endpoint = StatusEndpoint()
+
+def register_status(printer, name, initial=None):
+    """Create the VersionedStatus of object 'name' and expose its changes."""
+    status = VersionedStatus(initial)
+    _endpoint.add(printer, name, status)
+    return status
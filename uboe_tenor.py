@@ -2,24 +2,45 @@ import gc
 import sys
 import copy
 import logging
+import time
 import mcu
-from extras.tmc import TMCCommandHelper
+from typing import TYPE_CHECKING
 
 from configfile import (
    ConfigWrapper,
    error as ConfigError
 )
-from toolhead import ToolHead
-from stepper import (
-	GenericPrinterRail,
- 	error as StepperError
-)
-from kinematics.ratos_hybrid_corexy import RatOSHybridCoreXYKinematics
+from stepper import error as StepperError
+from .uboe_status import register_status
+
+# Only needed for type hints: not imported at runtime
+if TYPE_CHECKING:
+	from toolhead import ToolHead
+	from stepper import GenericPrinterRail as PrinterRail
+	from kinematics.ratos_hybrid_corexy import RatOSHybridCoreXYKinematics
+
+# HEATSOAK cooldown: temperatures checked every COOLDOWN_CHECK_TIME seconds.
+# The part fan runs proportionally to the remaining excess temperature
+# (full speed COOLDOWN_FAN_BAND °C above the target, never below
+# COOLDOWN_FAN_MIN while cooling) and at full speed when cooling stalls
+# under COOLDOWN_STALL_RATE °C/s. Speeds are rounded to COOLDOWN_FAN_STEP
+# so that the fan is not updated every second.
+COOLDOWN_CHECK_TIME = 1.
+COOLDOWN_FAN_STEP = .1
+COOLDOWN_FAN_BAND = 20.
+COOLDOWN_FAN_MIN = .3
+COOLDOWN_STALL_RATE = .05
+# QUAD_GANTRY_LEVEL runs during the cooldown once the bed is this close
+# (°C) to its cooldown temperature
+COOLDOWN_QGL_MARGIN = 3.
 
 class UboeTenor:
 	def __init__(self, config : ConfigWrapper):
+		start = time.perf_counter()
 		self.config = config
 		self.printer = config.get_printer()
+		# Status published only on change (see uboe_status)
+		self.status = register_status(self.printer, config.get_name())
 		self.gcode = self.printer.lookup_object('gcode')
 		self.ratos = self.printer.lookup_object('ratos')
 		self.toolhead = None
@@ -27,11 +48,34 @@ class UboeTenor:
 		# motor idling
 		self.idle_motor_current_percentage = config.getfloat('idle_motor_current_percentage', 100.0, above=0., below=100.)
 		self.woken_up = False
+		self.motors_idle = False
 		self.kin_tmc_drivers = {}
+		# Idle the motors after this many seconds without toolhead activity and
+		# wake them up as soon as motion is queued again (0 disables)
+		self.auto_idle_timeout = config.getfloat('auto_idle_timeout', 0., minval=0.)
+		self.reactor = self.printer.get_reactor()
+		self._auto_idle_timer = None
+		self.pause_resume = None
+		self.print_stats = None
+		# Retained-position idling: IDLE_MOTORS probes a reference at the z
+		# offset probe location and records the homed/levelled state; WAKE_UP
+		# probes there again and restores that state if the result is within
+		# retain_position_tolerance (mm) of the reference. Both probes run
+		# G-code, which the automatic idle (a reactor timer) and wake up (a
+		# toolhead event) can't do: retain_position is IDLE_MOTORS/WAKE_UP only.
+		self.retain_position = config.getboolean('retain_position', False)
+		self.retain_position_tolerance = config.getfloat('retain_position_tolerance', 0.02, above=0.)
+		if self.retain_position and self.auto_idle_timeout:
+			raise config.error("retain_position can't be used with auto_idle_timeout in section '%s'" % (config.get_name(),))
+		self.retained_state = None
 
 		# z offset
 		self.z_offset_probe_x_coord = config.getfloat('z_offset_probe_x_coord')
 		self.z_offset_probe_y_coord = config.getfloat('z_offset_probe_y_coord')
+		self.status.update({
+			"z_offset_probe_x_coord": self.z_offset_probe_x_coord,
+			"z_offset_probe_y_coord": self.z_offset_probe_y_coord,
+		})
 
 		# z safeguard
 		self.z_safeguard_speed = config.getfloat('z_safeguard_speed', None, above=0.)
@@ -54,20 +98,52 @@ class UboeTenor:
 
 		self.printer.register_event_handler("klippy:mcu_identify", self.handle_ready)
 		self.printer.register_event_handler('klippy:connect', self.handle_connect)
+		if self.auto_idle_timeout:
+			self.printer.register_event_handler('klippy:ready', self._handle_klippy_ready)
+			self.printer.register_event_handler('toolhead:sync_print_time', self._handle_sync_print_time)
 		self.printer.register_event_handler("stepper_enable:motor_off", self._motor_off)
+		self.printer.register_event_handler("homing:home_rails_end", self._handle_home_rails_end)
 		self.gcode.register_command('SET_Z_SAFEGUARDS', self.cmd_set_z_safeguards, desc=self.cmd_set_z_safeguards_help)
 		self.gcode.register_command('SET_Z_ENDSTOPS', self.cmd_set_z_endstops, desc=self.cmd_set_z_endstops_help)
 		self.gcode.register_command('IDLE_MOTORS', self.cmd_idle_motors, desc=self.cmd_idle_motors_help)
 		self.gcode.register_command('WAKE_UP', self.cmd_wake_up, desc=self.cmd_wake_up_help)
 		self.gcode.register_command('HEATSOAK', self.cmd_HEATSOAK, desc=self.cmd_heatsoaK_help)
 		self.gcode.register_command('ECHO_UBOE_TENOR', self.cmd_echo_uboe_tenor, desc=self.cmd_echo_uboe_tenor_help)
+		# Commands profiled by uboe_profiler
+		self.gcode_commands = ('SET_Z_SAFEGUARDS', 'SET_Z_ENDSTOPS', 'IDLE_MOTORS', 'WAKE_UP', 'HEATSOAK', 'ECHO_UBOE_TENOR')
+		self.startup_times = {'config': time.perf_counter() - start}
+
+	# State exposed in the status: setting it publishes the change
+	@property
+	def safeguard_state(self):
+		return self._safeguard_state
+
+	@safeguard_state.setter
+	def safeguard_state(self, value):
+		self._safeguard_state = value
+		self.status.set("safeguard_state", value)
+
+	@property
+	def woken_up(self):
+		return self._woken_up
+
+	@woken_up.setter
+	def woken_up(self, value):
+		self._woken_up = value
+		self.status.set("woken_up", value)
 
 	def _motor_off(self, print_time):
+		# Unpowered motors may have moved: the retained state can't be trusted
+		self.retained_state = None
 		self.cmd_set_z_safeguards(None)
 		if self.safeguard_state:
 			self.safeguard_state = None
 			logging.info("UBOE : Motor off - Setting machine as unsafeguarded.")
 
+	def _handle_home_rails_end(self, homing_state, rails):
+		# Homed again: the retained state is obsolete
+		self.retained_state = None
+
 	def handle_homing_move_begin(self, eventtime):
 		if self.selected_endstops == "safeguards":
 			self.safeguard_state = "started"
@@ -87,6 +163,7 @@ class UboeTenor:
 			pheaters.available_sensors.pop(pheaters.available_sensors.index('temperature_sensor raspberry_pi'))
 
 	def _get_kin_tmcs(self):
+		from extras.tmc import TMCCommandHelper
 		for stepper in self.kin.get_steppers():
 			logging.debug("UBOE : interating on stepper %s" % (stepper.get_name(),))
 			self.kin_tmc_drivers.update({stepper.get_name(): {'tmc' : None, 'tmc_helper' : None, 'default_current' : None}})
@@ -111,12 +188,15 @@ class UboeTenor:
 							logging.info("UBOE : Found TMCCommandHelper for %s" % (stepper_name.lower(),))
 
 	def handle_connect(self):
+		start = time.perf_counter()
 		self._get_kin_tmcs()
+		self.startup_times['connect'] = time.perf_counter() - start
 
 	def _is_debug_enabled(self):
 		return self.printer.lookup_object('gcode_macro DEBUG_ECHO').get_status(self.toolhead.get_last_move_time)['enabled']
 
 	def handle_ready(self):
+		start = time.perf_counter()
 		self.toolhead : ToolHead = self.printer.lookup_object('toolhead')
 		self.kin : RatOSHybridCoreXYKinematics = self.toolhead.get_kinematics()
 		self._handle_host_temp_sensor()
@@ -206,24 +286,99 @@ class UboeTenor:
 					"Invalid homing_positive_dir / position_endstop in '%s'"
 					% (self.config.get_name(),))
 		self.woken_up = True
+		self.startup_times['mcu_identify'] = time.perf_counter() - start
 
-	cmd_idle_motors_help = "Idle the motors by reducing the current to a lower value specified by 'idle_motor_current'. This value should be  just enough to keep the z axis in place."
-	def cmd_idle_motors(self, gcmd):
+	def _set_kin_currents(self, percentage, print_time, from_command=True):
+		# Set the kinematic TMC currents to percentage of their default value
 		msg = []
-		title = "Idling motors... (idling current : %s%%)" % (self.idle_motor_current_percentage,)
 		for stepper, tmc_info in self.kin_tmc_drivers.items():
-			run_current = (tmc_info['default_current'] * self.idle_motor_current_percentage) / 100.
+			run_current = (tmc_info['default_current'] * percentage) / 100.
 			current_helper = tmc_info['tmc_helper']
 			if current_helper :
-				print_time = self.toolhead.get_last_move_time()
 				c = list(current_helper.get_current())
 				req_hold_cur, max_cur = c[2], c[3] # Kalico now has 5 elements rather than 4 in tuple, so unpack just what we need...
 				new_cur = max(min(run_current, max_cur), 0)
 				current_helper.set_current(new_cur, req_hold_cur, print_time)
-			else :
+			elif from_command :
 				self.gcode.run_script_from_command("SET_TMC_CURRENT STEPPER=%s CURRENT=%.2f" % (stepper, run_current))
-
+			else :
+				# G-code can't be run from a timer or a toolhead event
+				logging.warning("UBOE : No TMC current helper for %s, current left unchanged" % (stepper,))
+				continue
 			msg.append("tmc : %s, idle_current : %.2f (default : %.2f)" % (stepper, run_current, tmc_info['default_current']))
+		return msg
+
+	def _probe_reference(self):
+		# Probe at the z offset probe location, return the probed z. The
+		# travel is absolute and lifted whatever the current G-code state,
+		# which is restored afterwards.
+		self.gcode.run_script_from_command("SAVE_GCODE_STATE NAME=uboe_retain_position")
+		try:
+			self.gcode.run_script_from_command(
+				"G90\n"
+				"G0 Z5 F6000\n"
+				"G1 X%s Y%s F6000\n"
+				"PROBE\n"
+				"G0 Z5 F6000" % (self.z_offset_probe_x_coord, self.z_offset_probe_y_coord))
+		finally:
+			self.gcode.run_script_from_command("RESTORE_GCODE_STATE NAME=uboe_retain_position")
+		return self.printer.lookup_object('probe').get_status(self.toolhead.get_last_move_time())['last_z_result']
+
+	def _retain_state(self):
+		# Record the homed and levelled state before idling. Needs homed axes
+		# and a probe reference, so only done from IDLE_MOTORS.
+		if not all(low <= high for low, high in self.kin.limits):
+			return None
+		if self.printer.lookup_object('probe', None) is None:
+			logging.info("UBOE : No probe - can't retain position over idling.")
+			return None
+		z_adjusters = {}
+		for name in ('quad_gantry_level', 'z_tilt'):
+			z_adjuster = self.printer.lookup_object(name, None)
+			if z_adjuster is not None:
+				z_adjusters[name] = z_adjuster.z_status.applied
+		state = {
+			'limits': list(self.kin.limits),
+			'z_rail': self.kin.rails[2],
+			'selected_endstops': self.selected_endstops,
+			'safeguard_state': self.safeguard_state,
+			'z_adjusters': z_adjusters,
+		}
+		# Probing runs homing moves, which mark the safeguards as done when
+		# they are the selected endstops: record the state before it
+		state['reference'] = self._probe_reference()
+		return state
+
+	def _restore_state(self, gcmd):
+		# Check the retained position with one probe; restore the homed and
+		# levelled state only when it is within tolerance
+		retained, self.retained_state = self.retained_state, None
+		self.kin.limits = list(retained['limits'])
+		measured = self._probe_reference()
+		drift = measured - retained['reference']
+		if abs(drift) > self.retain_position_tolerance:
+			self.kin.limits = [(1.0, -1.0)] * 3
+			# The check probe's homing moves don't safeguard the machine
+			self.safeguard_state = None
+			gcmd.respond_info("Position drifted by %.4fmm while idle (tolerance %.4fmm): homing is required."
+							  % (drift, self.retain_position_tolerance))
+			return False
+		self.kin.rails[2] = retained['z_rail']
+		self.selected_endstops = retained['selected_endstops']
+		self.safeguard_state = retained['safeguard_state']
+		for name, applied in retained['z_adjusters'].items():
+			self.printer.lookup_object(name).z_status.applied = applied
+		gcmd.respond_info("Position retained while idle (drift %.4fmm): homing and levelling restored." % (drift,))
+		return True
+
+	def _idle_motors(self, print_time, from_command=True):
+		title = "Idling motors... (idling current : %s%%)" % (self.idle_motor_current_percentage,)
+		self.retained_state = None
+		if self.retain_position:
+			self.retained_state = self._retain_state()
+			print_time = self.toolhead.get_last_move_time()
+		msg = self._set_kin_currents(self.idle_motor_current_percentage, print_time, from_command)
+		self.motors_idle = True
 		# Note all axes as unhomed and unsafeguarded
 		self.kin.limits = [(1.0, -1.0)] * 3
 		self.safeguard_state = None
@@ -238,28 +393,64 @@ class UboeTenor:
 			self.ratos.console_echo(title, 'debug', '_N_'.join(msg))
 		self.woken_up = False
 
-	cmd_wake_up_help = "Restore the motors to their default current values."
-	def cmd_wake_up(self, gcmd):
+	def _wake_up(self, print_time, from_command=True):
 		title = "Restoring motors to default current..."
-		msg = []
-		for stepper, tmc_info in self.kin_tmc_drivers.items():
-			run_current = tmc_info['default_current']
-			current_helper = tmc_info['tmc_helper']
-			if current_helper :
-				print_time = self.toolhead.get_last_move_time()
-				c = list(current_helper.get_current())
-				req_hold_cur, max_cur = c[2], c[3] # Kalico now has 5 elements rather than 4 in tuple, so unpack just what we need...
-				new_cur = max(min(run_current, max_cur), 0)
-				current_helper.set_current(new_cur, req_hold_cur, print_time)
-			else :
-				self.gcode.run_script_from_command("SET_TMC_CURRENT STEPPER=%s CURRENT=%.2f" % (stepper, run_current))
-
-			msg.append("tmc : %s, idle_current : %.2f (default : %.2f)" % (stepper, run_current, tmc_info['default_current']))
-
+		msg = self._set_kin_currents(100., print_time, from_command)
+		self.motors_idle = False
 		self.woken_up = True
 		if self._is_debug_enabled():
 			self.ratos.console_echo(title, 'debug', '_N_'.join(msg))
 
+	def _handle_klippy_ready(self):
+		self.pause_resume = self.printer.lookup_object('pause_resume', None)
+		self.print_stats = self.printer.lookup_object('print_stats', None)
+		self._auto_idle_timer = self.reactor.register_timer(
+			self._handle_auto_idle, self.reactor.monotonic() + self.auto_idle_timeout)
+
+	def _handle_auto_idle(self, eventtime):
+		# Same inactivity test as idle_timeout: the toolhead has nothing queued
+		# and has been idle for auto_idle_timeout seconds, and no G-code runs
+		if self.motors_idle:
+			return self.reactor.NEVER
+		# A paused print keeps its position: don't lose the homed state
+		if self._is_print_active():
+			return eventtime + self.auto_idle_timeout
+		print_time, est_print_time, lookahead_empty = self.toolhead.check_busy(eventtime)
+		idle_time = est_print_time - print_time
+		if not lookahead_empty or idle_time < 1.:
+			return eventtime + self.auto_idle_timeout
+		if idle_time < self.auto_idle_timeout:
+			return eventtime + self.auto_idle_timeout - idle_time
+		if self.gcode.get_mutex().test():
+			return eventtime + 1.
+		logging.info("UBOE : No activity for %.0fs - idling motors." % (self.auto_idle_timeout,))
+		self._idle_motors(self.toolhead.get_last_move_time(), from_command=False)
+		return self.reactor.NEVER
+
+	def _is_print_active(self):
+		if self.pause_resume is not None and self.pause_resume.is_paused:
+			return True
+		return self.print_stats is not None and self.print_stats.state in ('printing', 'paused')
+
+	def _handle_sync_print_time(self, curtime, est_print_time, print_time):
+		# The toolhead resumes after being idle: its first move is queued at
+		# print_time, restore the currents right at that time
+		if self.motors_idle:
+			logging.info("UBOE : Motion queued - waking motors up.")
+			self._wake_up(print_time, from_command=False)
+		if self._auto_idle_timer is not None:
+			self.reactor.update_timer(self._auto_idle_timer, curtime + self.auto_idle_timeout)
+
+	cmd_idle_motors_help = "Idle the motors by reducing the current to a lower value specified by 'idle_motor_current'. This value should be  just enough to keep the z axis in place."
+	def cmd_idle_motors(self, gcmd):
+		self._idle_motors(self.toolhead.get_last_move_time())
+
+	cmd_wake_up_help = "Restore the motors to their default current values."
+	def cmd_wake_up(self, gcmd):
+		self._wake_up(self.toolhead.get_last_move_time())
+		if self.retained_state is not None:
+			self._restore_state(gcmd)
+
 	cmd_set_z_safeguards_help = "Set the Z-axis safeguards. This command allows you to configure the endstops provided through the 'z_safeguards' list to be set to the z rail."
 	def cmd_set_z_safeguards(self, gcmd):
 		self.kin.rails[2] = self.safeguard_rail
@@ -297,6 +488,7 @@ Iterate over multiple probe commands to analyze heatsoaking effects.
 '''
 	def cmd_HEATSOAK(self, gcmd):
 		from datetime import datetime
+		from statistics import pstdev
 		measured = {}
 		break_on_met_tol = False
 		stabilized_at = None
@@ -315,15 +507,17 @@ Iterate over multiple probe commands to analyze heatsoaking effects.
 			raise gcmd.error("Invalid ACTION parameter - must be 'analyze' or 'calibrate'")
 		tolerance = gcmd.get_float('TOLERANCE', 0.02, minval=0)
 		# First ensure temperature are under 40°C for the bed and 50°C for the nozzle
-		self.gcode.run_script_from_command("M106 S255") # Fan at full speed to help cooling down
-		self.gcode.run_script_from_command("M140 S40")
-		self.gcode.run_script_from_command("M104 S50")
-		self.gcode.run_script_from_command("M190 S40")
-		self.gcode.run_script_from_command("M109 S50")
-		self.gcode.run_script_from_command("M106 S0") # Fan off
-		# Home and level the machine
+		pheaters = self.printer.lookup_object('heaters')
+		extruder = pheaters.lookup_heater('extruder')
+		beds = self._set_bed_cooldown(40.)
+		pheaters.set_temperature(extruder, 50.)
+		# Homing does not depend on temperatures: home while cooling down
 		self.gcode.run_script_from_command("G28")
+		# Levelling does: level once the bed is close to its cooled down temperature
+		self._wait_cooldown([(bed, 40. + COOLDOWN_QGL_MARGIN) for bed in beds])
 		self.gcode.run_script_from_command("QUAD_GANTRY_LEVEL")
+		self._wait_cooldown([(bed, 40.) for bed in beds] + [(extruder, 50.)])
+		self.gcode.run_script_from_command("M106 S0") # Fan off
 		title = "Analyzing heatsoaking... (bed temp : %s°C, nozzle temp : %s°C)" % (bed_temp, nozzle_temp)
 		self.ratos.console_echo(title, 'info', None)
 		# Move to location
@@ -360,8 +554,7 @@ Iterate over multiple probe commands to analyze heatsoaking effects.
 				m3 = measured[str(i-2)]['measure']
 				m4 = measured[str(i-3)]['measure']
 				m5 = measured[str(i-4)]['measure']
-				from numpy import std
-				if std([m1, m2, m3, m4, m5]) <= tolerance:
+				if pstdev([m1, m2, m3, m4, m5]) <= tolerance:
 					stabilized_at = duration_seconds
 					if break_on_met_tol:
 						break
@@ -388,6 +581,66 @@ Iterate over multiple probe commands to analyze heatsoaking effects.
 			msg.append("Consider increasing the number of iterations or the tolerance.")
 		self.ratos.console_echo(title, 'info', ('_N_'.join(msg)))
 
+	def _set_bed_cooldown(self, temp):
+		"""
+		Set the bed target for the HEATSOAK cooldown and return the bed
+		heaters to watch: every pad when quad_pad_bed_heater drives the bed
+		(as its M140 does), else heater_bed alone.
+		"""
+		quad_pad = self.printer.lookup_object('quad_pad_bed_heater', None)
+		if quad_pad is not None:
+			quad_pad.set_pad_targets([temp] * len(quad_pad.pads))
+			return list(quad_pad.pads)
+		pheaters = self.printer.lookup_object('heaters')
+		bed = pheaters.lookup_heater('heater_bed')
+		pheaters.set_temperature(bed, temp)
+		return [bed]
+
+	def _wait_cooldown(self, limits):
+		"""
+		Wait until every (heater, max_temp) of limits is at or below its max
+		temperature. A single reactor timer watches all the heaters and adapts
+		the part fan speed to the remaining excess temperature and the cooling
+		rate. The command only wakes up when that timer reports a new fan
+		speed (sent from the command context) or the end of the cooldown.
+		"""
+		reactor = self.printer.get_reactor()
+		cooling = {'completion': reactor.completion(), 'fan_speed': None,
+				   'excess': None, 'done': False}
+		def check_temps(eventtime):
+			excess = max(heater.get_temp(eventtime)[0] - max_temp
+						 for heater, max_temp in limits)
+			if excess <= 0. or self.printer.is_shutdown():
+				cooling['done'] = True
+				cooling['completion'].complete(True)
+				return reactor.NEVER
+			speed = min(1., max(COOLDOWN_FAN_MIN, excess / COOLDOWN_FAN_BAND))
+			if cooling['excess'] is not None:
+				rate = (cooling['excess'] - excess) / COOLDOWN_CHECK_TIME
+				if rate < COOLDOWN_STALL_RATE:
+					speed = 1.
+			cooling['excess'] = excess
+			speed = round(speed / COOLDOWN_FAN_STEP) * COOLDOWN_FAN_STEP
+			if speed != cooling['fan_speed']:
+				cooling['fan_speed'] = speed
+				cooling['completion'].complete(True)
+			return eventtime + COOLDOWN_CHECK_TIME
+		timer = reactor.register_timer(check_temps, reactor.NOW)
+		fan_value = None
+		try:
+			while True:
+				cooling['completion'].wait()
+				if cooling['done']:
+					break
+				# Re-arm before reading the speed so that no change is missed
+				cooling['completion'] = reactor.completion()
+				value = int(round(cooling['fan_speed'] * 255.))
+				if value != fan_value:
+					self.gcode.run_script_from_command("M106 S%d" % (value,))
+					fan_value = value
+		finally:
+			reactor.unregister_timer(timer)
+
 	cmd_echo_uboe_tenor_help = "Echo UboeTenor configuration"
 	def cmd_echo_uboe_tenor(self, gcmd):
 		title = "UboeTenor configuration"
@@ -409,12 +662,7 @@ Iterate over multiple probe commands to analyze heatsoaking effects.
 		self.ratos.console_echo(title, 'info', ('_N_'.join(msg)))
 
 	def get_status(self, evnttime):
-		return {
-			"safeguard_state": self.safeguard_state,
-			"woken_up": self.woken_up,
-			"z_offset_probe_x_coord": self.z_offset_probe_x_coord,
-			"z_offset_probe_y_coord": self.z_offset_probe_y_coord,
-		}
+		return self.status.get()
 
 def load_config(config):
 	return UboeTenor(config)
\ No newline at end of file